@@ -2,9 +2,27 @@
 EDRN LabCAS to Croissant Converter Package
 """
 
+import importlib
+
 __version__ = "1.0.0"
 
-from .labcas_client import LabCASClient, get_jwt_token
-from .harvester import LabCASHarvester
+# Resolved on first attribute access, so importing the package stays cheap
+_LAZY = {
+    "LabCASClient": ".labcas_client",
+    "get_jwt_token": ".labcas_client",
+    "LabCASHarvester": ".harvester",
+}
 
 __all__ = ["LabCASClient", "get_jwt_token", "LabCASHarvester"]
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of harvest → manifest → Croissant → load against the
+local LabCAS stand-in (mock_labcas.py), at several multiples of the real
+collection size. No credentials or network access are needed.
+
+Stages:
+  harvest    LabCASHarvester.harvest_all over HTTP against the mock
+  manifest   build_manifest.main on the harvested metadata
+  croissant  generator.main on the manifest (requires mlcroissant)
+  load       iterate Croissant records and download/decode --load-pairs pairs
+             (requires mlcroissant, pydicom, torch)
+
+Usage:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --scales 1 10 --latency 0.005 --error-rate 0.01
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import instrumentation  # noqa: E402
+from mock_labcas import COLLECTION_ID, MockLabCAS  # noqa: E402
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="End-to-end pipeline benchmark against a local LabCAS mock")
+    p.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100],
+                   help="Collection sizes relative to the real collection")
+    p.add_argument("--latency", type=float, default=0.0, help="Mock per-request latency (s)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Mock 503 rate")
+    p.add_argument("--unauthorized-rate", type=float, default=0.0, help="Mock spurious 401 rate")
+    p.add_argument("--image-size", type=int, default=64, help="Synthetic DICOM rows/columns")
+    p.add_argument("--load-pairs", type=int, default=64, help="Pairs downloaded and decoded in the load stage")
+    p.add_argument("--stages", nargs="+", default=["harvest", "manifest", "croissant", "load"],
+                   choices=["harvest", "manifest", "croissant", "load"])
+    p.add_argument("--workdir", type=Path, default=None, help="Keep intermediate files here instead of a temp dir")
+    p.add_argument("--output", "-o", type=Path, default=Path("outputs/bench_pipeline.json"),
+                   help="Results JSON")
+    p.add_argument("--verbose", action="store_true", help="Show pipeline output instead of silencing it")
+    return p.parse_args(argv)
+
+
+class Stage:
+    """
+    Time one pipeline stage with stdout silenced unless --verbose. A failing
+    stage is recorded as an error (main() then exits non-zero) so that the
+    remaining stages and scales still run; a missing dependency is a skip.
+    """
+
+    def __init__(self, name: str, results: dict, verbose: bool):
+        self.name = name
+        self.results = results
+        self.verbose = verbose
+
+    def __enter__(self):
+        self._redirect = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+        self._redirect.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self._redirect.__exit__(None, None, None)
+        entry = {"seconds": round(elapsed, 4)}
+        if exc_type is not None and issubclass(exc_type, ImportError):
+            entry = {"skipped": f"missing dependency: {exc.name}"}
+        elif exc_type is not None:
+            entry["error"] = f"{exc_type.__name__}: {exc}"
+        self.results[self.name] = entry
+        status = entry.get("skipped") or entry.get("error") or f"{elapsed:8.2f}s"
+        print(f"  {self.name:<10} {status}")
+        return exc_type is not None and not issubclass(exc_type, KeyboardInterrupt)
+
+
+def run_scale(scale: float, args, workdir: Path) -> dict:
+    results = {"scale": scale, "stages": {}}
+    stages = results["stages"]
+    harvest_dir = workdir / "harvested_metadata"
+    manifest = workdir / "manifest.csv"
+    croissant = workdir / "croissant.json"
+
+    with MockLabCAS(scale, image_size=args.image_size, latency=args.latency, error_rate=args.error_rate,
+                    unauthorized_rate=args.unauthorized_rate) as mock:
+        coll = mock.collection
+        results["collection"] = {"patients": len(coll.patients), "variants_per_view": coll.variants,
+                                 "file_size": coll.file_size}
+        print(f"\nScale {scale:g}×: {len(coll.patients)} patients, {coll.variants} variant(s)/view  [{mock.base_url}]")
+
+        os.environ["LABCAS_USERNAME"] = os.environ["LABCAS_PASSWORD"] = "mock"
+        os.environ["LABCAS_BASE_URL"] = mock.base_url
+        instrumentation.reset()
+
+        if "harvest" in args.stages:
+            with Stage("harvest", stages, args.verbose):
+                from harvester import LabCASHarvester
+                from labcas_client import LabCASClient, get_jwt_token
+
+                client = LabCASClient(get_jwt_token("mock", "mock", mock.base_url), base_url=mock.base_url)
+                LabCASHarvester(client, harvest_dir).harvest_all(COLLECTION_ID)
+
+        if "manifest" in args.stages:
+            with Stage("manifest", stages, args.verbose):
+                import build_manifest
+
+                build_manifest.main([
+                    "-i", str(harvest_dir / "resources_by_dataset.jsonl"), "-o", str(manifest),
+                    "--diag", str(workdir / "manifest_diagnostics.json"),
+                    "--download-base", f"{mock.base_url}/data-access-api/download?id=",
+                ])
+            if manifest.exists():
+                results["pairs"] = sum(1 for _ in manifest.open()) - 1
+
+        if "croissant" in args.stages:
+            with Stage("croissant", stages, args.verbose):
+                import generator
+
+                generator.main(["-i", str(manifest), "-o", str(croissant)])
+
+        if "load" in args.stages:
+            with Stage("load", stages, args.verbose):
+                import mlcroissant as mlc
+                import mammogram_dataset
+
+                mammogram_dataset.LABCAS_BASE = mock.base_url
+                dataset = mlc.Dataset(jsonld=str(croissant))
+                n = 0
+                for record in dataset.records(record_set="mammograms"):
+                    if n >= args.load_pairs:
+                        break
+                    urls = [record["mammograms/proc_url"], record["mammograms/mask_url"]]
+                    for url in urls:
+                        mammogram_dataset.load_dicom_as_array(url.decode() if isinstance(url, bytes) else url)
+                    n += 1
+                stages["load_pairs"] = n
+
+        results["server"] = mock.stats
+        results["metrics"] = instrumentation.snapshot()["counters"]
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    instrumentation.enable()
+
+    run = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": {"latency": args.latency, "error_rate": args.error_rate,
+                 "unauthorized_rate": args.unauthorized_rate, "image_size": args.image_size},
+        "results": [],
+    }
+
+    for scale in args.scales:
+        if args.workdir:
+            workdir = args.workdir / f"scale_{scale:g}"
+            workdir.mkdir(parents=True, exist_ok=True)
+            run["results"].append(run_scale(scale, args, workdir))
+        else:
+            with tempfile.TemporaryDirectory(prefix="edrn_bench_") as tmp:
+                run["results"].append(run_scale(scale, args, Path(tmp)))
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(run, indent=2))
+
+    print(f"\n{'scale':>6} " + " ".join(f"{s:>10}" for s in args.stages))
+    for r in run["results"]:
+        cells = []
+        for s in args.stages:
+            entry = r["stages"].get(s, {})
+            cells.append(f"{entry['seconds']:>9.2f}s" if "seconds" in entry and "error" not in entry else f"{'—':>10}")
+        print(f"{r['scale']:>5g}× " + " ".join(cells))
+    print(f"\nResults written to: {args.output}")
+
+    failed = [(r["scale"], s, e["error"]) for r in run["results"] for s, e in r["stages"].items()
+              if isinstance(e, dict) and "error" in e]
+    if failed:
+        for scale, stage, error in failed:
+            print(f"✗ {scale:g}× {stage}: {error}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
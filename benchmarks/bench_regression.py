@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Regression benchmark for the manifest builder, the Croissant generator and
+Croissant record iteration, checked against tracked baselines.
+
+Synthetic resources_by_dataset.jsonl inputs with 10k, 100k and 1M files are
+built from the mock_labcas.py collection (same doc shape as LabCAS: PROC,
+MASK and RAW datasets per patient, suffix variants, half pairs) and cached
+under --workdir, together with the same catalog in the legacy
+resources_by_dataset.json layout for sizes up to 100k files. For each size
+the stages run in fresh interpreters:
+
+  manifest         build_manifest.main on the synthetic .jsonl input
+  manifest_legacy  build_manifest.main on the legacy .json input (up to 100k files)
+  croissant        generator.main on the .jsonl manifest (requires mlcroissant)
+  records          iterate every record of the generated Croissant (requires mlcroissant)
+
+Wall time is the median of --repeat runs and peak memory the largest
+peak RSS (ru_maxrss) of those runs; a stage that crashes or is killed,
+e.g. out of memory, is reported as an error. Results are compared with benchmarks/baselines.json
+and the script exits non-zero if any stage is slower or uses more memory
+than its baseline by more than the thresholds. --update-baseline records
+the current results as the new baselines instead. Baselines are only
+comparable on the machine they were recorded on.
+
+Usage:
+    python benchmarks/bench_regression.py
+    python benchmarks/bench_regression.py --sizes 10k 100k --time-threshold 0.5
+    python benchmarks/bench_regression.py --update-baseline
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from file_catalog import FileCatalog  # noqa: E402
+from mock_labcas import SyntheticCollection  # noqa: E402
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+STAGES = ("manifest", "manifest_legacy", "croissant", "records")
+LEGACY_MAX_FILES = 10**5         # the legacy .json is parsed in one piece; larger inputs only as .jsonl
+FILES_AT_SCALE_1 = 7319          # SyntheticCollection(1.0) file count
+MIN_DELTA_SECONDS = 0.05         # ignore time regressions smaller than this (timer noise)
+MIN_DELTA_MB = 1.0               # ignore memory regressions smaller than this
+
+
+def parse_size(text: str) -> int:
+    units = {"k": 10**3, "m": 10**6}
+    text = text.strip().lower()
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1] in units else int(text)
+
+
+def size_label(n: int) -> str:
+    for unit, div in (("M", 10**6), ("k", 10**3)):
+        if n >= div and n % div == 0:
+            return f"{n // div}{unit}"
+    return str(n)
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Regression benchmark for manifest/Croissant generation with baselines")
+    p.add_argument("--sizes", nargs="+", type=parse_size, default=[10**4, 10**5, 10**6],
+                   help="Synthetic input sizes in files (e.g. 10k 100k 1M)")
+    p.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    p.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (median is reported)")
+    p.add_argument("--workdir", type=Path, default=Path("outputs/bench_regression"),
+                   help="Synthetic inputs and stage outputs (inputs are reused across runs)")
+    p.add_argument("--baselines", type=Path, default=BASELINES, help="Baseline JSON")
+    p.add_argument("--time-threshold", type=float, default=0.25,
+                   help="Allowed relative wall-time increase over the baseline")
+    p.add_argument("--memory-threshold", type=float, default=0.15,
+                   help="Allowed relative peak-memory increase over the baseline")
+    p.add_argument("--update-baseline", action="store_true", help="Write the results as the new baselines")
+    p.add_argument("--output", "-o", type=Path, default=Path("outputs/bench_regression.json"),
+                   help="Results JSON")
+    p.add_argument("--run-stage", choices=STAGES, default=None, help=argparse.SUPPRESS)   # child process
+    p.add_argument("--make-input", type=int, default=None, help=argparse.SUPPRESS)        # child process
+    return p.parse_args(argv)
+
+
+# ---------- Synthetic input ----------
+
+def synthetic_input(n_files: int, path: Path) -> int:
+    """
+    Write a resources_by_dataset.jsonl with exactly `n_files` files, and
+    the legacy .json next to it up to LEGACY_MAX_FILES (unless cached), and
+    return the file count. Datasets are taken in collection order from a
+    synthetic collection just large enough.
+    """
+    info = path.with_name("input.json")
+    legacy = path.with_suffix(".json")
+    if path.exists() and info.exists() and (legacy.exists() or n_files > LEGACY_MAX_FILES):
+        return json.loads(info.read_text())["files"]
+
+    scale = n_files / FILES_AT_SCALE_1
+    while True:
+        coll = SyntheticCollection(scale)
+        if sum(len(coll.files_for_dataset(d["id"])) for d in coll.dataset_docs()) >= n_files:
+            break
+        scale *= 1.25
+
+    catalog = FileCatalog()
+    remaining = n_files
+    for d in coll.dataset_docs():
+        docs = coll.files_for_dataset(d["id"])[:remaining]
+        if docs:
+            catalog.add_dataset(d["id"], d, docs)
+            remaining -= len(docs)
+        if not remaining:
+            break
+    path.parent.mkdir(parents=True, exist_ok=True)
+    catalog.save(path)
+    if n_files <= LEGACY_MAX_FILES:
+        catalog.write_resources_json(legacy)
+    info.write_text(json.dumps({"files": n_files, "scale": scale}))
+    return n_files
+
+
+def prepare_input(n_files: int, workdir: Path) -> int:
+    """
+    synthetic_input() in a child process: a stage child's peak RSS starts
+    from its parent's, so the parent must never hold a large input itself.
+    """
+    subprocess.run([sys.executable, str(Path(__file__).resolve()), "--make-input", str(n_files),
+                    "--workdir", str(workdir)], check=True)
+    return json.loads((workdir / "input.json").read_text())["files"]
+
+
+# ---------- Stages ----------
+
+def _stage_fn(stage: str, workdir: Path):
+    resources = workdir / "resources_by_dataset.jsonl"
+    manifest = workdir / "manifest.csv"
+    croissant = workdir / "croissant.json"     # next to manifest.csv, which it references
+
+    if stage == "manifest":
+        import build_manifest
+        return lambda: build_manifest.main(["-i", str(resources), "-o", str(manifest),
+                                            "--diag", str(workdir / "manifest_diagnostics.json")])
+    if stage == "manifest_legacy":
+        import build_manifest
+        return lambda: build_manifest.main(["-i", str(resources.with_suffix(".json")),
+                                            "-o", str(workdir / "manifest_legacy.csv"),
+                                            "--diag", str(workdir / "manifest_legacy_diagnostics.json")])
+    if stage == "croissant":
+        import generator
+        import mlcroissant  # noqa: F401  (generator imports it lazily; keep that out of the timing)
+        return lambda: generator.main(["-i", str(manifest), "-o", str(croissant)])
+
+    import mlcroissant as mlc
+
+    def records():
+        n = 0
+        for _ in mlc.Dataset(jsonld=str(croissant)).records(record_set="mammograms"):
+            n += 1
+        return n
+    return records
+
+
+def _peak_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024      # KiB on Linux
+
+
+def run_stage(stage: str, workdir: Path) -> dict:
+    """Child process: run one stage once and report its wall time and peak RSS"""
+    fn = _stage_fn(stage, workdir)
+    before = _peak_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "peak_mb": _peak_mb(), "startup_mb": before}
+
+
+def measure(stage: str, workdir: Path, repeat: int) -> dict:
+    """Median wall time and largest peak RSS over `repeat` fresh-interpreter runs"""
+    runs = []
+    for _ in range(max(1, repeat)):
+        proc = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--run-stage", stage,
+                               "--workdir", str(workdir)], capture_output=True, text=True)
+        if proc.returncode != 0:
+            if proc.returncode < 0:
+                return {"error": f"killed by signal {-proc.returncode} (out of memory?)"}
+            last = (proc.stderr.strip().splitlines() or ["?"])[-1]
+            if last.startswith(("ModuleNotFoundError", "ImportError")):
+                return {"skipped": f"missing dependency: {last.split(':', 1)[-1].strip()}"}
+            return {"error": last}
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "seconds": round(statistics.median(r["seconds"] for r in runs), 4),
+        "peak_mb": round(max(r["peak_mb"] for r in runs), 1),
+        "startup_mb": round(max(r["startup_mb"] for r in runs), 1),
+    }
+
+
+def compare(result: dict, baseline: dict, args) -> list:
+    """Human-readable regressions of one stage result against its baseline"""
+    problems = []
+    slower = result["seconds"] - baseline["seconds"]
+    if slower > MIN_DELTA_SECONDS and result["seconds"] > baseline["seconds"] * (1 + args.time_threshold):
+        problems.append(f"wall time {baseline['seconds']:.3f}s → {result['seconds']:.3f}s "
+                        f"(+{100 * slower / baseline['seconds']:.0f}%)")
+    grown = result["peak_mb"] - baseline["peak_mb"]
+    if grown > MIN_DELTA_MB and result["peak_mb"] > baseline["peak_mb"] * (1 + args.memory_threshold):
+        problems.append(f"peak memory {baseline['peak_mb']:.1f} MB → {result['peak_mb']:.1f} MB "
+                        f"(+{100 * grown / baseline['peak_mb']:.0f}%)")
+    return problems
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, args.workdir)))
+        return
+    if args.make_input is not None:
+        synthetic_input(args.make_input, args.workdir / "resources_by_dataset.jsonl")
+        return
+    baselines = json.loads(args.baselines.read_text()) if args.baselines.exists() else {"results": {}}
+
+    results, regressions = {}, []
+    print(f"{'size':>6} {'stage':<15} {'wall':>9} {'peak':>10}  vs baseline")
+    for n in args.sizes:
+        label = size_label(n)
+        workdir = args.workdir / label
+        t0 = time.perf_counter()
+        files = prepare_input(n, workdir)
+        print(f"{label:>6} {'input':<15} {files} files ready ({time.perf_counter() - t0:.1f}s)")
+        results[label] = {"files": files}
+
+        for stage in args.stages:
+            if stage == "manifest_legacy" and files > LEGACY_MAX_FILES:
+                print(f"{label:>6} {stage:<15} legacy .json only up to {size_label(LEGACY_MAX_FILES)} files")
+                continue
+            entry = measure(stage, workdir, args.repeat)
+            base = baselines["results"].get(label, {}).get(stage)
+            if "seconds" not in entry:
+                results[label][stage] = entry
+                failed = entry.get("error")
+                if failed and base and "seconds" in base:
+                    regressions.append(f"{label} {stage}: {failed}")
+                print(f"{label:>6} {stage:<15} {'⚠ ' + failed if failed else entry['skipped']}")
+                continue
+            results[label][stage] = entry
+            if base is None or "seconds" not in base:
+                note = "no baseline"
+            else:
+                problems = compare(entry, base, args)
+                regressions += [f"{label} {stage}: {p}" for p in problems]
+                note = "⚠ " + "; ".join(problems) if problems else (
+                    f"✓ {entry['seconds'] / base['seconds']:.2f}× time, "
+                    f"{entry['peak_mb'] / max(base['peak_mb'], 1e-9):.2f}× memory")
+            print(f"{label:>6} {stage:<15} {entry['seconds']:>8.3f}s {entry['peak_mb']:>8.1f}MB  {note}")
+
+    run_info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(run_info, indent=2))
+    print(f"\nResults written to: {args.output}")
+
+    if args.update_baseline:
+        merged = baselines.get("results", {})
+        for label, stages in results.items():
+            merged.setdefault(label, {}).update(
+                {k: v for k, v in stages.items() if not isinstance(v, dict) or "seconds" in v})
+        args.baselines.write_text(json.dumps({**run_info, "results": merged}, indent=2) + "\n")
+        print(f"✓ Baselines updated: {args.baselines}")
+        return
+
+    if regressions:
+        print(f"\n✗ {len(regressions)} regression(s) beyond +{100 * args.time_threshold:.0f}% time / "
+              f"+{100 * args.memory_threshold:.0f}% memory:")
+        for r in regressions:
+            print(f"  {r}")
+        sys.exit(1)
+    print("✓ No regressions against the baselines")
+
+
+if __name__ == "__main__":
+    main()
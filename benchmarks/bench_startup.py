@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the CLI entry points.
+
+Runs `python cli.py <command> --help` in fresh interpreters and reports the
+median wall time, the total import time from `-X importtime`, and which
+heavy third-party packages each command pulled in. A bare interpreter and
+the heavy packages themselves are measured as reference points.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --commands manifest generate
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cli import COMMANDS  # noqa: E402
+
+HEAVY = ("requests", "mlcroissant", "torch", "numpy", "pydicom", "pandas")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Measure CLI startup and import cost per subcommand")
+    p.add_argument("--commands", nargs="+", default=list(COMMANDS), choices=list(COMMANDS))
+    p.add_argument("--repeat", type=int, default=5, help="Runs per command (median is reported)")
+    p.add_argument("--output", "-o", type=Path, default=Path("outputs/bench_startup.json"),
+                   help="Results JSON")
+    return p.parse_args(argv)
+
+
+def run(cmd, repeat: int) -> dict:
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        walls.append(time.perf_counter() - start)
+
+    # One extra run with -X importtime: "import time: self | cumulative | module" on stderr
+    proc = subprocess.run([cmd[0], "-X", "importtime"] + cmd[1:], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imported, total_us = set(), 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _cumulative, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue                              # header line
+        total_us += int(self_us)
+        imported.add(module.strip().split(".")[0])
+    return {
+        "wall_seconds": round(statistics.median(walls), 4),
+        "import_seconds": round(total_us / 1e6, 4),
+        "heavy_imports": [m for m in HEAVY if m in imported],
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    py = sys.executable
+
+    results = {"baseline": {"python": run([py, "-c", "pass"], args.repeat)}}
+    for mod in HEAVY:
+        probe = subprocess.run([py, "-c", f"import {mod}"], capture_output=True)
+        if probe.returncode == 0:
+            results["baseline"][f"import {mod}"] = run([py, "-c", f"import {mod}"], args.repeat)
+
+    results["commands"] = {}
+    for name in args.commands:
+        results["commands"][name] = run([py, "cli.py", name, "--help"], args.repeat)
+
+    run_info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(run_info, indent=2))
+
+    print(f"{'':<24} {'wall':>8} {'imports':>8}  heavy packages loaded")
+    for group in ("baseline", "commands"):
+        for label, r in results[group].items():
+            label = label if group == "baseline" else f"cli.py {label} --help"
+            print(f"{label:<24} {r['wall_seconds']:>7.3f}s {r['import_seconds']:>7.3f}s  "
+                  f"{', '.join(r['heavy_imports']) or '—'}")
+    print(f"\nResults written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
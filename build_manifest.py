@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """
-Process harvested metadata (resources_by_dataset.json) to produce a STRICT CSV manifest.
+Process harvested metadata (the harvester's resources_by_dataset.jsonl
+catalog, or the legacy resources_by_dataset.json when there is no .jsonl)
+to produce a STRICT CSV manifest.
 Logic:
   1. Only allow views: LCC, LMLO, RCC, RMLO.
   2. STRICTLY REJECT any file with a numeric suffix (e.g. _2.dcm).
@@ -18,6 +20,10 @@ import argparse
 from pathlib import Path
 from collections import defaultdict
 
+from dataset_hierarchy import HIERARCHY_FILE, DatasetHierarchy
+from file_catalog import FileCatalog
+from instrumentation import incr, span, timed
+
 # Regex: capture patient (C or N + 3-4 digits), view made of letters (no digits),
 # optional numeric suffix like _2, _3, etc, before ".dcm"
 FILENAME_RE = re.compile(
@@ -27,19 +33,24 @@ FILENAME_RE = re.compile(
 
 ALLOWED_VIEWS = {"LCC", "LMLO", "RCC", "RMLO"}
 
-INPUT_FILE = Path("harvested_metadata/resources_by_dataset.json")
+INPUT_FILE = Path("harvested_metadata/resources_by_dataset.jsonl")
 DEFAULT_OUTPUT = Path("manifest.csv")
 DIAG_OUTPUT = Path("manifest_diagnostics.json")
 
 BASE_URL = "https://edrn-labcas.jpl.nasa.gov/data-access-api/download?id="
 
 
-def parse_args():
+def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Clean manifest selecting preferred files per patient+view")
-    p.add_argument("--input", "-i", type=Path, default=INPUT_FILE, help="Input harvested metadata JSON")
+    p.add_argument("--input", "-i", type=Path, default=INPUT_FILE, help="Harvested catalog (.jsonl, or legacy .json)")
     p.add_argument("--output", "-o", type=Path, default=DEFAULT_OUTPUT, help="Output CSV manifest")
     p.add_argument("--diag", type=Path, default=DIAG_OUTPUT, help="Diagnostics JSON file")
-    return p.parse_args()
+    p.add_argument("--hierarchy", type=Path, default=None,
+                   help=f"Dataset hierarchy index (default: {HIERARCHY_FILE} next to the input, if present)")
+    p.add_argument("--integrity", type=Path, default=None,
+                   help="integrity.jsonl from integrity.py; adds size/checksum/duplicate results to diagnostics")
+    p.add_argument("--download-base", default=BASE_URL, help="Prefix prepended to file IDs to form download URLs")
+    return p.parse_args(argv)
 
 
 def extract_from_path(path_str):
@@ -74,7 +85,7 @@ def get_dataset_type(meta, dataset_id):
 
 def select_best_candidate(candidates):
     """
-    candidates: list of dict entries (file metadata)
+    candidates: list of file entries (FileRecord or legacy dict)
     selection policy:
       - Only pick candidate with suffix None (no numeric suffix like _2).
       - If multiple exist (unlikely given naming convention), pick first or sort by file_id.
@@ -110,6 +121,26 @@ def select_best_candidate(candidates):
     return chosen["row"], {"reason": "clean_file_selected"}
 
 
+def integrity_report(chosen, candidates, records):
+    """
+    Integrity of the chosen file plus how the other candidates (suffix
+    variants) relate to it, from already-computed hashes.
+    """
+    rec = records.get(chosen["file_id"])
+    if rec is None:
+        return {"status": "unverified"}
+    report = {k: rec.get(k) for k in ("status", "sha256", "size", "expected_size")}
+    identical, distinct = [], []
+    for c in candidates:
+        other = records.get(c["file_id"])
+        if c["file_id"] == chosen["file_id"] or not other or not other.get("sha256"):
+            continue
+        (identical if other["sha256"] == rec.get("sha256") else distinct).append(c["file_id"])
+    report["identical_variants"] = identical
+    report["distinct_variants"] = distinct
+    return report
+
+
 def _get_name(file_entry):
     """Extract the file name string from a file metadata entry."""
     raw = file_entry.get("name", "")
@@ -118,13 +149,17 @@ def _get_name(file_entry):
     return str(raw)
 
 
-def main():
-    args = parse_args()
+@timed("build_manifest_seconds")
+def main(argv=None):
+    args = parse_args(argv)
+    args.input = FileCatalog.resolve(args.input)
     if not args.input.exists():
         raise SystemExit(f"Input file not found: {args.input}")
 
     print(f"Loading {args.input}...")
-    data = json.loads(args.input.read_text())
+    with span("build_manifest_load_seconds"):
+        # Only the file columns are used; skip keeping (deflating) every Solr doc
+        catalog = FileCatalog.open(args.input, keep_metadata=False)
     
     # Groups: (Patient, View) -> {'proc': [], 'mask': []}
     groups = defaultdict(lambda: {'proc': [], 'mask': []})
@@ -133,19 +168,32 @@ def main():
     skipped_files = 0
     skipped_views = 0
 
-    print(f"Processing {len(data)} datasets...")
+    hierarchy_path = args.hierarchy or args.input.parent / HIERARCHY_FILE
+    hierarchy = DatasetHierarchy.load(hierarchy_path) if hierarchy_path.exists() else None
+    if hierarchy is not None:
+        print(f"Using dataset hierarchy: {hierarchy_path}")
+    
+    records = None
+    if args.integrity:
+        from integrity import load_index   # pulls in the HTTP stack; only needed here
+        records = load_index(args.integrity)
+        print(f"Using integrity index: {args.integrity} ({len(records)} files)")
+    
+    print(f"Processing {len(catalog)} datasets...")
     
-    for dataset_id, payload in data.items():
-        meta = payload.get("dataset_metadata", {})
-        ds_type = get_dataset_type(meta, dataset_id)
+    for dataset_id, meta, files in catalog.iter_datasets():
+        if hierarchy is not None and dataset_id in hierarchy:
+            kind = hierarchy.kind(dataset_id)
+            ds_type = kind if kind in ("PROC", "MASK") else None
+        else:
+            ds_type = get_dataset_type(meta, dataset_id)
         
         if not ds_type:
             continue
             
-        files = payload.get("files", [])
         for f in files:
             total_files += 1
-            file_id = f.get("file_id")
+            file_id = f.file_id
             if not file_id:
                 continue
                 
@@ -201,8 +249,8 @@ def main():
                 "group": group,
                 "patient_id": patient,
                 "view": view,
-                "proc_url": BASE_URL + best_proc["file_id"],
-                "mask_url": BASE_URL + best_mask["file_id"],
+                "proc_url": args.download_base + best_proc["file_id"],
+                "mask_url": args.download_base + best_mask["file_id"],
                 "proc_name": _get_name(best_proc),
                 "mask_name": _get_name(best_mask),
             })
@@ -212,6 +260,10 @@ def main():
                 "proc_candidates_count": len(proc_list),
                 "mask_candidates_count": len(mask_list)
             }
+            if records is not None:
+                decision = diagnostics["decisions"][key_str]
+                decision["proc_integrity"] = integrity_report(best_proc, proc_list, records)
+                decision["mask_integrity"] = integrity_report(best_mask, mask_list, records)
         else:
             diagnostics["half_pairs"].append({
                 "group": key_str,
@@ -221,6 +273,23 @@ def main():
                 "mask_candidates": len(mask_list)
             })
 
+    if records is not None:
+        summary = {"verified": 0, "unverified": 0, "failed": [], "identical_variants": 0, "distinct_variants": 0}
+        for key_str, decision in diagnostics["decisions"].items():
+            for side in ("proc_integrity", "mask_integrity"):
+                rep = decision[side]
+                if rep["status"] == "unverified":
+                    summary["unverified"] += 1
+                    continue
+                summary["verified"] += 1
+                if rep["status"] != "ok":
+                    summary["failed"].append({"group": key_str, "side": side.split("_")[0], "status": rep["status"]})
+                summary["identical_variants"] += len(rep["identical_variants"])
+                summary["distinct_variants"] += len(rep["distinct_variants"])
+        diagnostics["integrity"] = summary
+        print(f"Integrity: {summary['verified']} verified, {len(summary['failed'])} failed, "
+              f"{summary['unverified']} unverified, {summary['identical_variants']} identical variants")
+
     # Write CSV manifest
     fieldnames = ["group", "patient_id", "view", "proc_url", "mask_url", "proc_name", "mask_name"]
     with open(args.output, "w", newline="", encoding="utf-8") as f:
@@ -231,6 +300,8 @@ def main():
     # Write diagnostics
     args.diag.write_text(json.dumps(diagnostics, indent=2))
 
+    incr("build_manifest_files_scanned_total", total_files)
+    incr("build_manifest_pairs_total", len(rows))
     print(f"Pairs created: {len(rows)}")
     print(f"CSV manifest written to: {args.output}")
     print(f"Diagnostics written to: {args.diag}")
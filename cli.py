@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Single entry point for the pipeline, with lazily loaded subcommands.
+
+Each subcommand lives in its own module and is imported only when it is
+run, so e.g. `python cli.py manifest --help` never loads requests,
+mlcroissant or torch.
+
+Usage:
+    python cli.py harvest [--all-collections --match '*Breast*']
+    python cli.py select --patient C0250 --manifest manifest_mini.csv
+    python cli.py manifest
+    python cli.py split
+    python cli.py stats --manifest manifest.csv
+    python cli.py shards --split train
+    python cli.py generate -i manifest.csv -o outputs/croissant.json
+    python cli.py prefetch --manifest manifest.csv
+    python cli.py snapshot --croissant outputs/croissant.json
+    python cli.py validate outputs/croissant.json
+"""
+
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+# name → (module, function, summary); modules are imported on dispatch only
+COMMANDS = {
+    "harvest": ("harvest_metadata", "main", "Harvest LabCAS metadata (one or many collections)"),
+    "select": ("harvest_selected", "main", "Targeted harvest of selected patients/groups/views"),
+    "manifest": ("build_manifest", "main", "Build manifest.csv from harvested metadata"),
+    "split": ("split_manifest", "main", "Patient-grouped train/val/test split of a manifest"),
+    "stats": ("pair_stats", "main", "Per-pair image statistics sidecar for normalisation and sampling"),
+    "shards": ("shards", "main", "Pack manifest pairs into tar shards for sequential reads"),
+    "generate": ("generator", "main", "Generate Croissant 1.0 metadata from a manifest"),
+    "prefetch": ("integrity", "main", "Download, verify and deduplicate DICOMs into the local store"),
+    "snapshot": ("snapshot", "main", "Pin a Croissant dataset to a local, checksummed snapshot"),
+    "validate": ("cli", "validate", "Validate Croissant JSON-LD with mlcroissant"),
+}
+
+
+def validate(argv=None):
+    p = argparse.ArgumentParser(description="Validate Croissant JSON-LD with mlcroissant")
+    p.add_argument("jsonld", type=Path, nargs="?", default=Path("outputs/croissant.json"),
+                   help="Croissant metadata file")
+    p.add_argument("--records", type=int, default=0,
+                   help="Also materialise this many records from each record set")
+    args = p.parse_args(argv)
+
+    import mlcroissant as mlc
+
+    try:
+        dataset = mlc.Dataset(jsonld=str(args.jsonld))
+    except mlc.ValidationError as e:
+        print(f"✗ {args.jsonld} is not valid Croissant:\n{e}")
+        sys.exit(1)
+    for warning in sorted(dataset.metadata.ctx.issues.warnings):
+        print(f"⚠ {warning}")
+    for record_set in dataset.metadata.record_sets if args.records else []:
+        n = 0
+        try:
+            for n, _ in enumerate(dataset.records(record_set=record_set.uuid), 1):
+                if n >= args.records:
+                    break
+        except Exception as e:
+            print(f"✗ {record_set.uuid}: failed after {n} record(s): {type(e).__name__}: {e}")
+            sys.exit(1)
+        print(f"✓ {record_set.uuid}: read {n} record(s)")
+    print(f"✓ {args.jsonld} is valid Croissant")
+
+
+def usage() -> str:
+    lines = ["usage: cli.py <command> [options]", "", "commands:"]
+    lines += [f"  {name:<10} {summary}" for name, (_, _, summary) in COMMANDS.items()]
+    lines += ["", "Run 'cli.py <command> --help' for the options of a command."]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    name, rest = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"Unknown command: {name}\n\n{usage()}", file=sys.stderr)
+        sys.exit(2)
+
+    module_name, func_name, _ = COMMANDS[name]
+    module = sys.modules[__name__] if module_name == "cli" else importlib.import_module(module_name)
+    # Subcommand help then reads "cli.py <command> ..."
+    sys.argv[0] = f"{os.path.basename(sys.argv[0])} {name}"
+    return getattr(module, func_name)(rest)
+
+
+if __name__ == "__main__":
+    main()
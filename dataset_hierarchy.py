@@ -0,0 +1,249 @@
+"""
+Dataset hierarchy index for a LabCAS collection.
+
+Built in one pass over the datasets.json docs. Keeps, per dataset, its
+parent, depth, leaf status, kind (RAW / PROC / MASK / Documentation) and
+patient ID, with a parent → children adjacency list. Persisted next to the
+harvested metadata as dataset_hierarchy.json and queryable, e.g.:
+
+    h = DatasetHierarchy.load("harvested_metadata/dataset_hierarchy.json")
+    h.leaves(kind="MASK", patients=["C0250"])
+"""
+
+import json
+import re
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+LEAF_KINDS = ("RAW", "PROC", "MASK", "Documentation")
+PATIENT_RE = re.compile(r"^[CN]\d{3,4}$", re.IGNORECASE)
+
+HIERARCHY_FILE = "dataset_hierarchy.json"
+
+
+def get_dataset_id(d: Dict) -> Optional[str]:
+    if isinstance(d.get("id"), str) and d["id"].strip():
+        return d["id"].strip()
+    dv = d.get("DatasetId")
+    if isinstance(dv, (list, tuple)) and dv:
+        return str(dv[0]).strip()
+    return None
+
+
+def get_parent_id(d: Dict) -> Optional[str]:
+    for key in ("ParentDatasetId", "DatasetParentId", "DatasetParent"):
+        val = d.get(key)
+        if isinstance(val, (list, tuple)) and val:
+            return str(val[0]).strip()
+        if isinstance(val, str) and val.strip():
+            return val.strip()
+    return None
+
+
+def extract_names(val) -> List[str]:
+    if val is None:
+        return []
+    if isinstance(val, (list, tuple, set)):
+        return [str(x).strip() for x in val if str(x).strip()]
+    s = str(val).strip()
+    return [s] if s else []
+
+
+def classify(d: Dict, dataset_id: str) -> Optional[str]:
+    """Leaf kind from the dataset name, falling back to the last ID segment"""
+    for nm in extract_names(d.get("DatasetName") or d.get("name") or d.get("labcasName")):
+        if nm in LEAF_KINDS:
+            return nm
+    tail = dataset_id.rsplit("/", 1)[-1]
+    return tail if tail in LEAF_KINDS else None
+
+
+def _patient_from_id(dataset_id: str) -> Optional[str]:
+    for seg in dataset_id.split("/"):
+        if PATIENT_RE.match(seg):
+            return seg.upper()
+    return None
+
+
+class DatasetHierarchy:
+    """Column-oriented index of a collection's dataset tree"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.parent_ids: List[Optional[str]] = []
+        self.kinds: List[Optional[str]] = []
+        self.patients: List[Optional[str]] = []
+        self.docs: Optional[List[Dict]] = None
+        # Derived by _link()
+        self.parent = array("i")
+        self.depth = array("i")
+        self.children: Dict[int, List[int]] = {}
+        self.is_leaf: List[bool] = []
+
+    # ---------- Building ----------
+
+    @classmethod
+    def build(cls, datasets: Iterable[Dict]) -> "DatasetHierarchy":
+        h = cls()
+        h.docs = []
+        for d in datasets:
+            did = get_dataset_id(d)
+            if not did or did in h.index:
+                continue
+            h.index[did] = len(h.ids)
+            h.ids.append(sys.intern(did))
+            h.parent_ids.append(get_parent_id(d))
+            h.kinds.append(classify(d, did))
+            h.patients.append(_patient_from_id(did))
+            h.docs.append(d)
+        h._link()
+        return h
+
+    def _link(self):
+        """Resolve parent indices, children adjacency, depth and leaf flags"""
+        n = len(self.ids)
+        referenced = set()
+        self.parent = array("i", [-1]) * n
+        self.children = {}
+        for i, pid in enumerate(self.parent_ids):
+            if not pid:
+                continue
+            # A parent ID counts even if the parent doc itself was not harvested
+            referenced.add(pid)
+            p = self.index.get(pid)
+            if p is not None and p != i:
+                self.parent[i] = p
+                self.children.setdefault(p, []).append(i)
+        self.is_leaf = [did not in referenced for did in self.ids]
+
+        # Depth by walking up to the first node with a known depth (cycle-safe)
+        self.depth = array("i", [-1]) * n
+        for i in range(n):
+            path, j = [], i
+            while j != -1 and self.depth[j] == -1 and j not in path:
+                path.append(j)
+                j = self.parent[j]
+            base = self.depth[j] if j != -1 and self.depth[j] != -1 else -1
+            for k in reversed(path):
+                base += 1
+                self.depth[k] = base
+
+        # Patients inherit from the nearest ancestor that names one
+        for i in range(n):
+            if self.patients[i] is None:
+                j, seen = self.parent[i], 0
+                while j != -1 and self.patients[j] is None and seen < n:
+                    j, seen = self.parent[j], seen + 1
+                if j != -1:
+                    self.patients[i] = self.patients[j]
+
+    # ---------- Persistence ----------
+
+    def save(self, path: Path):
+        data = {
+            "version": 1,
+            "ids": self.ids,
+            "parent_ids": self.parent_ids,
+            "kinds": self.kinds,
+            "patients": self.patients,
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: Path, datasets: Optional[List[Dict]] = None) -> "DatasetHierarchy":
+        """Load a saved index; pass the datasets.json docs to make leaf_docs() available"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        h = cls()
+        h.ids = [sys.intern(i) for i in data["ids"]]
+        h.index = {did: i for i, did in enumerate(h.ids)}
+        h.parent_ids = data["parent_ids"]
+        h.kinds = data["kinds"]
+        h.patients = data["patients"]
+        if datasets is not None:
+            by_id = {get_dataset_id(d): d for d in datasets}
+            h.docs = [by_id.get(did, {"id": did}) for did in h.ids]
+        h._link()
+        return h
+
+    # ---------- Queries ----------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, dataset_id: str) -> bool:
+        return dataset_id in self.index
+
+    def kind(self, dataset_id: str) -> Optional[str]:
+        i = self.index.get(dataset_id)
+        return None if i is None else self.kinds[i]
+
+    def patient(self, dataset_id: str) -> Optional[str]:
+        i = self.index.get(dataset_id)
+        return None if i is None else self.patients[i]
+
+    def children_of(self, dataset_id: str) -> List[str]:
+        return [self.ids[c] for c in self.children.get(self.index[dataset_id], [])]
+
+    def parent_of(self, dataset_id: str) -> Optional[str]:
+        p = self.parent[self.index[dataset_id]]
+        return None if p == -1 else self.ids[p]
+
+    def depth_of(self, dataset_id: str) -> int:
+        return self.depth[self.index[dataset_id]]
+
+    def descendants(self, dataset_id: str) -> List[str]:
+        out, stack = [], list(self.children.get(self.index[dataset_id], []))
+        while stack:
+            i = stack.pop()
+            out.append(self.ids[i])
+            stack.extend(self.children.get(i, []))
+        return out
+
+    def leaves(self, kind=None, patients: Optional[Iterable[str]] = None,
+               under: Optional[str] = None) -> List[str]:
+        """
+        Leaf dataset IDs, optionally restricted to kind(s), patient IDs and
+        the subtree rooted at `under` (a dataset ID)
+        """
+        kinds = {kind} if isinstance(kind, str) else set(kind) if kind else None
+        wanted = {p.upper() for p in patients} if patients else None
+        if under is not None:
+            root = self.index.get(under)
+            if root is None:
+                return []
+            candidates, stack = [], [root]
+            while stack:
+                i = stack.pop()
+                candidates.append(i)
+                stack.extend(self.children.get(i, []))
+            candidates.sort()
+        else:
+            candidates = range(len(self.ids))
+        return [
+            self.ids[i] for i in candidates
+            if self.is_leaf[i]
+            and (kinds is None or self.kinds[i] in kinds)
+            and (wanted is None or self.patients[i] in wanted)
+        ]
+
+    def leaf_docs(self, **filters) -> List[Dict]:
+        if self.docs is None:
+            raise ValueError("Dataset docs not attached; load with datasets=...")
+        return [self.docs[self.index[did]] for did in self.leaves(**filters)]
+
+    def counts(self) -> Dict[str, int]:
+        """Leaf counts per kind, plus totals"""
+        out = {k: 0 for k in LEAF_KINDS}
+        n_leaf = 0
+        for i, leaf in enumerate(self.is_leaf):
+            if leaf:
+                n_leaf += 1
+                if self.kinds[i] in out:
+                    out[self.kinds[i]] += 1
+        out.update(total=len(self.ids), leaves=n_leaf, non_leaves=len(self.ids) - n_leaf)
+        return out
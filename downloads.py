@@ -0,0 +1,160 @@
+"""
+Chunked, resumable streaming downloads from LabCAS with bounded memory.
+
+The response body is copied chunk by chunk into a file object: a
+SpooledTemporaryFile (kept in RAM up to SPOOL_MAX_BYTES, then spilled to
+disk) or a buffer supplied by the caller. If the connection drops mid-body,
+the download resumes from the last byte written with an HTTP Range request
+instead of starting over. At most one chunk plus the spool threshold is
+held in memory per download, so many can run in parallel.
+
+The file object is handed back rewound, so it can go straight to
+pydicom.dcmread without another copy:
+
+    with download(url) as f:
+        ds = pydicom.dcmread(f)
+
+Local paths (and file:// URLs), e.g. the rows of a snapshot manifest
+(snapshot.py), are read from disk instead, through the same calls.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import BinaryIO, Optional, Tuple
+
+import requests
+
+from instrumentation import incr, span
+from token_manager import TokenProvider, get_token_provider
+
+CHUNK_SIZE = 1 << 20                                                   # 1 MiB
+SPOOL_MAX_BYTES = int(os.getenv("EDRN_SPOOL_MAX_BYTES", 32 << 20))     # in RAM below this, on disk above
+MAX_RESUMES = 5
+
+_RESUMABLE = (requests.exceptions.ChunkedEncodingError, requests.exceptions.ConnectionError,
+              requests.exceptions.Timeout)
+
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    """Keep-alive session per thread (and per process, after fork)"""
+    session = getattr(_local, "session", None)
+    if session is None or _local.pid != os.getpid():
+        session = _local.session = requests.Session()
+        _local.pid = os.getpid()
+    return session
+
+
+def _base_url(url: str) -> str:
+    return url.split("/data-access-api/", 1)[0]
+
+
+def local_path(url: str) -> Optional[str]:
+    """Filesystem path for a local path or file:// URL, None for a remote URL"""
+    if url.startswith("file://"):
+        return url[len("file://"):]
+    return None if "://" in url else url
+
+
+def download_to(url: str, out: BinaryIO, tokens: Optional[TokenProvider] = None,
+                session: Optional[requests.Session] = None, chunk_size: int = CHUNK_SIZE,
+                max_resumes: int = MAX_RESUMES, hash_name: Optional[str] = None,
+                timeout: float = 120) -> Tuple[int, Optional[str]]:
+    """
+    Stream `url` into the writable file object `out` (from its current
+    position). Returns (bytes written, hex digest if `hash_name` is given);
+    the digest is computed as the chunks arrive.
+    """
+    path = local_path(url)
+    if path is not None:
+        written = 0
+        digest = hashlib.new(hash_name) if hash_name else None
+        with open(path, "rb") as src:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                out.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                written += len(chunk)
+        return written, (digest.hexdigest() if digest is not None else None)
+
+    tokens = tokens or get_token_provider(_base_url(url))
+    session = session or get_session()
+    start = out.tell()
+    written = 0
+    digest = hashlib.new(hash_name) if hash_name else None
+    resumes = 0
+    refreshed = False
+
+    while True:
+        token = tokens.token
+        headers = {"Authorization": f"Bearer {token}"}
+        if written:
+            headers["Range"] = f"bytes={written}-"
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=timeout) as resp:
+                if resp.status_code == 401 and not refreshed:     # token revoked early – refresh once
+                    incr("dicom_download_retries_total", reason="401")
+                    tokens.refresh(stale_token=token)
+                    refreshed = True
+                    continue
+                resp.raise_for_status()
+                if written and resp.status_code != 206:
+                    # Server ignored the Range header: start over
+                    incr("dicom_download_retries_total", reason="range_ignored")
+                    out.seek(start)
+                    out.truncate()
+                    written = 0
+                    digest = hashlib.new(hash_name) if hash_name else None
+                received = 0
+                for chunk in resp.iter_content(chunk_size):
+                    out.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    written += len(chunk)
+                    received += len(chunk)
+                # Guard against a short body on clients that do not enforce Content-Length
+                length = resp.headers.get("Content-Length")
+                if length is not None and not resp.headers.get("Content-Encoding") and received != int(length):
+                    raise requests.exceptions.ChunkedEncodingError(
+                        f"Connection closed after {received} of {length} bytes")
+            break
+        except _RESUMABLE as e:
+            if resumes >= max_resumes:
+                raise
+            resumes += 1
+            incr("dicom_download_resumes_total")
+            print(f"⚠ Download interrupted at byte {written} ({type(e).__name__}); resuming...")
+
+    incr("dicom_download_bytes_total", written)
+    return written, (digest.hexdigest() if digest is not None else None)
+
+
+def download(url: str, buffer: Optional[BinaryIO] = None, spool_max_bytes: int = SPOOL_MAX_BYTES,
+             **kwargs) -> BinaryIO:
+    """
+    Download `url` into `buffer` (emptied first) or a new spooled temporary
+    file, and return it rewound to the start. A local file is opened
+    directly when no buffer is given.
+    """
+    path = local_path(url)
+    if path is not None and buffer is None:
+        incr("dicom_local_reads_total")
+        return open(path, "rb")
+    out = buffer
+    if out is None:
+        out = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    else:
+        out.seek(0)
+        out.truncate()
+    try:
+        with span("dicom_download_seconds"):
+            download_to(url, out, **kwargs)
+    except BaseException:
+        if buffer is None:
+            out.close()
+        raise
+    out.seek(0)
+    return out
@@ -0,0 +1,386 @@
+"""
+Compact in-memory catalog of harvested LabCAS files.
+
+Replaces the per-file dicts of resources_by_dataset.json with a
+structure-of-arrays layout:
+  - dataset IDs are stored once and referenced by index,
+  - sizes and file-type codes live in typed arrays,
+  - download URLs are derived from the file ID on access,
+  - file IDs of the usual `<dataset_id>/<name>` form are not stored at all,
+  - each Solr doc is kept as raw-deflated JSON, primed with a preset
+    dictionary (the first doc seen) since sibling docs share nearly all of
+    their keys and values, and only decoded when a caller asks for
+    `.metadata`. Readers that only need the columns above (the manifest
+    builder, integrity checks) pass keep_metadata=False to skip this.
+
+On disk the catalog is JSON Lines (one dataset per line), so the harvester
+can append after each dataset instead of rewriting the whole file. The
+legacy resources_by_dataset.json layout can be read and (streamed) written
+for compatibility.
+"""
+
+import json
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BASE_URL = "https://edrn-labcas.jpl.nasa.gov"
+
+_LEGACY_KEYS = ("file_id", "name", "file_type", "file_size", "dataset_id", "download_url", "metadata")
+
+
+def _first(val):
+    if isinstance(val, (list, tuple)):
+        return val[0] if val else None
+    return val
+
+
+def _to_size(val) -> int:
+    try:
+        return int(_first(val))
+    except (TypeError, ValueError):
+        return -1
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _truncate_torn_tail(f, chunk: int = 1 << 16):
+    """Truncate a file opened "ab+" back to just after its last newline"""
+    end = f.seek(0, 2)
+    if end == 0:
+        return
+    f.seek(end - 1)
+    if f.read(1) == b"\n":
+        return
+    pos = end
+    while pos > 0:
+        start = max(0, pos - chunk)
+        f.seek(start)
+        block = f.read(pos - start)
+        nl = block.rfind(b"\n")
+        if nl >= 0:
+            pos = start + nl + 1
+            break
+        pos = start
+    if pos != end:
+        f.truncate(pos)
+
+
+class FileRecord:
+    """Lightweight view of one catalog row; behaves like the legacy file dict for `.get`."""
+
+    __slots__ = ("_catalog", "_idx")
+
+    def __init__(self, catalog: "FileCatalog", idx: int):
+        self._catalog = catalog
+        self._idx = idx
+
+    @property
+    def file_id(self) -> str:
+        fid = self._catalog._file_ids[self._idx]
+        if fid is None:
+            return f"{self.dataset_id}/{self.name}"
+        return fid
+
+    @property
+    def name(self) -> str:
+        return self._catalog._names[self._idx]
+
+    @property
+    def file_type(self) -> Optional[str]:
+        return self._catalog._types[self._catalog._file_type[self._idx]]
+
+    @property
+    def file_size(self) -> Optional[int]:
+        size = self._catalog._sizes[self._idx]
+        return None if size < 0 else size
+
+    @property
+    def dataset_id(self) -> str:
+        return self._catalog._dataset_ids[self._catalog._file_dataset[self._idx]]
+
+    @property
+    def download_url(self) -> str:
+        return self._catalog.download_url(self.file_id)
+
+    @property
+    def metadata(self) -> Dict:
+        """Full Solr doc, decoded on demand."""
+        self._catalog._require_metadata()
+        return json.loads(self._catalog._inflate(self._catalog._metadata[self._idx]))
+
+    def get(self, key: str, default=None):
+        if key not in _LEGACY_KEYS:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        if key not in _LEGACY_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> Dict:
+        """Legacy resources_by_dataset.json file entry (raw Solr values, as the harvester wrote them)."""
+        doc = self.metadata
+        return {
+            "file_id": self.file_id,
+            "name": doc.get("name"),
+            "file_type": doc.get("FileType"),
+            "file_size": doc.get("FileSize"),
+            "dataset_id": self.dataset_id,
+            "download_url": self.download_url,
+            "metadata": doc,
+        }
+
+    def __repr__(self):
+        return f"FileRecord({self.file_id!r})"
+
+
+class FileCatalog:
+    """Structure-of-arrays store of file metadata, grouped by dataset."""
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, keep_metadata: bool = True):
+        self.base_url = base_url
+        self.keep_metadata = keep_metadata       # False → columns only, no Solr docs
+        # Per dataset
+        self._dataset_ids: List[str] = []
+        self._dataset_index: Dict[str, int] = {}
+        self._dataset_meta: List[bytes] = []
+        self._dataset_start = array("q")
+        self._dataset_count = array("q")
+        # Per file
+        self._file_ids: List[Optional[str]] = []   # None → f"{dataset_id}/{name}"
+        self._names: List[str] = []
+        self._file_dataset = array("I")
+        self._file_type = array("H")
+        self._sizes = array("q")
+        self._metadata: List[bytes] = []
+        # Preset deflate dictionary for metadata docs
+        self._zdict: Optional[bytes] = None
+        # Interned file types
+        self._types: List[Optional[str]] = [None]
+        self._type_index: Dict[Optional[str], int] = {None: 0}
+
+    # ---------- Building ----------
+
+    def add_dataset(self, dataset_id: str, dataset_metadata: Dict, docs) -> int:
+        """Add (or replace) a dataset's files from raw Solr docs; returns the file count."""
+        if dataset_id in self._dataset_index:
+            self._drop_dataset(dataset_id)
+
+        ds_idx = len(self._dataset_ids)
+        dataset_id = sys.intern(dataset_id)
+        self._dataset_ids.append(dataset_id)
+        self._dataset_index[dataset_id] = ds_idx
+        self._dataset_meta.append(_dumps(dataset_metadata or {}))
+        self._dataset_start.append(len(self._file_ids))
+
+        added = 0
+        for doc in docs:
+            fid = doc.get("id")
+            if not fid:
+                continue
+            ftype = _first(doc.get("FileType"))
+            t_idx = self._type_index.get(ftype)
+            if t_idx is None:
+                t_idx = self._type_index[ftype] = len(self._types)
+                self._types.append(ftype)
+
+            name = str(_first(doc.get("name")) or "")
+            self._file_ids.append(None if fid == f"{dataset_id}/{name}" else fid)
+            self._names.append(name)
+            self._file_dataset.append(ds_idx)
+            self._file_type.append(t_idx)
+            self._sizes.append(_to_size(doc.get("FileSize")))
+            if self.keep_metadata:
+                self._metadata.append(self._deflate(_dumps(doc)))
+            added += 1
+
+        self._dataset_count.append(added)
+        return added
+
+    def _drop_dataset(self, dataset_id: str):
+        """Rebuild without one dataset (rare: re-harvest). Outstanding FileRecords become stale."""
+        rebuilt = FileCatalog(self.base_url, self.keep_metadata)
+        for did, meta, files in self.iter_datasets():
+            if did != dataset_id:
+                rebuilt.add_dataset(did, meta, map(self._doc, files))
+        self.__dict__.update(rebuilt.__dict__)
+
+    def _doc(self, f: FileRecord) -> Dict:
+        if self.keep_metadata:
+            return f.metadata
+        return {"id": f.file_id, "name": f.name, "FileType": f.file_type, "FileSize": f.file_size}
+
+    def _require_metadata(self):
+        if not self.keep_metadata:
+            raise ValueError("File metadata is not available: the catalog was loaded with keep_metadata=False")
+
+    def _deflate(self, raw: bytes) -> bytes:
+        if self._zdict is None:
+            self._zdict = raw
+        c = zlib.compressobj(6, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, self._zdict)
+        return c.compress(raw) + c.flush()
+
+    def _inflate(self, packed: bytes) -> bytes:
+        d = zlib.decompressobj(-15, zdict=self._zdict)
+        return d.decompress(packed) + d.flush()
+
+    # ---------- Access ----------
+
+    def __len__(self) -> int:
+        return len(self._dataset_ids)
+
+    def __contains__(self, dataset_id: str) -> bool:
+        return dataset_id in self._dataset_index
+
+    @property
+    def file_count(self) -> int:
+        return len(self._file_ids)
+
+    def download_url(self, file_id: str) -> str:
+        return f"{self.base_url}/data-access-api/download?id={file_id}"
+
+    def dataset_ids(self) -> List[str]:
+        return list(self._dataset_ids)
+
+    def dataset_metadata(self, dataset_id: str) -> Dict:
+        return json.loads(self._dataset_meta[self._dataset_index[dataset_id]])
+
+    def files_for(self, dataset_id: str) -> List[FileRecord]:
+        ds_idx = self._dataset_index[dataset_id]
+        start = self._dataset_start[ds_idx]
+        return [FileRecord(self, i) for i in range(start, start + self._dataset_count[ds_idx])]
+
+    def iter_datasets(self) -> Iterator[Tuple[str, Dict, List[FileRecord]]]:
+        """Yield (dataset_id, dataset_metadata, files) in insertion order."""
+        for did in list(self._dataset_ids):
+            yield did, self.dataset_metadata(did), self.files_for(did)
+
+    def iter_files(self) -> Iterator[FileRecord]:
+        for i in range(len(self._names)):
+            yield FileRecord(self, i)
+
+    def nbytes(self) -> int:
+        """Approximate resident size of the catalog payload (for diagnostics)."""
+        arrays = (self._dataset_start, self._dataset_count, self._file_dataset, self._file_type, self._sizes)
+        return (
+            sum(a.itemsize * len(a) for a in arrays)
+            + sum(map(len, self._metadata)) + sum(map(len, self._dataset_meta))
+            + sum(sys.getsizeof(f) for f in self._file_ids if f is not None)
+            + sum(map(sys.getsizeof, self._names)) + 8 * len(self._file_ids)
+            + sum(map(sys.getsizeof, self._dataset_ids))
+        )
+
+    # ---------- JSON Lines persistence ----------
+
+    def _dataset_line(self, dataset_id: str) -> bytes:
+        self._require_metadata()
+        ds_idx = self._dataset_index[dataset_id]
+        start = self._dataset_start[ds_idx]
+        docs = b",".join(map(self._inflate, self._metadata[start:start + self._dataset_count[ds_idx]]))
+        return (b'{"dataset_id":' + _dumps(dataset_id)
+                + b',"dataset_metadata":' + self._dataset_meta[ds_idx]
+                + b',"files":[' + docs + b"]}\n")
+
+    def append_to(self, path: Path, dataset_id: str):
+        """
+        Append one dataset as a JSON line (the harvester's incremental
+        checkpoint). A torn final line left by a crash mid-append is cut off
+        first, so the new line does not get glued onto it.
+        """
+        with open(path, "ab+") as f:
+            _truncate_torn_tail(f)
+            f.write(self._dataset_line(dataset_id))
+
+    def save(self, path: Path):
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            for did in self._dataset_ids:
+                f.write(self._dataset_line(did))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path, base_url: str = DEFAULT_BASE_URL, keep_metadata: bool = True) -> "FileCatalog":
+        """Read a JSON Lines catalog; a torn final line (crash mid-append) is ignored."""
+        catalog = cls(base_url, keep_metadata)
+        with open(path, "rb") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠ Ignoring unreadable catalog line {lineno} in {path}")
+                    continue
+                catalog.add_dataset(entry["dataset_id"], entry.get("dataset_metadata"), entry.get("files", []))
+        return catalog
+
+    # ---------- Legacy resources_by_dataset.json ----------
+
+    @classmethod
+    def from_resources_by_dataset(cls, data: Dict, base_url: str = DEFAULT_BASE_URL,
+                                  keep_metadata: bool = True) -> "FileCatalog":
+        catalog = cls(base_url, keep_metadata)
+        for did, payload in data.items():
+            docs = []
+            for f in payload.get("files", []):
+                doc = f.get("metadata")
+                if not doc:
+                    doc = {"id": f.get("file_id"), "name": f.get("name"), "FileType": f.get("file_type"),
+                           "FileSize": f.get("file_size"), "DatasetId": [did]}
+                docs.append(doc)
+            catalog.add_dataset(did, payload.get("dataset_metadata", {}), docs)
+        return catalog
+
+    @classmethod
+    def from_resources_json(cls, path: Path, base_url: str = DEFAULT_BASE_URL,
+                            keep_metadata: bool = True) -> "FileCatalog":
+        with open(path, "r") as f:
+            return cls.from_resources_by_dataset(json.load(f), base_url, keep_metadata)
+
+    @classmethod
+    def open(cls, path: Path, base_url: str = DEFAULT_BASE_URL, keep_metadata: bool = True) -> "FileCatalog":
+        """
+        Load either format, chosen by suffix (.jsonl → catalog, otherwise
+        legacy JSON). The legacy file is parsed in one piece, so prefer the
+        .jsonl catalog for large harvests.
+        """
+        path = Path(path)
+        if path.suffix == ".jsonl":
+            return cls.load(path, base_url, keep_metadata)
+        return cls.from_resources_json(path, base_url, keep_metadata)
+
+    @staticmethod
+    def resolve(path: Path) -> Path:
+        """`path`, or the legacy resources_by_dataset.json next to it when a missing .jsonl is asked for"""
+        path = Path(path)
+        if not path.exists() and path.suffix == ".jsonl" and path.with_suffix(".json").exists():
+            return path.with_suffix(".json")
+        return path
+
+    def write_resources_json(self, path: Path):
+        """
+        Stream the legacy resources_by_dataset.json layout, one dataset at a
+        time, so only a single dataset's dicts are materialised at once.
+        """
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w") as out:
+            out.write("{")
+            for n, (did, meta, files) in enumerate(self.iter_datasets()):
+                entry = {
+                    "dataset_metadata": meta,
+                    "files": [f.to_dict() for f in files],
+                    "file_count": len(files),
+                }
+                body = json.dumps(entry, indent=2).replace("\n", "\n  ")
+                out.write(("," if n else "") + f"\n  {json.dumps(did)}: {body}")
+            out.write("\n}" if self._dataset_ids else "}")
+        tmp.replace(path)
@@ -7,16 +7,25 @@ Reads manifest.csv (produced by build_manifest.py) and writes
 biomed_croissant.json.
 """
 
+import argparse
 import hashlib
 import json
 from pathlib import Path
-import mlcroissant as mlc
+
+from instrumentation import timed
 
 
 MANIFEST_PATH = Path("manifest.csv")
 OUTPUT_PATH = Path("output/croissant.json")
 
 
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Generate Croissant 1.0 metadata from a CSV manifest")
+    p.add_argument("--manifest", "-i", type=Path, default=MANIFEST_PATH, help="Input CSV manifest")
+    p.add_argument("--output", "-o", type=Path, default=OUTPUT_PATH, help="Output Croissant JSON-LD")
+    return p.parse_args(argv)
+
+
 def sha256_of_file(path: Path) -> str:
     h = hashlib.sha256()
     with open(path, "rb") as f:
@@ -25,13 +34,18 @@ def sha256_of_file(path: Path) -> str:
     return h.hexdigest()
 
 
-def main():
-    if not MANIFEST_PATH.exists():
+@timed("generate_croissant_seconds", manifest=MANIFEST_PATH.name)
+def main(argv=None):
+    args = parse_args(argv)
+    import mlcroissant as mlc   # heavy; not needed for --help
+
+    manifest_path, output_path = args.manifest, args.output
+    if not manifest_path.exists():
         raise SystemExit(
             "manifest.csv not found. Run build_manifest.py first."
         )
 
-    sha = sha256_of_file(MANIFEST_PATH)
+    sha = sha256_of_file(manifest_path)
     print(f"manifest.csv SHA-256: {sha}")
 
     metadata = mlc.Metadata(
@@ -139,8 +153,9 @@ def main():
     )
 
     jsonld = metadata.to_json()
-    OUTPUT_PATH.write_text(json.dumps(jsonld, indent=2, ensure_ascii=False))
-    print(f"Croissant metadata written to {OUTPUT_PATH}")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(jsonld, indent=2, ensure_ascii=False))
+    print(f"Croissant metadata written to {output_path}")
 
 
 if __name__ == "__main__":
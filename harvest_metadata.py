@@ -1,20 +1,46 @@
 """
 CLI Script to Harvest LabCAS Metadata
+
+Usage:
+    python harvest_metadata.py                                   # breast density collection only
+    python harvest_metadata.py --collection A --collection B     # several collections, partitioned store
+    python harvest_metadata.py --all-collections --match '*Breast*' --workers 4
 """
 
+import argparse
 import os
 import sys
 from pathlib import Path
 
 # Import from local files
-from labcas_client import get_jwt_token, LabCASClient
-from harvester import LabCASHarvester
+from labcas_client import DEFAULT_REQUESTS_PER_SECOND, get_jwt_token, LabCASClient
+from harvester import LabCASHarvester, MultiCollectionHarvester
+
+TARGET_COLLECTION_ID = "Automated_Quantitative_Measures_of_Breast_Density_Data"
+OUTPUT_DIR = Path(__file__).parent / "harvested_metadata"
+MULTI_OUTPUT_DIR = Path(__file__).parent / "harvested_collections"
+BASE_URL = "https://edrn-labcas.jpl.nasa.gov"
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Harvest LabCAS metadata")
+    p.add_argument("--collection", "-c", action="append", default=None,
+                   help=f"Collection ID to harvest (repeatable; default: {TARGET_COLLECTION_ID})")
+    p.add_argument("--all-collections", action="store_true", help="Page through and harvest every collection")
+    p.add_argument("--match", default=None, help="Glob on collection ID/name, used with --all-collections")
+    p.add_argument("--workers", type=int, default=4, help="Collections harvested concurrently")
+    p.add_argument("--output", "-o", type=Path, default=None,
+                   help=f"Output directory (default: {OUTPUT_DIR.name}/ for one collection, "
+                        f"{MULTI_OUTPUT_DIR.name}/ for several)")
+    p.add_argument("--no-resume", action="store_true", help="Re-harvest collections already marked complete")
+    p.add_argument("--rps", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                   help="Paginated page requests per second, per collection (0: unlimited; default: %(default)g)")
+    p.add_argument("--base-url", default=os.getenv("LABCAS_BASE_URL", BASE_URL), help="LabCAS server")
+    return p.parse_args(argv)
 
 
-def main():
-    # Configuration
-    TARGET_COLLECTION_ID = "Automated_Quantitative_Measures_of_Breast_Density_Data"
-    OUTPUT_DIR = Path(__file__).parent / "harvested_metadata"
+def main(argv=None):
+    args = parse_args(argv)
     
     # Get credentials from environment
     username = os.getenv('LABCAS_USERNAME')
@@ -28,19 +54,29 @@ def main():
     
     # Authenticate
     print("\n Authenticating with LabCAS...")
-    jwt_token = get_jwt_token(username, password)
+    jwt_token = get_jwt_token(username, password, args.base_url)
     print("✓ Authentication successful")
     
-    # Create client and harvester
-    client = LabCASClient(jwt_token)
+    collection_ids = args.collection or []
+    multi = args.all_collections or args.match or len(collection_ids) > 1
     
-    harvester = LabCASHarvester(client, OUTPUT_DIR)
+    # One client (connection pool + token) shared by every harvester thread
+    client = LabCASClient(jwt_token, base_url=args.base_url, requests_per_second=args.rps,
+                          pool_size=max(10, 4 * args.workers) if multi else None)
     
-    # Run harvest
-    result = harvester.harvest_all(TARGET_COLLECTION_ID)
+    if not multi:
+        harvester = LabCASHarvester(client, args.output or OUTPUT_DIR)
+        harvester.harvest_all(collection_ids[0] if collection_ids else TARGET_COLLECTION_ID)
+    else:
+        harvester = MultiCollectionHarvester(client, args.output or MULTI_OUTPUT_DIR, max_workers=args.workers)
+        if args.all_collections or args.match:
+            collection_ids += [c["id"] for c in harvester.discover(args.match)]
+        results = harvester.harvest(collection_ids, resume=not args.no_resume)
+        if any(r.get("status") != "complete" for r in results.values()):
+            sys.exit(1)
     
     print("\n Metadata harvesting complete!")
-    print(f"\nNext step: Run 'python generate_croissant.py' to create Croissant metadata")
+    print(f"\nNext step: Run 'python build_manifest.py' to build the manifest")
 
 
 if __name__ == "__main__":
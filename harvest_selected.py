@@ -0,0 +1,107 @@
+"""
+CLI Script for a targeted (selective) LabCAS harvest
+
+Only the files matching the filters are fetched, with a few narrow
+files/select queries instead of a full per-dataset crawl.
+
+Usage:
+    python harvest_selected.py --patient C0250 --patient N0101 --manifest manifest_mini.csv
+    python harvest_selected.py --group control --view LCC --view RCC
+    python harvest_selected.py --from-manifest manifest_mini.csv      # refresh an existing subset
+"""
+
+import argparse
+import csv
+import os
+import sys
+from pathlib import Path
+
+from labcas_client import DEFAULT_REQUESTS_PER_SECOND, get_jwt_token, LabCASClient
+from harvester import GROUP_PREFIXES, LabCASHarvester
+
+TARGET_COLLECTION_ID = "Automated_Quantitative_Measures_of_Breast_Density_Data"
+OUTPUT_DIR = Path(__file__).parent / "harvested_selected"
+BASE_URL = "https://edrn-labcas.jpl.nasa.gov"
+
+ALLOWED_VIEWS = ("LCC", "LMLO", "RCC", "RMLO")
+KINDS = ("RAW", "PROC", "MASK")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Harvest only the LabCAS files matching patient/group/view filters")
+    p.add_argument("--collection", "-c", default=TARGET_COLLECTION_ID, help="Collection ID")
+    p.add_argument("--patient", "-p", action="append", default=None, help="Patient ID, e.g. C0250 (repeatable)")
+    p.add_argument("--group", "-g", action="append", choices=sorted(GROUP_PREFIXES), default=None,
+                   help="case and/or control (repeatable)")
+    p.add_argument("--view", "-v", action="append", type=str.upper, choices=ALLOWED_VIEWS, default=None,
+                   help="View (repeatable; default: all four)")
+    p.add_argument("--kind", "-k", action="append", type=str.upper, choices=KINDS, default=None,
+                   help="Dataset kind (repeatable; default: PROC and MASK)")
+    p.add_argument("--from-manifest", type=Path, default=None,
+                   help="Take patient IDs and views from an existing manifest CSV")
+    p.add_argument("--output", "-o", type=Path, default=OUTPUT_DIR, help="Output directory")
+    p.add_argument("--manifest", type=Path, default=None,
+                   help="Also build a manifest CSV from the selection (via build_manifest.py)")
+    p.add_argument("--rps", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                   help="Paginated page requests per second (0: unlimited; default: %(default)g)")
+    p.add_argument("--base-url", default=os.getenv("LABCAS_BASE_URL", BASE_URL), help="LabCAS server")
+    return p.parse_args(argv)
+
+
+def filters_from_manifest(path: Path):
+    """Patient IDs and views present in a manifest CSV"""
+    patients, views = set(), set()
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            patients.add(row["patient_id"])
+            views.add(row["view"])
+    return sorted(patients), sorted(views)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    patients, views = args.patient, args.view
+    if args.from_manifest:
+        m_patients, m_views = filters_from_manifest(args.from_manifest)
+        patients = (patients or []) + m_patients
+        views = views or m_views
+        print(f"✓ {len(m_patients)} patients, views {', '.join(m_views)} from {args.from_manifest}")
+    views = views or list(ALLOWED_VIEWS)
+    kinds = args.kind or ["PROC", "MASK"]
+
+    # Get credentials from environment
+    username = os.getenv('LABCAS_USERNAME')
+    password = os.getenv('LABCAS_PASSWORD')
+
+    if not username or not password:
+        print("Error: LABCAS_USERNAME and LABCAS_PASSWORD environment variables must be set")
+        sys.exit(1)
+
+    print("\n Authenticating with LabCAS...")
+    jwt_token = get_jwt_token(username, password, args.base_url)
+    print("✓ Authentication successful")
+
+    client = LabCASClient(jwt_token, base_url=args.base_url, requests_per_second=args.rps)
+    harvester = LabCASHarvester(client, args.output)
+    catalog = harvester.harvest_selected(args.collection, patients=patients, groups=args.group,
+                                         views=views, kinds=kinds)
+
+    catalog_file = args.output / "resources_by_dataset.jsonl"
+    if args.manifest:
+        import build_manifest
+
+        build_manifest.main([
+            "-i", str(catalog_file), "-o", str(args.manifest),
+            "--diag", str(args.output / "manifest_diagnostics.json"),
+            "--download-base", f"{args.base_url}/data-access-api/download?id=",
+        ])
+    else:
+        print(f"\nNext step: Run 'python build_manifest.py -i {catalog_file} -o manifest_mini.csv'")
+
+    if not catalog.file_count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
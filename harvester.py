@@ -2,11 +2,77 @@
 Metadata Harvester for LabCAS with incremental persistence
 """
 
+import fnmatch
 import json
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 from labcas_client import LabCASClient
+from dataset_hierarchy import HIERARCHY_FILE, DatasetHierarchy, get_dataset_id
+from file_catalog import FileCatalog
+from instrumentation import cache_hit, incr, span, timed
+
+GROUP_PREFIXES = {"case": "C", "control": "N"}
+
+# Characters with meaning in Solr's standard query parser ('*' is kept as a wildcard)
+_SOLR_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~?:\\/])')
+
+
+def _solr_term(value: str) -> str:
+    """Exact values are quoted; values containing '*' become escaped wildcard terms"""
+    if "*" in value:
+        return _SOLR_SPECIAL.sub(r"\\\1", value)
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _solr_clause(field: str, values: List[str]) -> str:
+    terms = [_solr_term(v) for v in values]
+    return f"{field}:{terms[0]}" if len(terms) == 1 else f"{field}:({' OR '.join(terms)})"
+
+
+def build_file_queries(collection_id: str, patients: Optional[Iterable[str]] = None,
+                       groups: Optional[Iterable[str]] = None, views: Optional[Iterable[str]] = None,
+                       kinds: Optional[Iterable[str]] = ("PROC", "MASK"),
+                       chunk_size: int = 50) -> List[str]:
+    """
+    Turn manifest-level filters into narrow Solr queries for files/select.
+    
+    Leaf datasets follow `<collection>/<patient>/<RAW|PROC|MASK>`, so patient,
+    group (case → C*, control → N*) and kind filters become a DatasetId
+    clause, and views become a clause on the clean file name
+    (`*_<VIEW>.dcm`, which also skips the `_2.dcm` variants the manifest
+    rejects). Long patient lists are split into chunks of `chunk_size`
+    patients, one query each.
+    """
+    prefixes = [GROUP_PREFIXES[g.lower()] for g in groups] if groups else None
+    if patients:
+        patients = sorted({p.upper() for p in patients})
+        if prefixes:
+            patients = [p for p in patients if p[0] in prefixes]
+        if not patients:
+            return []
+        chunks = [patients[i:i + chunk_size] for i in range(0, len(patients), chunk_size)]
+    else:
+        chunks = [[f"{p}*" for p in prefixes] if prefixes else ["*"]]
+    kinds = list(kinds) if kinds else ["*"]
+    
+    name_clause = None
+    if views:
+        name_clause = _solr_clause("name", [f"*_{v.upper()}.dcm" for v in sorted(set(views))])
+    
+    queries = []
+    for chunk in chunks:
+        if chunk == ["*"] and kinds == ["*"]:
+            clauses = [_solr_clause("CollectionId", [collection_id])]
+        else:
+            clauses = [_solr_clause("DatasetId", [f"{collection_id}/{p}/{k}" for p in chunk for k in kinds])]
+        if name_clause:
+            clauses.append(name_clause)
+        queries.append(" AND ".join(clauses))
+    return queries
 
 
 class LabCASHarvester:
@@ -18,6 +84,7 @@ class LabCASHarvester:
         self.client = client
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.failed_datasets: Dict[str, str] = {}     # dataset ID → error of the last harvest_files()
     
     def _save_json(self, data: dict, filename: str):
         """Save data to JSON file"""
@@ -29,6 +96,7 @@ class LabCASHarvester:
     def _load_json(self, filename: str) -> Optional[dict]:
         """Load data from JSON file if exists"""
         filepath = self.output_dir / filename
+        cache_hit("harvest_step_cache", filepath.exists(), file=filename)
         if filepath.exists():
             with open(filepath, 'r') as f:
                 return json.load(f)
@@ -48,12 +116,8 @@ class LabCASHarvester:
             print(f"✓ Collection metadata already harvested")
             return existing
         
-        # Get all collections and find target
-        collections = self.client.list_collections(rows=100)
-        collection_doc = next(
-            (c for c in collections if c.get("id") == collection_id),
-            None
-        )
+        # Look the target up directly instead of scanning the first page of collections
+        collection_doc = self.client.get_collection(collection_id)
         
         if not collection_doc:
             raise ValueError(f"Collection '{collection_id}' not found")
@@ -79,7 +143,7 @@ class LabCASHarvester:
             print(f"✓ Datasets already harvested ({len(existing)} datasets)")
             return existing
         
-        datasets = self.client.list_datasets_for_collection(collection_id, rows=10000)
+        datasets = self.client.list_all_datasets_for_collection(collection_id)
         print(f"✓ Retrieved {len(datasets)} datasets")
         
         # Save immediately
@@ -95,100 +159,138 @@ class LabCASHarvester:
         print(f"STEP 3: Analyzing Dataset Hierarchy")
         print(f"{'='*60}")
         
+        hierarchy_file = self.output_dir / HIERARCHY_FILE
+        
         # Check if already analyzed
         existing = self._load_json("leaf_datasets.json")
         if existing:
+            if not hierarchy_file.exists():
+                DatasetHierarchy.build(datasets).save(hierarchy_file)
             print(f"✓ Leaf datasets already identified ({len(existing)} leaf datasets)")
             return existing
         
-        def get_dataset_id(d):
-            if isinstance(d.get("id"), str) and d["id"].strip():
-                return d["id"].strip()
-            dv = d.get("DatasetId")
-            if isinstance(dv, (list, tuple)) and dv:
-                return str(dv[0]).strip()
-            return None
-        
-        def get_parent_id(d):
-            for key in ("ParentDatasetId", "DatasetParentId", "DatasetParent"):
-                val = d.get(key)
-                if isinstance(val, (list, tuple)) and val:
-                    return str(val[0]).strip()
-                if isinstance(val, str) and val.strip():
-                    return val.strip()
-            return None
-        
-        def extract_names(val):
-            if val is None:
-                return []
-            if isinstance(val, (list, tuple, set)):
-                return [str(x).strip() for x in val if str(x).strip()]
-            s = str(val).strip()
-            return [s] if s else []
-        
-        # Build parent -> children mapping
-        children = {}
-        for d in datasets:
-            parent = get_parent_id(d)
-            if not parent:
-                continue
-            children.setdefault(parent, []).append(get_dataset_id(d))
+        # Single pass: parent → children adjacency, depth, leaf set, kind, patient
+        hierarchy = DatasetHierarchy.build(datasets)
+        leaf_datasets = hierarchy.leaf_docs()
+        counts = hierarchy.counts()
         
-        # Identify leaf datasets (no children)
-        leaf_datasets = [
-            d for d in datasets
-            if get_dataset_id(d) not in children
-        ]
-        
-        # Classify leaf datasets
-        targets = {"RAW": 0, "PROC": 0, "MASK": 0, "Documentation": 0}
-        
-        for d in leaf_datasets:
-            name_vals = d.get("DatasetName") or d.get("name") or d.get("labcasName")
-            for nm in extract_names(name_vals):
-                if nm in targets:
-                    targets[nm] += 1
-        
-        print(f"Total datasets: {len(datasets)}")
-        print(f"Leaf datasets: {len(leaf_datasets)}")
-        print(f"Non-leaf datasets: {len(datasets) - len(leaf_datasets)}")
-        print(f"  RAW: {targets['RAW']}")
-        print(f"  PROC: {targets['PROC']}")
-        print(f"  MASK: {targets['MASK']}")
-        print(f"  Documentation: {targets['Documentation']}")
+        print(f"Total datasets: {counts['total']}")
+        print(f"Leaf datasets: {counts['leaves']}")
+        print(f"Non-leaf datasets: {counts['non_leaves']}")
+        print(f"  RAW: {counts['RAW']}")
+        print(f"  PROC: {counts['PROC']}")
+        print(f"  MASK: {counts['MASK']}")
+        print(f"  Documentation: {counts['Documentation']}")
         
         # Save immediately
+        hierarchy.save(hierarchy_file)
+        print(f"✓ Saved: {hierarchy_file}")
         self._save_json(leaf_datasets, "leaf_datasets.json")
         
         return leaf_datasets
     
-    def harvest_files(self, leaf_datasets: List[Dict]) -> Dict:
+    def load_hierarchy(self) -> DatasetHierarchy:
+        """Load the persisted hierarchy index (with dataset docs attached)"""
+        datasets = self._load_json("datasets.json")
+        if datasets is None:
+            raise FileNotFoundError(f"No datasets.json in {self.output_dir}; run harvest_datasets first")
+        hierarchy_file = self.output_dir / HIERARCHY_FILE
+        if not hierarchy_file.exists():
+            DatasetHierarchy.build(datasets).save(hierarchy_file)
+        return DatasetHierarchy.load(hierarchy_file, datasets=datasets)
+    
+    def harvest_selected_datasets(self, kinds=None, patients=None, under: Optional[str] = None) -> FileCatalog:
+        """
+        Harvest files only for the leaf datasets matching the filters, e.g.
+        kinds=("PROC", "MASK"), patients=["C0250"]
+        """
+        leaf_datasets = self.load_hierarchy().leaf_docs(kind=kinds, patients=patients, under=under)
+        print(f"✓ {len(leaf_datasets)} leaf datasets selected")
+        return self.harvest_files(leaf_datasets)
+    
+    def harvest_selected(self, collection_id: str, patients: Optional[Iterable[str]] = None,
+                         groups: Optional[Iterable[str]] = None, views: Optional[Iterable[str]] = None,
+                         kinds: Optional[Iterable[str]] = ("PROC", "MASK")) -> FileCatalog:
+        """
+        Targeted harvest: query files/select directly with the filters (see
+        build_file_queries) instead of listing every leaf dataset. The
+        result is saved as resources_by_dataset.jsonl, readable by
+        build_manifest.py.
+        """
+        print(f"\n{'='*60}")
+        print(f"Selective File Harvest")
+        print(f"{'='*60}")
+        
+        queries = build_file_queries(collection_id, patients, groups, views, kinds)
+        by_dataset: Dict[str, List[Dict]] = {}
+        for n, q in enumerate(queries, 1):
+            print(f"[{n}/{len(queries)}] {q if len(q) < 200 else q[:197] + '...'}")
+            with span("harvest_list_files_seconds"):
+                docs = self.client.search_files(q)
+            for doc in docs:
+                dv = doc.get("DatasetId")
+                did = dv[0] if isinstance(dv, list) and dv else dv
+                if did:
+                    by_dataset.setdefault(did, []).append(doc)
+            print(f"  ✓ Found {len(docs)} files")
+        
+        # Dataset docs for the matched datasets only (kept as catalog metadata)
+        dataset_ids = sorted(by_dataset)
+        dataset_docs = {}
+        for i in range(0, len(dataset_ids), 100):
+            for d in self.client.get_datasets(dataset_ids[i:i + 100]):
+                dataset_docs[get_dataset_id(d)] = d
+        
+        catalog = FileCatalog(self.client.base_url)
+        for did in dataset_ids:
+            catalog.add_dataset(did, dataset_docs.get(did, {"id": did}), by_dataset[did])
+        incr("harvest_files_total", catalog.file_count)
+        
+        catalog_file = self.output_dir / "resources_by_dataset.jsonl"
+        catalog.save(catalog_file)
+        self._save_json({
+            "collection_id": collection_id,
+            "patients": sorted(patients) if patients else None,
+            "groups": sorted(groups) if groups else None,
+            "views": sorted(views) if views else None,
+            "kinds": sorted(kinds) if kinds else None,
+            "queries": queries,
+        }, "selection.json")
+        print(f"✓ Saved: {catalog_file}")
+        print(f"\n✓ Selective harvest complete: {len(catalog)} datasets, {catalog.file_count} files")
+        return catalog
+    
+    @timed("harvest_files_seconds")
+    def harvest_files(self, leaf_datasets: List[Dict]) -> FileCatalog:
         """
-        Harvest file metadata for all leaf datasets with incremental persistence
+        Harvest file metadata for all leaf datasets with incremental persistence.
+
+        Files are collected into a FileCatalog. Each finished dataset is
+        appended to resources_by_dataset.jsonl (the resume point); the legacy
+        resources_by_dataset.json is streamed out once at the end. Datasets
+        that fail are skipped and recorded in self.failed_datasets.
         """
         print(f"\n{'='*60}")
         print(f"STEP 4: Harvesting File Metadata")
         print(f"{'='*60}")
         
         # Load existing progress
+        catalog_file = self.output_dir / "resources_by_dataset.jsonl"
         resources_file = self.output_dir / "resources_by_dataset.json"
-        if resources_file.exists():
-            with open(resources_file, 'r') as f:
-                resources_by_dataset = json.load(f)
-            print(f"✓ Resuming from existing harvest ({len(resources_by_dataset)} datasets completed)")
+        if catalog_file.exists():
+            catalog = FileCatalog.load(catalog_file, self.client.base_url)
+            print(f"✓ Resuming from existing harvest ({len(catalog)} datasets completed)")
+        elif resources_file.exists():
+            catalog = FileCatalog.from_resources_json(resources_file, self.client.base_url)
+            catalog.save(catalog_file)
+            print(f"✓ Resuming from existing harvest ({len(catalog)} datasets completed)")
         else:
-            resources_by_dataset = {}
-        
-        def get_dataset_id(d):
-            if isinstance(d.get("id"), str) and d["id"].strip():
-                return d["id"].strip()
-            dv = d.get("DatasetId")
-            if isinstance(dv, (list, tuple)) and dv:
-                return str(dv[0]).strip()
-            return None
+            catalog = FileCatalog(self.client.base_url)
         
         total = len(leaf_datasets)
-        completed = len(resources_by_dataset)
+        completed = len(catalog)
+        added = 0
+        self.failed_datasets = {}
         
         for idx, d in enumerate(leaf_datasets, 1):
             did = get_dataset_id(d)
@@ -196,57 +298,52 @@ class LabCASHarvester:
                 continue
             
             # Skip if already harvested
-            if did in resources_by_dataset:
+            if did in catalog:
+                cache_hit("harvest_resume_cache", True)
                 continue
+            cache_hit("harvest_resume_cache", False)
             
             print(f"\n[{idx}/{total}] Harvesting files for dataset: {did}")
             
             try:
                 # Get all files for this dataset
-                files = self.client.list_all_files_for_dataset(did, batch_size=1000)
-                
-                file_entries = []
-                for f in files:
-                    fid = f.get("id")
-                    if not fid:
-                        continue
-                    
-                    file_entries.append({
-                        "file_id": fid,
-                        "name": f.get("name"),
-                        "file_type": f.get("FileType"),
-                        "file_size": f.get("FileSize"),
-                        "dataset_id": did,
-                        "download_url": self.client.build_download_url(fid),
-                        "metadata": f  # Store full metadata
-                    })
+                with span("harvest_list_files_seconds"):
+                    files = self.client.list_all_files_for_dataset(did, batch_size=1000)
                 
-                resources_by_dataset[did] = {
-                    "dataset_metadata": d,
-                    "files": file_entries,
-                    "file_count": len(file_entries)
-                }
+                n_files = catalog.add_dataset(did, d, files)
+                del files
                 
-                print(f"  ✓ Found {len(file_entries)} files")
+                print(f"  ✓ Found {n_files} files")
                 
                 # **INCREMENTAL SAVE AFTER EACH DATASET**
-                with open(resources_file, 'w') as f:
-                    json.dump(resources_by_dataset, f, indent=2)
+                with span("harvest_checkpoint_seconds"):
+                    catalog.append_to(catalog_file, did)
+                incr("harvest_files_total", n_files)
                 
                 completed += 1
+                added += 1
                 print(f"  ✓ Progress saved ({completed}/{total} datasets)")
                 
                 # Small delay to avoid rate limiting
                 # time.sleep(0.5)
                 
             except Exception as e:
+                incr("harvest_dataset_errors_total")
+                self.failed_datasets[did] = f"{type(e).__name__}: {e}"
                 print(f"  ⚠ Error harvesting dataset {did}: {e}")
                 print(f"  Continuing with next dataset...")
                 continue
         
-        print(f"\n✓ File harvesting complete: {len(resources_by_dataset)} datasets")
+        if added or not resources_file.exists():
+            with span("harvest_checkpoint_seconds"):
+                catalog.write_resources_json(resources_file)
+            print(f"✓ Saved: {resources_file}")
         
-        return resources_by_dataset
+        print(f"\n✓ File harvesting complete: {len(catalog)} datasets, {catalog.file_count} files")
+        if self.failed_datasets:
+            print(f"⚠ {len(self.failed_datasets)} datasets failed; re-run to retry them")
+        
+        return catalog
     
     def harvest_all(self, collection_id: str) -> Dict:
         """
@@ -276,11 +373,154 @@ class LabCASHarvester:
         print(f"Total datasets: {len(datasets)}")
         print(f"Leaf datasets: {len(leaf_datasets)}")
         print(f"Datasets with files: {len(resources_by_dataset)}")
+        if self.failed_datasets:
+            print(f"Failed datasets: {len(self.failed_datasets)}")
         print(f"\nAll metadata saved to: {self.output_dir}")
         
         return {
             "collection": collection_doc,
             "datasets": datasets,
             "leaf_datasets": leaf_datasets,
-            "resources_by_dataset": resources_by_dataset
+            "resources_by_dataset": resources_by_dataset,
+            "failed_datasets": dict(self.failed_datasets),
+        }
+
+
+class MultiCollectionHarvester:
+    """
+    Harvest several collections concurrently into one store partitioned by
+    collection:
+
+        <output_dir>/index.json                 ← status of every collection
+        <output_dir>/collections.json           ← all collection docs (discovery)
+        <output_dir>/collections/<id>/...       ← one LabCASHarvester layout each
+
+    All partitions share one LabCASClient, i.e. one connection pool and one
+    JWT token, but each collection gets its own rate limiter, so the client's
+    requests_per_second applies per collection. Each partition resumes
+    independently from its own step files; a collection is only marked
+    complete once every leaf dataset has been harvested, otherwise it is
+    "incomplete" and harvested again (resuming) on the next run.
+    """
+    
+    INDEX_FILE = "index.json"
+    
+    def __init__(self, client: LabCASClient, output_dir: Path, max_workers: int = 4):
+        self.client = client
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self._index_lock = threading.Lock()
+        self.index = self._load_index()
+    
+    @staticmethod
+    def partition_name(collection_id: str) -> str:
+        """Filesystem-safe directory name for a collection ID"""
+        return re.sub(r"[^A-Za-z0-9._-]+", "_", collection_id)
+    
+    def partition_dir(self, collection_id: str) -> Path:
+        return self.output_dir / "collections" / self.partition_name(collection_id)
+    
+    def _load_index(self) -> Dict:
+        path = self.output_dir / self.INDEX_FILE
+        if path.exists():
+            with open(path, 'r') as f:
+                return json.load(f)
+        return {"collections": {}}
+    
+    def _update_index(self, collection_id: str, **fields):
+        with self._index_lock:
+            entry = self.index["collections"].setdefault(collection_id, {})
+            entry.update(fields, path=str(self.partition_dir(collection_id).relative_to(self.output_dir)),
+                         updated=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            path = self.output_dir / self.INDEX_FILE
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f, indent=2)
+            tmp.replace(path)
+    
+    def discover(self, pattern: Optional[str] = None) -> List[Dict]:
+        """
+        Page through every collection, optionally keeping those whose ID or
+        name matches the glob `pattern`
+        """
+        collections = self.client.list_all_collections()
+        with open(self.output_dir / "collections.json", 'w') as f:
+            json.dump(collections, f, indent=2)
+        print(f"✓ Discovered {len(collections)} collections")
+        
+        if pattern:
+            def names(c):
+                for key in ("id", "CollectionName"):
+                    val = c.get(key)
+                    yield from (val if isinstance(val, list) else [val])
+            collections = [
+                c for c in collections
+                if any(isinstance(n, str) and fnmatch.fnmatch(n, pattern) for n in names(c))
+            ]
+            print(f"✓ {len(collections)} collections match '{pattern}'")
+        return collections
+    
+    def _harvest_one(self, collection_id: str) -> Dict:
+        self._update_index(collection_id, status="in_progress")
+        harvester = LabCASHarvester(self.client.with_own_rate_limit(), self.partition_dir(collection_id))
+        result = harvester.harvest_all(collection_id)
+        catalog = result["resources_by_dataset"]
+        failed = result["failed_datasets"]
+        leaf_ids = {did for did in map(get_dataset_id, result["leaf_datasets"]) if did}
+        missing = sum(1 for did in leaf_ids if did not in catalog)
+        summary = {
+            "status": "incomplete" if failed or missing else "complete",
+            "name": result["collection"].get("CollectionName"),
+            "datasets": len(result["datasets"]),
+            "leaf_datasets": len(result["leaf_datasets"]),
+            "harvested_datasets": len(catalog),
+            "failed_datasets": len(failed),
+            "files": catalog.file_count,
         }
+        summary["error"] = None
+        if failed:
+            did, msg = next(iter(failed.items()))
+            summary["error"] = f"{len(failed)} datasets failed, e.g. {did}: {msg}"
+        elif missing:
+            summary["error"] = f"{missing} leaf datasets not harvested"
+        self._update_index(collection_id, **summary)
+        return summary
+    
+    def harvest(self, collection_ids: Iterable[str], resume: bool = True) -> Dict[str, Dict]:
+        """
+        Harvest each collection (concurrently). Collections marked complete
+        in the index are skipped when `resume` is set.
+        """
+        collection_ids = list(dict.fromkeys(collection_ids))
+        todo = [
+            cid for cid in collection_ids
+            if not (resume and self.index["collections"].get(cid, {}).get("status") == "complete")
+        ]
+        skipped = len(collection_ids) - len(todo)
+        
+        print(f"\n{'#'*60}")
+        print(f"# LabCAS Multi-Collection Harvest")
+        print(f"# Collections: {len(collection_ids)} ({skipped} already complete)")
+        print(f"{'#'*60}")
+        
+        results = {cid: self.index["collections"][cid] for cid in collection_ids if cid not in todo}
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            futures = {pool.submit(self._harvest_one, cid): cid for cid in todo}
+            for fut in as_completed(futures):
+                cid = futures[fut]
+                try:
+                    results[cid] = fut.result()
+                    if results[cid]["status"] == "complete":
+                        print(f"✓ Collection complete: {cid} ({results[cid]['files']} files)")
+                    else:
+                        print(f"⚠ Collection incomplete: {cid}: {results[cid]['error']}")
+                except Exception as e:
+                    self._update_index(cid, status="failed", error=f"{type(e).__name__}: {e}")
+                    results[cid] = self.index["collections"][cid]
+                    print(f"⚠ Collection failed: {cid}: {e}")
+        
+        complete = sum(1 for r in results.values() if r.get("status") == "complete")
+        print(f"\n✓ {complete}/{len(collection_ids)} collections complete")
+        print(f"Index: {self.output_dir / self.INDEX_FILE}")
+        return results
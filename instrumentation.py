@@ -0,0 +1,282 @@
+"""
+Lightweight timing/counter instrumentation for the harvest → manifest →
+Croissant → load pipeline.
+
+Disabled unless EDRN_METRICS is set (or enable() is called); when disabled,
+every helper returns after a single global flag check. When EDRN_METRICS
+names a file, metrics are exported there at interpreter exit: a `.prom`
+suffix selects the Prometheus text format, anything else writes JSON. A
+`{pid}` placeholder in the path gives each process its own file.
+
+Usage:
+    from instrumentation import span, timed, incr, cache_hit
+
+    with span("labcas_request_seconds", endpoint="files/select"):
+        ...
+    incr("labcas_response_bytes_total", len(body))
+
+    EDRN_METRICS=metrics.prom python build_manifest.py
+"""
+
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+# Latency buckets (seconds): 0.5 ms … ~33 s, doubling
+BUCKETS = tuple(0.0005 * 2 ** i for i in range(17))
+
+_ENABLED = False
+_EXPORT_PATH: Optional[str] = None
+_LOCK = threading.Lock()
+
+_COUNTERS: Dict[Tuple[str, tuple], float] = {}
+_HISTOGRAMS: Dict[Tuple[str, tuple], "Histogram"] = {}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus-style upper bounds)."""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound containing quantile q (coarse, but allocation-free)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[idx] if idx < len(BUCKETS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min if self.count else 0.0,
+            "max": self.max,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {f"{b:g}": c for b, c in zip(BUCKETS + (float("inf"),), self.counts)},
+        }
+
+
+def _key(name: str, labels: dict) -> Tuple[str, tuple]:
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+# ---------- Switches ----------
+
+def enabled() -> bool:
+    return _ENABLED
+
+
+def enable(export_path: Optional[str] = None):
+    """Turn instrumentation on, optionally exporting to `export_path` at exit."""
+    global _ENABLED, _EXPORT_PATH
+    _ENABLED = True
+    if export_path:
+        _EXPORT_PATH = str(export_path)
+
+
+def disable():
+    global _ENABLED
+    _ENABLED = False
+
+
+def reset():
+    with _LOCK:
+        _COUNTERS.clear()
+        _HISTOGRAMS.clear()
+
+
+# ---------- Recording ----------
+
+def incr(name: str, value: float = 1, **labels):
+    """Add `value` to a counter (request counts, bytes, retries, …)."""
+    if not _ENABLED:
+        return
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def observe(name: str, seconds: float, **labels):
+    """Record one latency observation in a histogram."""
+    if not _ENABLED:
+        return
+    key = _key(name, labels)
+    with _LOCK:
+        hist = _HISTOGRAMS.get(key)
+        if hist is None:
+            hist = _HISTOGRAMS[key] = Histogram()
+        hist.observe(seconds)
+
+
+def cache_hit(name: str, hit: bool, **labels):
+    """Count a cache lookup; hit rates are derived at export time."""
+    if not _ENABLED:
+        return
+    incr(f"{name}_hits_total" if hit else f"{name}_misses_total", 1, **labels)
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = self.labels
+        if exc_type is not None:
+            labels = dict(labels, error=exc_type.__name__)
+        observe(self.name, time.perf_counter() - self.start, **labels)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **labels):
+    """Context manager timing its body into histogram `name`."""
+    if not _ENABLED:
+        return _NULL_SPAN
+    return _Span(name, labels)
+
+
+def timed(name: str, **labels):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return fn(*args, **kwargs)
+            with _Span(name, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ---------- Export ----------
+
+def snapshot() -> dict:
+    """Current metrics as a JSON-serialisable dict."""
+    def label_str(labels):
+        return ",".join(f"{k}={v}" for k, v in labels)
+
+    with _LOCK:
+        counters = {(n, l): v for (n, l), v in _COUNTERS.items()}
+        histograms = {(n, l): h.to_dict() for (n, l), h in _HISTOGRAMS.items()}
+
+    out = {"pid": os.getpid(), "timestamp": time.time(), "counters": {}, "histograms": {}, "cache_hit_rates": {}}
+    for (name, labels), value in sorted(counters.items()):
+        out["counters"].setdefault(name, {})[label_str(labels)] = value
+    for (name, labels), hist in sorted(histograms.items()):
+        out["histograms"].setdefault(name, {})[label_str(labels)] = hist
+
+    for (name, labels), hits in counters.items():
+        if not name.endswith("_hits_total"):
+            continue
+        base = name[: -len("_hits_total")]
+        misses = counters.get((f"{base}_misses_total", labels), 0)
+        out["cache_hit_rates"].setdefault(base, {})[label_str(labels)] = hits / (hits + misses)
+    for (name, labels), misses in counters.items():
+        if name.endswith("_misses_total"):
+            base = name[: -len("_misses_total")]
+            out["cache_hit_rates"].setdefault(base, {}).setdefault(label_str(labels), 0.0)
+    return out
+
+
+def _prom_labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+    items = list(labels) + list(extra or ())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def to_prometheus() -> str:
+    """Render metrics in the Prometheus text exposition format."""
+    with _LOCK:
+        counters = dict(_COUNTERS)
+        histograms = {k: (list(h.counts), h.count, h.total) for k, h in _HISTOGRAMS.items()}
+
+    lines = []
+    for name in sorted({n for n, _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        for (n, labels), value in sorted(counters.items()):
+            if n == name:
+                lines.append(f"{name}{_prom_labels(labels)} {value:g}")
+    for name in sorted({n for n, _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, labels), (counts, count, total) in sorted(histograms.items()):
+            if n != name:
+                continue
+            cumulative = 0
+            for bound, c in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_prom_labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_prom_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_prom_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path) -> Path:
+    """Write metrics to `path` (`.prom` → Prometheus text, otherwise JSON)."""
+    path = Path(str(path).format(pid=os.getpid()))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".prom":
+        path.write_text(to_prometheus())
+    else:
+        path.write_text(json.dumps(snapshot(), indent=2))
+    return path
+
+
+def _export_at_exit():
+    if _ENABLED and _EXPORT_PATH:
+        path = export(_EXPORT_PATH)
+        print(f"✓ Metrics written to: {path}")
+
+
+if os.getenv("EDRN_METRICS"):
+    enable(os.environ["EDRN_METRICS"])
+atexit.register(_export_at_exit)
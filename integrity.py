@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Integrity verification and content-hash deduplication for downloaded DICOMs.
+
+Each file is streamed from LabCAS in chunks; the SHA-256 and byte count are
+computed as the chunks arrive (no second read), the size is checked against
+the harvested FileSize, and the bytes land in a content-addressed store:
+
+    dicom_store/
+    ├── objects/ab/ab12…ef.dcm    ← one copy per distinct content
+    └── integrity.jsonl           ← one record per file ID (resume point)
+
+Suffix variants (_2.dcm, …) that are byte-identical to another file are
+recorded as duplicates and not stored again. build_manifest.py reads
+integrity.jsonl (--integrity) to add the results to its diagnostics.
+
+Usage:
+    python integrity.py                                   # PROC/MASK files of the harvested catalog
+    python integrity.py --manifest manifest.csv           # prefetch just the manifest pairs
+    python integrity.py --patient C0250 --workers 8
+    python build_manifest.py --integrity dicom_store/integrity.jsonl
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from downloads import download_to
+from file_catalog import FileCatalog
+from instrumentation import cache_hit, incr, span
+from token_manager import get_token_provider
+
+STORE_DIR = Path("dicom_store")
+INDEX_FILE = "integrity.jsonl"
+INPUT_FILE = Path("harvested_metadata/resources_by_dataset.jsonl")
+BASE_URL = "https://edrn-labcas.jpl.nasa.gov"
+
+CHUNK_SIZE = 1 << 20   # 1 MiB
+
+
+def load_index(path: Path) -> Dict[str, Dict]:
+    """file_id → latest integrity record; a torn final line is ignored"""
+    records = {}
+    path = Path(path)
+    if not path.exists():
+        return records
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[rec["file_id"]] = rec
+    return records
+
+
+class IntegrityStore:
+    """
+    Content-addressed DICOM store with streaming hash/size verification.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, root: Path = STORE_DIR, base_url: str = BASE_URL, chunk_size: int = CHUNK_SIZE):
+        self.root = Path(root)
+        self.base_url = base_url
+        self.chunk_size = chunk_size
+        (self.root / "objects").mkdir(parents=True, exist_ok=True)
+        (self.root / "tmp").mkdir(exist_ok=True)
+        self.index_path = self.root / INDEX_FILE
+        self.records = load_index(self.index_path)
+        self._by_hash: Dict[str, str] = {}
+        for rec in self.records.values():
+            if rec.get("sha256") and not rec.get("duplicate_of"):
+                self._by_hash.setdefault(rec["sha256"], rec["file_id"])
+        self._lock = threading.Lock()
+        self.tokens = get_token_provider(base_url)
+
+    # ---------- Store ----------
+
+    def object_path(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256[:2] / f"{sha256}.dcm"
+
+    def path_for(self, file_id: str) -> Optional[Path]:
+        """Local copy of a verified file (status "ok"), if present"""
+        rec = self.records.get(file_id)
+        if not rec or rec.get("status") != "ok" or not rec.get("sha256"):
+            return None
+        path = self.object_path(rec["sha256"])
+        return path if path.exists() else None
+
+    def _record(self, rec: Dict):
+        with self._lock:
+            self.records[rec["file_id"]] = rec
+            with open(self.index_path, "a") as f:
+                f.write(json.dumps(rec) + "\n")
+
+    def fetch(self, file_id: str, expected_size: Optional[int] = None, url: Optional[str] = None) -> Dict:
+        """
+        Download `file_id`, hashing and counting bytes as they stream in, and
+        file it under its SHA-256. Returns the integrity record.
+        """
+        rec = self.records.get(file_id)
+        hit = self.path_for(file_id) is not None
+        cache_hit("integrity_store_cache", hit)
+        if hit:
+            return rec
+
+        url = url or f"{self.base_url}/data-access-api/download?id={file_id}"
+        tmp = self.root / "tmp" / f"{uuid.uuid4().hex}.part"
+        try:
+            with span("integrity_fetch_seconds"), open(tmp, "wb") as out:
+                size, sha = download_to(url, out, tokens=self.tokens, chunk_size=self.chunk_size,
+                                        hash_name="sha256")
+        except Exception as e:
+            tmp.unlink(missing_ok=True)
+            incr("integrity_files_total", status="error")
+            rec = {"file_id": file_id, "status": "error", "error": f"{type(e).__name__}: {e}",
+                   "expected_size": expected_size}
+            self._record(rec)
+            return rec
+
+        status = "ok" if expected_size is None or size == expected_size else "size_mismatch"
+        dest = self.object_path(sha)
+        with self._lock:
+            first = self._by_hash.setdefault(sha, file_id)
+            if dest.exists():
+                tmp.unlink()
+            else:
+                dest.parent.mkdir(exist_ok=True)
+                os.replace(tmp, dest)
+        rec = {"file_id": file_id, "sha256": sha, "size": size, "expected_size": expected_size,
+               "status": status, "duplicate_of": first if first != file_id else None}
+        incr("integrity_files_total", status=status)
+        if rec["duplicate_of"]:
+            incr("integrity_duplicates_total")
+            incr("integrity_duplicate_bytes_total", size)
+        self._record(rec)
+        return rec
+
+    def duplicates(self) -> Dict[str, List[str]]:
+        """sha256 → file IDs sharing that content (only groups of two or more)"""
+        groups: Dict[str, List[str]] = {}
+        for rec in self.records.values():
+            if rec.get("sha256"):
+                groups.setdefault(rec["sha256"], []).append(rec["file_id"])
+        return {sha: sorted(ids) for sha, ids in groups.items() if len(ids) > 1}
+
+    def verify(self, files: Iterable, workers: int = 4) -> Dict[str, int]:
+        """
+        Fetch and verify concurrently; `files` are FileRecords or
+        (file_id, expected_size, url) tuples. Returns status counts.
+        """
+        files = [f if isinstance(f, tuple) else (f.file_id, f.file_size, None) for f in files]
+        counts: Dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(self.fetch, *f) for f in files]
+            for n, fut in enumerate(as_completed(futures), 1):
+                rec = fut.result()
+                status = "duplicate" if rec.get("duplicate_of") else rec["status"]
+                counts[status] = counts.get(status, 0) + 1
+                if rec["status"] != "ok":
+                    print(f"  ⚠ {rec['file_id']}: {rec['status']} {rec.get('error') or ''}".rstrip())
+                if n % 100 == 0 or n == len(files):
+                    print(f"  └─ Verified {n}/{len(files)} files...")
+        return counts
+
+
+def select_files(catalog: FileCatalog, kinds=("PROC", "MASK"), patients: Optional[Iterable[str]] = None):
+    """DICOM files in the PROC/MASK datasets of a catalog, optionally for some patients only"""
+    wanted = {p.upper() for p in patients} if patients else None
+    for dataset_id, _meta, files in catalog.iter_datasets():
+        parts = dataset_id.split("/")
+        if parts[-1] not in kinds:
+            continue
+        if wanted is not None and not wanted.intersection(p.upper() for p in parts):
+            continue
+        for f in files:
+            if f.name.lower().endswith(".dcm"):
+                yield f
+
+
+def files_from_manifest(path: Path, catalog: Optional[FileCatalog] = None):
+    """(file_id, expected_size, url) for every PROC/MASK URL in a manifest CSV"""
+    sizes = {f.file_id: f.file_size for f in catalog.iter_files()} if catalog is not None else {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            for col in ("proc_url", "mask_url"):
+                url = row[col]
+                file_id = url.split("?id=", 1)[-1]
+                yield file_id, sizes.get(file_id), url
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Download, verify and deduplicate PROC/MASK DICOMs")
+    p.add_argument("--input", "-i", type=Path, default=INPUT_FILE, help="Harvested catalog (.json or .jsonl)")
+    p.add_argument("--manifest", "-m", type=Path, default=None,
+                   help="Prefetch the pairs of this manifest CSV instead of every catalog file "
+                        "(sizes are checked when the catalog is present)")
+    p.add_argument("--store", type=Path, default=STORE_DIR, help="Content-addressed store directory")
+    p.add_argument("--patient", "-p", action="append", default=None, help="Only this patient (repeatable)")
+    p.add_argument("--limit", type=int, default=None, help="Verify at most this many files")
+    p.add_argument("--workers", type=int, default=4, help="Concurrent downloads")
+    p.add_argument("--base-url", default=os.getenv("LABCAS_BASE_URL", BASE_URL), help="LabCAS server")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.input = FileCatalog.resolve(args.input)
+    catalog = FileCatalog.open(args.input, args.base_url, keep_metadata=False) if args.input.exists() else None
+    if args.manifest:
+        files = list(files_from_manifest(args.manifest, catalog))
+        if args.patient:
+            wanted = {p.upper() for p in args.patient}
+            files = [f for f in files if wanted.intersection(seg.upper() for seg in f[0].split("/"))]
+    elif catalog is None:
+        raise SystemExit(f"Input file not found: {args.input}")
+    else:
+        files = list(select_files(catalog, patients=args.patient))
+    if args.limit is not None:
+        files = files[:args.limit]
+
+    store = IntegrityStore(args.store, args.base_url)
+    print(f"Verifying {len(files)} files into {store.root} ({len(store.records)} already indexed)...")
+    counts = store.verify(files, workers=args.workers)
+
+    dupes = store.duplicates()
+    print(f"\n✓ Verification complete: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    print(f"Duplicate content groups: {len(dupes)} "
+          f"({sum(len(ids) - 1 for ids in dupes.values())} redundant copies not stored)")
+    print(f"Index: {store.index_path}")
+    if counts.get("size_mismatch") or counts.get("error"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,21 +3,44 @@ LabCAS API Client for EDRN
 Based on the existing notebook implementation with enhanced error handling
 """
 
-import os
+import copy
 import requests
+import threading
 import time
-from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from typing import Dict, List, Optional
 
+from instrumentation import incr, span
+from token_manager import TokenProvider, get_jwt_token, get_token_provider
 
-def get_jwt_token(username: str, password: str, base_url: str = "https://edrn-labcas.jpl.nasa.gov") -> str:
+
+DEFAULT_REQUESTS_PER_SECOND = 5.0   # pacing of the pages fanned out after the first one
+
+
+class ResultSetDriftError(RuntimeError):
+    """The Solr result set changed while it was being paged through"""
+
+
+class RateLimiter:
     """
-    Authenticate with LabCAS and return a JWT token using POST method.
+    Space request starts at least 1/rate seconds apart, across threads
     """
-    url = f"{base_url}/data-access-api/auth"
-    resp = requests.post(url, auth=HTTPBasicAuth(username, password))
-    resp.raise_for_status()
-    return resp.text.strip()
+    
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+    
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
 
 
 class LabCASClient:
@@ -25,44 +48,66 @@ class LabCASClient:
     LabCAS API Client with automatic token refresh and POST fallback
     """
     
-    def __init__(self, jwt_token: str, base_url: str = "https://edrn-labcas.jpl.nasa.gov"):
+    def __init__(self, jwt_token: Optional[str] = None, base_url: str = "https://edrn-labcas.jpl.nasa.gov",
+                 max_workers: int = 4, requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+                 pool_size: Optional[int] = None, token_provider: Optional[TokenProvider] = None):
         self.base_url = base_url
-        self.jwt_token = jwt_token
-        self.username = os.getenv('LABCAS_USERNAME')
-        self.password = os.getenv('LABCAS_PASSWORD')
-        self.token_timestamp = time.time()
-        self.token_max_age = 1800  # Refresh after 30 minutes
+        # Shared per base URL, refreshed in the background ahead of expiry
+        self.tokens = token_provider or get_token_provider(base_url, token=jwt_token)
+        
+        # Concurrency for paginated listings; requests_per_second (None or 0 = unlimited)
+        # only paces the pages fanned out after the first one
+        self.max_workers = max_workers
+        self.requests_per_second = requests_per_second
+        self.rate_limiter = RateLimiter(requests_per_second)
         
-        self.headers = {
-            "Authorization": f"Bearer {jwt_token}"
-        }
-    
-    def refresh_token(self):
-        """Refresh JWT token"""
-        print("⟳ Refreshing JWT token...")
-        self.jwt_token = get_jwt_token(self.username, self.password, self.base_url)
-        self.headers["Authorization"] = f"Bearer {self.jwt_token}"
-        self.token_timestamp = time.time()
-        print("✓ Token refreshed")
-    
-    def _ensure_valid_token(self):
-        """Check if token needs refresh based on age"""
-        if time.time() - self.token_timestamp > self.token_max_age:
-            self.refresh_token()
+        # One keep-alive connection pool shared by every thread using this client
+        pool_size = pool_size or max(10, max_workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def with_own_rate_limit(self) -> "LabCASClient":
+        """Copy sharing this client's session and token, with a separate rate limiter"""
+        clone = copy.copy(self)
+        clone.rate_limiter = RateLimiter(self.requests_per_second)
+        return clone
+    
+    @property
+    def jwt_token(self) -> str:
+        return self.tokens.token
+    
+    @property
+    def headers(self) -> Dict[str, str]:
+        return self.tokens.headers()
+    
+    def refresh_token(self, stale_token: Optional[str] = None):
+        """
+        Refresh JWT token. If `stale_token` is given and another thread has
+        already replaced it, the refresh is skipped.
+        """
+        self.tokens.refresh(stale_token=stale_token)
     
     def _get(self, path: str, params: dict, use_post: bool = False):
         """
         Make API request with automatic token refresh and POST fallback
         """
-        self._ensure_valid_token()
+        token = self.jwt_token
+        headers = {"Authorization": f"Bearer {token}"}
         
         url = f"{self.base_url}{path}"
+        endpoint = path.rsplit("/data-access-api/", 1)[-1]
+        method = "POST" if use_post else "GET"
         
         try:
-            if use_post:
-                resp = requests.post(url, headers=self.headers, params=params, timeout=60)
-            else:
-                resp = requests.get(url, headers=self.headers, params=params, timeout=60)
+            with span("labcas_request_seconds", endpoint=endpoint, method=method):
+                if use_post:
+                    resp = self.session.post(url, headers=headers, params=params, timeout=60)
+                else:
+                    resp = self.session.get(url, headers=headers, params=params, timeout=60)
+            incr("labcas_requests_total", endpoint=endpoint, status=resp.status_code)
+            incr("labcas_response_bytes_total", len(resp.content), endpoint=endpoint)
             
             resp.raise_for_status()
             return resp.json()
@@ -71,12 +116,16 @@ class LabCASClient:
             if e.response.status_code == 401:
                 # Token expired, refresh and retry
                 print("⟳ Token expired (401), refreshing...")
-                self.refresh_token()
+                incr("labcas_retries_total", endpoint=endpoint, reason="401")
+                headers = {"Authorization": f"Bearer {self.tokens.refresh(stale_token=token)}"}
                 
-                if use_post:
-                    resp = requests.post(url, headers=self.headers, params=params, timeout=60)
-                else:
-                    resp = requests.get(url, headers=self.headers, params=params, timeout=60)
+                with span("labcas_request_seconds", endpoint=endpoint, method=method):
+                    if use_post:
+                        resp = self.session.post(url, headers=headers, params=params, timeout=60)
+                    else:
+                        resp = self.session.get(url, headers=headers, params=params, timeout=60)
+                incr("labcas_requests_total", endpoint=endpoint, status=resp.status_code)
+                incr("labcas_response_bytes_total", len(resp.content), endpoint=endpoint)
                 
                 resp.raise_for_status()
                 return resp.json()
@@ -84,6 +133,7 @@ class LabCASClient:
                 # If GET fails with other error and use_post is False, try POST
                 if not use_post:
                     print(f"⚠ GET failed with {e.response.status_code}, trying POST...")
+                    incr("labcas_retries_total", endpoint=endpoint, reason="post_fallback")
                     return self._get(path, params, use_post=True)
                 raise
         
@@ -91,6 +141,7 @@ class LabCASClient:
             # For other errors, try POST if not already using it
             if not use_post:
                 print(f"⚠ GET failed with {type(e).__name__}, trying POST...")
+                incr("labcas_retries_total", endpoint=endpoint, reason="post_fallback")
                 return self._get(path, params, use_post=True)
             raise
     
@@ -108,8 +159,39 @@ class LabCASClient:
             }
         )["response"]["docs"]
     
+    def list_all_collections(self, batch_size=100) -> List[Dict]:
+        """List ALL collections (paged, not just the first `rows`)"""
+        return self.paginate(
+            "/data-access-api/collections/select",
+            "*:*",
+            batch_size=batch_size,
+            label="collections",
+        )
+    
+    def get_collection(self, collection_id: str) -> Optional[Dict]:
+        """Fetch a single collection document by ID"""
+        docs = self._get(
+            "/data-access-api/collections/select",
+            {
+                "q": f'id:"{collection_id}"',
+                "wt": "json",
+                "rows": 1,
+                "start": 0
+            }
+        )["response"]["docs"]
+        return docs[0] if docs else None
+    
     # ---------- Datasets ----------
     
+    def list_all_datasets_for_collection(self, collection_id: str, batch_size=1000) -> List[Dict]:
+        """List ALL datasets for a collection (no 10k cap)"""
+        return self.paginate(
+            "/data-access-api/datasets/select",
+            f'CollectionId:"{collection_id}"',
+            batch_size=batch_size,
+            label="datasets",
+        )
+    
     def list_datasets_for_collection(self, collection_id: str, rows=10000, start=0):
         """List all datasets for a collection"""
         return self._get(
@@ -138,47 +220,112 @@ class LabCASClient:
     
     def list_all_files_for_dataset(self, dataset_id: str, batch_size=1000) -> List[Dict]:
         """
-        List ALL files for a dataset with automatic pagination and incremental results
+        List ALL files for a dataset with automatic (parallel) pagination
         """
-        all_files = []
-        start = 0
-        
-        while True:
+        return self.paginate(
+            "/data-access-api/files/select",
+            f'DatasetId:"{dataset_id}"',
+            batch_size=batch_size,
+            label="files",
+        )
+    
+    def search_files(self, q: str, batch_size=1000) -> List[Dict]:
+        """List ALL files matching an arbitrary Solr query (e.g. from build_file_query)"""
+        return self.paginate(
+            "/data-access-api/files/select",
+            q,
+            batch_size=batch_size,
+            label="files",
+        )
+    
+    def get_datasets(self, dataset_ids: List[str], batch_size=1000) -> List[Dict]:
+        """Fetch dataset documents by ID"""
+        if not dataset_ids:
+            return []
+        ids = " OR ".join(f'"{did}"' for did in dataset_ids)
+        return self.paginate(
+            "/data-access-api/datasets/select",
+            f"id:({ids})",
+            batch_size=batch_size,
+            label="datasets",
+        )
+    
+    # ---------- Pagination ----------
+    
+    def _fetch_page(self, path: str, q: str, start: int, rows: int, max_retries: int,
+                    throttle: bool = True) -> dict:
+        """Fetch one page (under the rate limit if `throttle`), retrying transient failures"""
+        for attempt in range(max_retries + 1):
+            if throttle or attempt:
+                self.rate_limiter.wait()
             try:
-                result = self._get(
-                    "/data-access-api/files/select",
-                    {
-                        "q": f'DatasetId:"{dataset_id}"',
-                        "wt": "json",
-                        "rows": batch_size,
-                        "start": start
-                    }
-                )
-                
-                docs = result["response"]["docs"]
-                num_found = result["response"]["numFound"]
-                
-                if not docs:
-                    break
-                
-                all_files.extend(docs)
-                start += len(docs)
-                
-                print(f"  └─ Retrieved {len(all_files)}/{num_found} files...")
-                
-                if len(all_files) >= num_found:
-                    break
-                
-                # Small delay to avoid rate limiting
-                time.sleep(0.3)
-                
+                return self._get(path, {"q": q, "wt": "json", "rows": rows, "start": start})["response"]
             except Exception as e:
-                print(f"⚠ Error retrieving files at offset {start}: {e}")
-                # Refresh token and retry
-                self.refresh_token()
-                continue
+                if attempt == max_retries:
+                    raise
+                print(f"⚠ Error retrieving page at offset {start}: {e}")
+                incr("labcas_retries_total", endpoint=path.rsplit("/data-access-api/", 1)[-1], reason="page_error")
+                time.sleep(min(2 ** attempt * 0.5, 10))
+    
+    def paginate(self, path: str, q: str, batch_size: int = 1000, label: str = "docs",
+                 max_retries: int = 3, max_restarts: int = 2) -> List[Dict]:
+        """
+        Fetch every doc matching `q`.
+        
+        The first page reveals numFound, so all remaining offsets are known up
+        front; they are requested concurrently (bounded by max_workers and the
+        client's rate limiter) and reassembled in offset order. The first page
+        is not rate limited, so single-page listings never wait. If numFound
+        changes between pages, or the assembled result has the wrong length
+        or duplicate IDs, the crawl restarts; after `max_restarts` restarts a
+        ResultSetDriftError is raised.
+        """
+        endpoint = path.rsplit("/data-access-api/", 1)[-1]
+        
+        for restart in range(max_restarts + 1):
+            first = self._fetch_page(path, q, 0, batch_size, max_retries, throttle=False)
+            num_found = first["numFound"]
+            docs = first["docs"]
+            incr("labcas_pages_total", endpoint=endpoint)
+            
+            # The server may cap rows below batch_size; page by what it actually returns
+            page_size = len(docs) if 0 < len(docs) < min(batch_size, num_found) else batch_size
+            offsets = list(range(len(docs), num_found, page_size)) if docs else []
+            
+            pages = {0: docs}
+            drift = None
+            if offsets:
+                workers = max(1, min(self.max_workers, len(offsets)))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    futures = {
+                        pool.submit(self._fetch_page, path, q, off, page_size, max_retries): off
+                        for off in offsets
+                    }
+                    retrieved = len(docs)
+                    for fut in as_completed(futures):
+                        page = fut.result()
+                        incr("labcas_pages_total", endpoint=endpoint)
+                        pages[futures[fut]] = page["docs"]
+                        retrieved += len(page["docs"])
+                        if page["numFound"] != num_found:
+                            drift = f"numFound changed from {num_found} to {page['numFound']}"
+                        print(f"  └─ Retrieved {retrieved}/{num_found} {label}...")
+            
+            result = [doc for off in sorted(pages) for doc in pages[off]]
+            if drift is None:
+                ids = [d.get("id") for d in result]
+                if len(result) != num_found:
+                    drift = f"assembled {len(result)} of {num_found} {label}"
+                elif len(set(ids)) != len(ids):
+                    drift = f"{len(ids) - len(set(ids))} duplicate {label} across pages"
+            
+            if drift is None:
+                return result
+            
+            incr("labcas_result_drift_total", endpoint=endpoint)
+            print(f"⚠ Result set drift for {q}: {drift} (attempt {restart + 1}/{max_restarts + 1})")
         
-        return all_files
+        raise ResultSetDriftError(f"Result set for {q} kept changing during pagination: {drift}")
     
     @staticmethod
     def build_download_url(file_id: str, base_url: str = "https://edrn-labcas.jpl.nasa.gov") -> str:
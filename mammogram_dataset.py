@@ -0,0 +1,221 @@
+"""
+PyTorch Dataset for PROC/MASK mammogram pairs listed in manifest.csv.
+
+DICOMs are streamed on-the-fly from authenticated LabCAS URLs (see
+downloads.py: chunked, resumable, bounded memory). The JWT comes from the
+shared token_manager provider, obtained lazily and refreshed in the
+background per process, so the dataset is safe to use from DataLoader
+workers and from every rank of a distributed job.
+
+ShardedMammogramDataset reads the same pairs from tar shards written by
+shards.py instead, for sequential high-throughput reads.
+"""
+
+import io
+import json
+import os
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+import pydicom
+import torch
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+from torchvision import transforms
+
+import downloads
+from instrumentation import span, timed
+from pair_stats import pair_key
+from shards import SHUFFLE_BUFFER, SHUFFLE_BUFFER_BYTES, ShardReader
+from token_manager import get_token_provider
+
+LABCAS_BASE = os.getenv("LABCAS_BASE_URL", "https://edrn-labcas.jpl.nasa.gov")
+IMG_SIZE = 256   # resize all images to 256×256 for uniform batching
+
+
+def download_dicom_bytes(url: str) -> bytes:
+    """Download a DICOM from an authenticated LabCAS URL and return raw bytes."""
+    with downloads.download(url, tokens=get_token_provider(LABCAS_BASE)) as f:
+        return f.read()
+
+
+def decode_dicom(f: BinaryIO, value_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    Read a DICOM from a file object and return a float32 array normalised to
+    [0, 1]. A precomputed (min, max) from the pair_stats sidecar skips the
+    min/max scans.
+    """
+    with span("dicom_decode_seconds"):
+        ds  = pydicom.dcmread(f)
+        arr = ds.pixel_array.astype(np.float32)
+    if value_range is not None:
+        lo, hi = value_range
+        arr -= lo
+        if hi > lo:
+            arr *= 1.0 / (hi - lo)
+        return arr
+    arr -= arr.min()
+    if arr.max() > 0:
+        arr /= arr.max()
+    return arr
+
+
+def load_dicom_as_array(url: str, buffer: Optional[BinaryIO] = None,
+                        value_range: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    """
+    Download a DICOM from `url` and return a float32 array normalised to [0, 1].
+
+    The body is streamed into `buffer` (a reusable file object) or a spooled
+    temporary file, which pydicom then reads in place. Local paths (snapshot
+    manifests, see snapshot.py) are read straight from disk.
+    """
+    f = downloads.download(url, buffer=buffer, tokens=get_token_provider(LABCAS_BASE))
+    try:
+        return decode_dicom(f, value_range)
+    finally:
+        if buffer is None:
+            f.close()
+
+
+def _range(stats: Optional[Dict], side: str) -> Optional[Tuple[float, float]]:
+    return None if stats is None else (stats[side]['min'], stats[side]['max'])
+
+
+def _stats_for(stats: Dict[str, Dict], row: Dict) -> Optional[Dict]:
+    st = stats.get(pair_key(row))
+    # Only trust the sidecar for the exact files it was computed from
+    if st is not None and (st['proc_url'], st['mask_url']) != (row['proc_url'], row['mask_url']):
+        return None
+    return st
+
+
+class MammogramDataset(Dataset):
+    """
+    PyTorch Dataset that downloads mammogram PROC/MASK DICOM pairs on-the-fly
+    from authenticated LabCAS URLs.
+
+    `rows` is a list of manifest rows (dicts with proc_url, mask_url,
+    patient_id, view, group) or a pandas DataFrame with those columns.
+    `stats` is an optional pair_stats sidecar (pair_stats.load_stats) used
+    for normalisation without full-array min/max scans.
+
+    Each item returns:
+        image  : FloatTensor (1, IMG_SIZE, IMG_SIZE)  – normalised to [0, 1]
+        mask   : FloatTensor (1, IMG_SIZE, IMG_SIZE)  – binary {0, 1}
+        meta   : dict with patient_id, view, group
+    """
+
+    def __init__(self, rows, img_size: int = IMG_SIZE, augment: bool = False,
+                 stats: Optional[Dict[str, Dict]] = None):
+        if hasattr(rows, "to_dict"):
+            rows = rows.to_dict("records")
+        self.rows: List[Dict] = list(rows)
+        self.img_size = img_size
+        self.augment  = augment
+        self.stats    = stats or {}
+
+        self.resize = transforms.Resize(
+            (img_size, img_size),
+            interpolation=transforms.InterpolationMode.BILINEAR
+        )
+        self.resize_nn = transforms.Resize(
+            (img_size, img_size),
+            interpolation=transforms.InterpolationMode.NEAREST
+        )
+
+    def __len__(self):
+        return len(self.rows)
+
+    @timed("dataset_getitem_seconds")
+    def __getitem__(self, idx: int):
+        row  = self.rows[idx]
+        st   = _stats_for(self.stats, row)
+        proc = load_dicom_as_array(row['proc_url'], value_range=_range(st, 'proc'))
+        mask = load_dicom_as_array(row['mask_url'], value_range=_range(st, 'mask'))
+        return self.to_item(proc, mask, row)
+
+    def to_item(self, proc: np.ndarray, mask: np.ndarray, row: Dict):
+        """Resize, binarise and (optionally) augment one decoded pair"""
+        proc_t = torch.from_numpy(proc).unsqueeze(0)   # (1, H, W)
+        mask_t = torch.from_numpy(mask).unsqueeze(0)
+
+        proc_t = self.resize(proc_t)
+        mask_t = self.resize_nn(mask_t)
+
+        # Binarise mask
+        mask_t = (mask_t > 0.5).float()
+
+        # Simple augmentation (horizontal flip)
+        if self.augment and torch.rand(1).item() > 0.5:
+            proc_t = torch.flip(proc_t, dims=[-1])
+            mask_t = torch.flip(mask_t, dims=[-1])
+
+        meta = {
+            'patient_id': row['patient_id'],
+            'view'      : row['view'],
+            'group'     : row['group'],
+        }
+        return proc_t, mask_t, meta
+
+
+class ShardedMammogramDataset(IterableDataset):
+    """
+    Iterable counterpart of MammogramDataset that streams pairs from tar
+    shards written by shards.py, reading each shard sequentially through a
+    shuffle buffer instead of fetching every DICOM on its own.
+
+    Each epoch's pairs are divided among all ranks × DataLoader workers
+    (see ShardReader), so every pair is read once per epoch. Every rank
+    yields the same number of pairs, a whole number of batches
+    (ceil(pairs / world_size), rounded up to `batch_size`, padded with
+    pairs from the start of the epoch like DistributedSampler), so
+    collectives stay in step. Each worker holds up to `shuffle_buffer`
+    pairs / `shuffle_buffer_bytes` bytes for shuffling.
+    """
+
+    def __init__(self, root, img_size: int = IMG_SIZE, augment: bool = False,
+                 stats: Optional[Dict[str, Dict]] = None, shuffle_buffer: int = SHUFFLE_BUFFER,
+                 shuffle_buffer_bytes: Optional[int] = SHUFFLE_BUFFER_BYTES,
+                 seed: int = 0, rank: int = 0, world_size: int = 1, batch_size: int = 1):
+        self.root = root
+        self.pairs = MammogramDataset([], img_size=img_size, augment=augment, stats=stats)
+        self.shuffle_buffer = shuffle_buffer
+        self.shuffle_buffer_bytes = shuffle_buffer_bytes
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.batch_size = batch_size
+        total = len(ShardReader(root))
+        self.rank_batches = -(-total // (world_size * batch_size))
+        self.epoch = 0
+        self._iterations = 0
+
+    def __len__(self):
+        return self.rank_batches * self.batch_size
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+        self._iterations = 0
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker, num_workers = (info.id, info.num_workers) if info else (0, 1)
+        # Pairs read by each (rank, worker) slot, in slot order
+        counts = [
+            (self.rank_batches // num_workers + (w < self.rank_batches % num_workers)) * self.batch_size
+            for _ in range(self.world_size) for w in range(num_workers)
+        ]
+        # Persistent workers keep their own copy of the dataset and never see
+        # set_epoch(), so also advance the epoch once per pass
+        epoch = self.epoch + self._iterations
+        self._iterations += 1
+
+        reader = ShardReader(self.root, shuffle_buffer=self.shuffle_buffer,
+                             shuffle_buffer_bytes=self.shuffle_buffer_bytes, seed=self.seed,
+                             slot=self.rank * num_workers + worker, num_slots=len(counts), num_samples=counts)
+        reader.set_epoch(epoch)
+        for sample in reader:
+            row  = json.loads(sample['json'])
+            st   = _stats_for(self.pairs.stats, row)
+            proc = decode_dicom(io.BytesIO(sample['proc.dcm']), _range(st, 'proc'))
+            mask = decode_dicom(io.BytesIO(sample['mask.dcm']), _range(st, 'mask'))
+            yield self.pairs.to_item(proc, mask, row)
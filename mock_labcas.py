@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the LabCAS data-access API, serving a synthetic
+breast-density collection.
+
+Endpoints (all under /data-access-api):
+  - auth               POST with HTTP Basic auth → JWT-shaped token (with `exp`)
+  - collections/select
+  - datasets/select    Solr-style q/start/rows paging, JSON response
+  - files/select
+  - download?id=...    synthetic DICOM bytes (Range requests supported)
+
+The collection mirrors the real layout: <collection>/<patient>/{RAW,PROC,MASK}
+leaf datasets under one dataset per patient, plus a Documentation dataset.
+Latency, error rate (HTTP 503), spurious 401 frequency and truncated
+downloads (connection dropped mid-body) are configurable.
+
+Usage:
+    python mock_labcas.py --port 8080 --scale 1 --latency 0.02 --error-rate 0.01
+    LABCAS_USERNAME=mock LABCAS_PASSWORD=mock ...  (any credentials are accepted)
+
+    from mock_labcas import MockLabCAS
+    with MockLabCAS(scale=10) as server:
+        client = LabCASClient(get_jwt_token("u", "p", server.base_url), base_url=server.base_url)
+"""
+
+import argparse
+import base64
+import fnmatch
+import hashlib
+import json
+import random
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+COLLECTION_ID = "Automated_Quantitative_Measures_of_Breast_Density_Data"
+
+# Size of the real collection: 636 patients, ~2.4k PROC/MASK pairs
+BASE_PATIENTS = 636
+# Patient IDs must stay within [CN]\d{4} to remain parseable by build_manifest
+MAX_PATIENTS = 20000
+
+VIEWS = ("LCC", "LMLO", "RCC", "RMLO")
+KINDS = ("RAW", "PROC", "MASK")
+FILE_PREFIX = {"RAW": "MG_RAW", "PROC": "MG_PRO", "MASK": "MASK_PRO"}
+_VARIANT_RE = re.compile(r"_(\d+)\.dcm$")
+
+
+# ---------- Synthetic DICOM ----------
+
+_LOW_NIBBLE = bytes(i & 0x0F for i in range(256))
+
+
+def _element(group: int, elem: int, vr: str, value: bytes) -> bytes:
+    if len(value) % 2:
+        value += b"\x00" if vr in ("UI", "OB") else b" "
+    head = struct.pack("<HH", group, elem) + vr.encode("ascii")
+    if vr in ("OB", "OW", "OF", "SQ", "UT", "UN"):
+        return head + b"\x00\x00" + struct.pack("<I", len(value)) + value
+    return head + struct.pack("<H", len(value)) + value
+
+
+def synthetic_dicom(file_id: str, rows: int = 64, cols: int = 64, mask: bool = False) -> bytes:
+    """Minimal Explicit VR Little Endian mammogram DICOM with deterministic pixels."""
+    seed = int.from_bytes(hashlib.sha256(file_id.encode()).digest()[:8], "little")
+    rng = random.Random(seed)
+    uid = f"1.2.826.0.1.3680043.10.1.{seed % 10 ** 12:012d}"
+    sop_class = "1.2.840.10008.5.1.4.1.1.1.2"
+
+    if mask:
+        cy, cx = rows * rng.uniform(0.3, 0.7), cols * rng.uniform(0.3, 0.7)
+        ry, rx = rows * rng.uniform(0.1, 0.3), cols * rng.uniform(0.1, 0.3)
+        pixels = array("H", (
+            1 if ((y - cy) / ry) ** 2 + ((x - cx) / rx) ** 2 <= 1 else 0
+            for y in range(rows) for x in range(cols)
+        ))
+        if sys.byteorder != "little":
+            pixels.byteswap()
+        pixel_bytes = pixels.tobytes()
+    else:
+        # 12-bit noise: clear the high nibble of every little-endian high byte
+        raw = bytearray(rng.randbytes(rows * cols * 2))
+        raw[1::2] = bytes(raw[1::2]).translate(_LOW_NIBBLE)
+        pixel_bytes = bytes(raw)
+
+    meta = b"".join([
+        _element(0x0002, 0x0001, "OB", b"\x00\x01"),
+        _element(0x0002, 0x0002, "UI", sop_class.encode()),
+        _element(0x0002, 0x0003, "UI", uid.encode()),
+        _element(0x0002, 0x0010, "UI", b"1.2.840.10008.1.2.1"),
+    ])
+    patient = file_id.rsplit("/", 1)[-1].split("_", 1)[0]
+    body = b"".join([
+        _element(0x0008, 0x0016, "UI", sop_class.encode()),
+        _element(0x0008, 0x0018, "UI", uid.encode()),
+        _element(0x0008, 0x0060, "CS", b"MG"),
+        _element(0x0010, 0x0020, "LO", patient.encode()),
+        _element(0x0028, 0x0002, "US", struct.pack("<H", 1)),
+        _element(0x0028, 0x0004, "CS", b"MONOCHROME2"),
+        _element(0x0028, 0x0010, "US", struct.pack("<H", rows)),
+        _element(0x0028, 0x0011, "US", struct.pack("<H", cols)),
+        _element(0x0028, 0x0100, "US", struct.pack("<H", 16)),
+        _element(0x0028, 0x0101, "US", struct.pack("<H", 12)),
+        _element(0x0028, 0x0102, "US", struct.pack("<H", 11)),
+        _element(0x0028, 0x0103, "US", struct.pack("<H", 0)),
+        _element(0x7FE0, 0x0010, "OW", pixel_bytes),
+    ])
+    group_length = _element(0x0002, 0x0000, "UL", struct.pack("<I", len(meta)))
+    return b"\x00" * 128 + b"DICM" + group_length + meta + body
+
+
+# ---------- Synthetic collection ----------
+
+class SyntheticCollection:
+    """
+    Deterministic synthetic collection at `scale` × the real collection size.
+
+    Scale is applied to the patient count up to MAX_PATIENTS; beyond that,
+    the remaining factor becomes extra numbered variants (_2.dcm, _3.dcm, …)
+    per view so the number of files keeps growing linearly.
+    """
+
+    def __init__(self, scale: float = 1.0, collection_id: str = COLLECTION_ID,
+                 image_size: int = 64, seed: int = 0):
+        self.collection_id = collection_id
+        self.image_size = image_size
+        self.seed = seed
+
+        wanted = max(1, int(round(BASE_PATIENTS * scale)))
+        n_patients = min(wanted, MAX_PATIENTS)
+        self.variants = max(1, int(round(wanted / n_patients)))
+        half = (n_patients + 1) // 2
+        self.patients = [f"C{i:04d}" for i in range(half)] + [f"N{i:04d}" for i in range(n_patients - half)]
+
+        # Fixed-width UIDs and patient IDs make every synthetic DICOM the same size
+        probe = f"{collection_id}/{self.patients[0]}/PROC/{self.patients[0]}_MG_PRO_LCC.dcm"
+        self.file_size = len(synthetic_dicom(probe, image_size, image_size))
+
+    # ---- documents ----
+
+    def collection_doc(self) -> Dict:
+        return {
+            "id": self.collection_id,
+            "CollectionName": "Automated Quantitative Measures of Breast Density Data - Collection 2 (synthetic)",
+            "CollectionDescription": "Synthetic stand-in served by mock_labcas.py",
+            "FileType": ["dicom"],
+        }
+
+    def _views_for(self, patient: str) -> Tuple[str, ...]:
+        # ~4% of patient/views lack one of PROC/MASK, like the real half pairs
+        rng = random.Random(f"{self.seed}:{patient}")
+        return tuple(v for v in VIEWS if rng.random() > 0.04)
+
+    def dataset_docs(self) -> Iterator[Dict]:
+        cid = self.collection_id
+        yield {"id": f"{cid}/Documentation", "CollectionId": [cid], "DatasetName": ["Documentation"]}
+        for pid in self.patients:
+            patient_ds = f"{cid}/{pid}"
+            yield {"id": patient_ds, "CollectionId": [cid], "DatasetName": [pid]}
+            for kind in KINDS:
+                yield {
+                    "id": f"{patient_ds}/{kind}",
+                    "CollectionId": [cid],
+                    "DatasetName": [kind],
+                    "DatasetParentId": [patient_ds],
+                }
+
+    def _file_doc(self, dataset_id: str, name: str) -> Dict:
+        return {
+            "id": f"{dataset_id}/{name}",
+            "name": [name],
+            "FileName": [name],
+            "FileType": ["dicom"],
+            "FileSize": [self.file_size],
+            "DatasetId": [dataset_id],
+            "CollectionId": [self.collection_id],
+        }
+
+    def files_for_dataset(self, dataset_id: str) -> List[Dict]:
+        parts = dataset_id.split("/")
+        if len(parts) != 3 or parts[0] != self.collection_id or parts[2] not in KINDS:
+            if dataset_id == f"{self.collection_id}/Documentation":
+                return [self._file_doc(dataset_id, "README.pdf")]
+            return []
+        pid, kind = parts[1], parts[2]
+        views = self._views_for(pid)
+        if kind == "MASK":
+            # Drop one view's mask for a few patients to create half pairs
+            if views and random.Random(f"{self.seed}:{pid}:mask").random() < 0.04:
+                views = views[:-1]
+        docs = []
+        for view in views:
+            base = f"{pid}_{FILE_PREFIX[kind]}_{view}"
+            docs.append(self._file_doc(dataset_id, f"{base}.dcm"))
+            for k in range(2, self.variants + 1):
+                docs.append(self._file_doc(dataset_id, f"{base}_{k}.dcm"))
+        return docs
+
+    def file_docs(self) -> Iterator[Dict]:
+        yield from self.files_for_dataset(f"{self.collection_id}/Documentation")
+        for pid in self.patients:
+            for kind in KINDS:
+                yield from self.files_for_dataset(f"{self.collection_id}/{pid}/{kind}")
+
+    def file_content(self, file_id: str) -> Optional[bytes]:
+        if not file_id.startswith(self.collection_id + "/") or not file_id.endswith(".dcm"):
+            return None
+        # Even-numbered variants (_2.dcm, _4.dcm, …) are byte-identical re-uploads of the clean file
+        m = _VARIANT_RE.search(file_id)
+        if m and int(m.group(1)) % 2 == 0:
+            file_id = file_id[:m.start()] + ".dcm"
+        return synthetic_dicom(file_id, self.image_size, self.image_size, mask="/MASK/" in file_id)
+
+
+# ---------- Solr-style query matching ----------
+
+_CLAUSE_RE = re.compile(r'(?P<field>[A-Za-z_]+):(?:"(?P<quoted>[^"]*)"|\((?P<group>[^)]*)\)|(?P<bare>\S+))')
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def parse_query(q: str) -> List[Tuple[str, List[str]]]:
+    """
+    Parse the subset of Solr syntax used by the clients: `*:*`,
+    `Field:"value"`, `Field:value*` and `Field:("a" OR "b")`, joined by AND.
+    """
+    q = (q or "*:*").strip()
+    if q == "*:*":
+        return []
+    clauses = []
+    for m in _CLAUSE_RE.finditer(q):
+        if m.group("quoted") is not None:
+            values = [m.group("quoted")]
+        elif m.group("group") is not None:
+            values = [v.strip().strip('"') for v in re.split(r"\s+OR\s+", m.group("group")) if v.strip()]
+        else:
+            values = [m.group("bare")]
+        clauses.append((m.group("field"), [_unescape(v) for v in values]))
+    return clauses
+
+
+def _field_values(doc: Dict, field: str) -> List[str]:
+    val = doc.get(field)
+    if val is None:
+        return []
+    if isinstance(val, (list, tuple)):
+        return [str(v) for v in val]
+    return [str(val)]
+
+
+def matches(doc: Dict, clauses: List[Tuple[str, List[str]]]) -> bool:
+    for field, patterns in clauses:
+        values = _field_values(doc, field)
+        if not any(fnmatch.fnmatchcase(v, p) for v in values for p in patterns):
+            return False
+    return True
+
+
+# ---------- HTTP server ----------
+
+class MockLabCASHandler(BaseHTTPRequestHandler):
+    server: "MockLabCASServer"
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with keep-alive, Nagle + delayed ACK would stall each response ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Optional[Dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _simulate(self) -> bool:
+        """Apply latency and random failures; return False if the request was failed."""
+        srv = self.server
+        if srv.latency:
+            time.sleep(srv.latency * (0.5 + srv.rng.random()))
+        if srv.error_rate and srv.rng.random() < srv.error_rate:
+            srv.count("errors")
+            self._send(503, b'{"error": "simulated outage"}')
+            return False
+        return True
+
+    def _authorized(self) -> bool:
+        srv = self.server
+        auth = self.headers.get("Authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else None
+        expiry = srv.tokens.get(token) if token else None
+        if expiry is None or expiry < time.time() or (
+                srv.unauthorized_rate and srv.rng.random() < srv.unauthorized_rate):
+            srv.count("unauthorized")
+            self._send(401, b'{"error": "unauthorized"}')
+            return False
+        return True
+
+    def do_POST(self):
+        self._dispatch()
+
+    def do_GET(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        srv = self.server
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        route = url.path.rsplit("/data-access-api/", 1)[-1]
+        srv.count(f"requests:{route}")
+
+        if int(self.headers.get("Content-Length") or 0):
+            self.rfile.read(int(self.headers["Content-Length"]))
+        if not self._simulate():
+            return
+
+        if route == "auth":
+            return self._auth()
+        if not self._authorized():
+            return
+        if route in ("collections/select", "datasets/select", "files/select"):
+            return self._select(route.split("/")[0], params)
+        if route == "download":
+            return self._download(params.get("id", ""))
+        self._send(404, b'{"error": "not found"}')
+
+    def _auth(self):
+        srv = self.server
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            self._send(401, b'{"error": "basic auth required"}')
+            return
+        exp = time.time() + srv.token_ttl
+        payload = base64.urlsafe_b64encode(json.dumps({"sub": "mock", "exp": int(exp)}).encode()).rstrip(b"=")
+        token = b"eyJhbGciOiJub25lIn0." + payload + b"." + hashlib.sha1(payload + str(time.time()).encode()).hexdigest().encode()
+        srv.tokens[token.decode()] = exp
+        srv.count("tokens_issued")
+        self._send(200, token, "text/plain")
+
+    def _select(self, kind: str, params: Dict[str, str]):
+        srv = self.server
+        start = int(params.get("start", 0))
+        rows = int(params.get("rows", 10))
+        docs = srv.query(kind, params.get("q", "*:*"))
+        body = json.dumps({
+            "responseHeader": {"status": 0, "params": params},
+            "response": {"numFound": len(docs), "start": start, "docs": docs[start:start + rows]},
+        }).encode()
+        self._send(200, body)
+
+    def _download(self, file_id: str):
+        content = next(
+            (c.file_content(file_id) for c in self.server.collections
+             if file_id.startswith(c.collection_id + "/")),
+            None,
+        )
+        if content is None:
+            self._send(404, b'{"error": "no such file"}')
+            return
+        self.server.count("bytes_served", len(content))
+
+        rng = self.headers.get("Range", "")
+        m = re.match(r"bytes=(\d+)-(\d*)$", rng)
+        if m:
+            first = int(m.group(1))
+            last = int(m.group(2)) if m.group(2) else len(content) - 1
+            if first >= len(content):
+                self._send(416, b"", "application/octet-stream",
+                           {"Content-Range": f"bytes */{len(content)}"})
+                return
+            last = min(last, len(content) - 1)
+            self._send_download(206, content[first:last + 1],
+                                {"Content-Range": f"bytes {first}-{last}/{len(content)}", "Accept-Ranges": "bytes"})
+            return
+        self._send_download(200, content, {"Accept-Ranges": "bytes"})
+
+    def _send_download(self, status: int, body: bytes, headers: Dict):
+        srv = self.server
+        if srv.drop_rate and len(body) > 1 and srv.rng.random() < srv.drop_rate:
+            # Advertise the full length, send part of the body, then drop the connection
+            srv.count("dropped_downloads")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/dicom")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self._send(status, body, "application/dicom", headers)
+
+
+class MockLabCASServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, collections: List[SyntheticCollection], latency: float = 0.0,
+                 error_rate: float = 0.0, unauthorized_rate: float = 0.0, token_ttl: float = 1800,
+                 drop_rate: float = 0.0, verbose: bool = False, seed: int = 0):
+        super().__init__(address, MockLabCASHandler)
+        self.collections = collections
+        self.latency = latency
+        self.error_rate = error_rate
+        self.unauthorized_rate = unauthorized_rate
+        self.token_ttl = token_ttl
+        self.drop_rate = drop_rate
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.tokens: Dict[str, float] = {}
+        self.stats: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], List[Dict]]" = OrderedDict()
+
+    def count(self, key: str, value: float = 1):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + value
+
+    def query(self, kind: str, q: str) -> List[Dict]:
+        """Matching docs for a query; results are cached so paging is cheap."""
+        key = (kind, q)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        clauses = parse_query(q)
+        colls = self.collections
+        if kind == "collections":
+            docs = [d for d in (c.collection_doc() for c in colls) if matches(d, clauses)]
+        elif kind == "datasets":
+            docs = [d for c in colls for d in c.dataset_docs() if matches(d, clauses)]
+        else:
+            exact = [v for f, vals in clauses if f == "DatasetId" for v in vals if not any(c in v for c in "*?")]
+            if exact and len(exact) == sum(len(vals) for f, vals in clauses if f == "DatasetId"):
+                candidates = (doc for did in exact for c in colls for doc in c.files_for_dataset(did))
+            else:
+                candidates = (doc for c in colls for doc in c.file_docs())
+            docs = [d for d in candidates if matches(d, clauses)]
+
+        with self._lock:
+            self._cache[key] = docs
+            while len(self._cache) > 256:
+                self._cache.popitem(last=False)
+        return docs
+
+
+class MockLabCAS:
+    """Run a MockLabCASServer on a background thread (context manager)."""
+
+    def __init__(self, scale: float = 1.0, host: str = "127.0.0.1", port: int = 0,
+                 image_size: int = 64, n_collections: int = 1, **server_kwargs):
+        # The first collection keeps the real ID; extra ones get a numeric suffix
+        self.collections = [
+            SyntheticCollection(scale, COLLECTION_ID if k == 0 else f"{COLLECTION_ID}_{k + 1}",
+                                image_size=image_size, seed=k)
+            for k in range(max(1, n_collections))
+        ]
+        self.collection = self.collections[0]
+        self.server = MockLabCASServer((host, port), self.collections, **server_kwargs)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return dict(self.server.stats)
+
+    def start(self) -> "MockLabCAS":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Local mock of the LabCAS data-access API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8080)
+    p.add_argument("--scale", type=float, default=1.0, help="Collection size relative to the real one")
+    p.add_argument("--collections", type=int, default=1, help="Number of synthetic collections to serve")
+    p.add_argument("--image-size", type=int, default=64, help="Synthetic DICOM rows/columns")
+    p.add_argument("--latency", type=float, default=0.0, help="Mean added latency per request (s)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failed with 503")
+    p.add_argument("--unauthorized-rate", type=float, default=0.0, help="Fraction of requests failed with 401")
+    p.add_argument("--token-ttl", type=float, default=1800, help="Lifetime of issued tokens (s)")
+    p.add_argument("--drop-rate", type=float, default=0.0,
+                   help="Fraction of downloads cut off halfway through the body")
+    p.add_argument("--verbose", action="store_true", help="Log every request")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mock = MockLabCAS(args.scale, args.host, args.port, image_size=args.image_size,
+                      n_collections=args.collections, latency=args.latency, error_rate=args.error_rate,
+                      unauthorized_rate=args.unauthorized_rate, token_ttl=args.token_ttl,
+                      drop_rate=args.drop_rate, verbose=args.verbose)
+    print(f"Mock LabCAS at {mock.base_url}")
+    for coll in mock.collections:
+        print(f"  {coll.collection_id}: {len(coll.patients)} patients, "
+              f"{coll.variants} variant(s)/view, {coll.file_size}-byte files")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
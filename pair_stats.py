@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+One-pass per-pair statistics sidecar for a manifest.
+
+Reads every PROC/MASK pair in manifest.csv once and records, per image,
+its shape, min/max, mean/std and a histogram over [min, max], plus the
+mask foreground fraction. The sidecar is JSON Lines, one pair per line,
+named after the manifest content hash (like split artifacts), so it is
+reused until the manifest changes and an interrupted run resumes:
+
+    outputs/pair_stats/stats_<manifest sha256[:16]>.jsonl
+
+MammogramDataset(stats=...) normalises with the stored min/max instead of
+scanning each array, and foreground_weights() gives per-pair sampling
+weights that balance empty, sparse and dense masks without touching
+pixels.
+
+Usage:
+    python pair_stats.py --manifest manifest.csv --workers 8
+"""
+
+import argparse
+import json
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from split_manifest import read_manifest, sha256_of_file
+
+STATS_DIR = Path("outputs/pair_stats")
+HIST_BINS = 64
+# Mask foreground-fraction strata used for balancing: empty, then split at these edges
+FG_EDGES = (0.01, 0.05, 0.15, 0.35)
+
+
+def stats_path(stats_dir: Path, manifest_sha: str) -> Path:
+    """Sidecar location for a given manifest content."""
+    return Path(stats_dir) / f"stats_{manifest_sha[:16]}.jsonl"
+
+
+def pair_key(row: Dict[str, str]) -> str:
+    return f"{row['patient_id']}_{row['view']}"
+
+
+def image_stats(arr, bins: int = HIST_BINS) -> Dict:
+    import numpy as np
+
+    lo, hi = float(arr.min()), float(arr.max())
+    hist, _ = np.histogram(arr, bins=bins, range=(lo, hi if hi > lo else lo + 1))
+    return {
+        "shape": list(arr.shape),
+        "min": lo,
+        "max": hi,
+        "mean": round(float(arr.mean()), 4),
+        "std": round(float(arr.std()), 4),
+        "hist": hist.tolist(),
+    }
+
+
+def mask_stats(arr, bins: int = HIST_BINS) -> Dict:
+    out = image_stats(arr, bins)
+    lo, hi = out["min"], out["max"]
+    # Same threshold as the loader: normalised value above 0.5
+    out["foreground_fraction"] = float((arr > lo + 0.5 * (hi - lo)).mean()) if hi > lo else 0.0
+    return out
+
+
+def _read_pixels(url: str):
+    import pydicom
+
+    import downloads
+
+    with downloads.download(url) as f:
+        return pydicom.dcmread(f).pixel_array
+
+
+def compute_pair_stats(row: Dict[str, str], bins: int = HIST_BINS) -> Dict:
+    return {
+        "key": pair_key(row),
+        "proc_url": row["proc_url"],
+        "mask_url": row["mask_url"],
+        "proc": image_stats(_read_pixels(row["proc_url"]), bins),
+        "mask": mask_stats(_read_pixels(row["mask_url"]), bins),
+    }
+
+
+def load_stats(path: Path) -> Dict[str, Dict]:
+    """pair key → stats record; a torn final line is ignored"""
+    stats = {}
+    path = Path(path)
+    if not path.exists():
+        return stats
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            stats[rec["key"]] = rec
+    return stats
+
+
+def foreground_stratum(fraction: float, edges: Sequence[float] = FG_EDGES) -> int:
+    """0 for an empty mask, then 1 + the number of edges at or below `fraction`"""
+    return 0 if fraction <= 0 else 1 + bisect_right(edges, fraction)
+
+
+def stratum_label(s: int, edges: Sequence[float] = FG_EDGES) -> str:
+    if s == 0:
+        return "empty"
+    bounds = (0.0,) + tuple(edges) + (1.0,)
+    return f"({bounds[s - 1]:.2f}, {bounds[s]:.2f}]" if s == 1 else f"[{bounds[s - 1]:.2f}, {bounds[s]:.2f})"
+
+
+def foreground_weights(rows: List[Dict[str, str]], stats: Dict[str, Dict],
+                       edges: Sequence[float] = FG_EDGES) -> List[float]:
+    """
+    Per-row sampling weights so that each mask foreground-fraction stratum
+    is drawn equally often (e.g. for torch WeightedRandomSampler). Rows
+    without stats get weight 1.
+    """
+    strata = []
+    for r in rows:
+        rec = stats.get(pair_key(r))
+        strata.append(None if rec is None else foreground_stratum(rec["mask"]["foreground_fraction"], edges))
+    counts: Dict[int, int] = {}
+    for s in strata:
+        if s is not None:
+            counts[s] = counts.get(s, 0) + 1
+    if not counts:
+        return [1.0] * len(rows)
+    # Mean weight over rows with stats is 1
+    scale = sum(counts.values()) / len(counts)
+    return [1.0 if s is None else scale / counts[s] for s in strata]
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Precompute per-pair image statistics for a manifest")
+    p.add_argument("--manifest", "-i", type=Path, default=Path("manifest.csv"), help="Input CSV manifest")
+    p.add_argument("--stats-dir", type=Path, default=STATS_DIR, help="Where sidecars are cached")
+    p.add_argument("--output", "-o", type=Path, default=None,
+                   help="Explicit sidecar path (default: derived from the manifest hash)")
+    p.add_argument("--bins", type=int, default=HIST_BINS, help="Histogram bins per image")
+    p.add_argument("--workers", type=int, default=4, help="Pairs processed concurrently")
+    p.add_argument("--limit", type=int, default=None, help="Process at most this many new pairs")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.manifest.exists():
+        raise SystemExit(f"Manifest not found: {args.manifest}")
+
+    rows = read_manifest(args.manifest)
+    out_path = args.output or stats_path(args.stats_dir, sha256_of_file(args.manifest))
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    done = load_stats(out_path)
+    todo = [r for r in rows if pair_key(r) not in done]
+    if args.limit is not None:
+        todo = todo[:args.limit]
+    print(f"{len(rows)} pairs in {args.manifest}: {len(done)} already in {out_path}, {len(todo)} to compute")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool, open(out_path, "a") as out:
+        futures = {pool.submit(compute_pair_stats, r, args.bins): r for r in todo}
+        for n, fut in enumerate(as_completed(futures), 1):
+            try:
+                rec = fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"  ⚠ {pair_key(futures[fut])}: {type(e).__name__}: {e}")
+                continue
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+            done[rec["key"]] = rec
+            if n % 50 == 0 or n == len(todo):
+                print(f"  └─ {n}/{len(todo)} pairs...")
+
+    strata: Dict[int, int] = {}
+    for rec in done.values():
+        s = foreground_stratum(rec["mask"]["foreground_fraction"])
+        strata[s] = strata.get(s, 0) + 1
+    print(f"\n✓ Stats for {len(done)}/{len(rows)} pairs written to: {out_path}"
+          + (f" ({failed} failed)" if failed else ""))
+    print("Mask foreground fraction:")
+    for s in sorted(strata):
+        print(f"  {stratum_label(s):<14} {strata[s]} pairs")
+
+
+if __name__ == "__main__":
+    main()
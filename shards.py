@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+WebDataset-style tar shards of manifest pairs, for sequential reads.
+
+Each pair becomes three consecutive tar members sharing one key:
+
+    C0250_LCC.proc.dcm    ← processed mammogram
+    C0250_LCC.mask.dcm    ← segmentation mask
+    C0250_LCC.json        ← the manifest.csv row
+
+Pairs are shuffled once (seeded) and packed into size-bounded shards, so a
+training epoch reads a few large files front to back instead of thousands
+of small DICOMs:
+
+    outputs/shards/<split>/
+    ├── shard-000000-<sha256[:16]>.tar
+    ├── shard-000001-<sha256[:16]>.tar
+    ├── index.json                ← per shard: bytes, sha256, member offsets
+    └── croissant_shards.json     ← Croissant description of the shards
+
+Shard names carry their content hash, so shards of different exports never
+share a contentUrl (mlcroissant caches extracted archives by contentUrl).
+Bytes come from the integrity store when a verified local copy exists
+(integrity.py), otherwise they are streamed from LabCAS. The index is
+rewritten after every finished shard, so an interrupted export resumes at
+the next shard. ShardReader reads the shards back with a shuffle buffer.
+
+Usage:
+    python shards.py --manifest manifest.csv --split train
+    python shards.py --split val --shard-size 256
+"""
+
+import argparse
+import bisect
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from pair_stats import pair_key
+from split_manifest import (DEFAULT_FRACTIONS, DEFAULT_SEED, DEFAULT_SPLIT_DIR, load_or_create_split,
+                            read_manifest, rows_for_split, sha256_of_file)
+
+SHARD_ROOT = Path("outputs/shards")
+INDEX_FILE = "index.json"
+CROISSANT_FILE = "croissant_shards.json"
+SHARD_MAX_BYTES = 512 << 20           # 512 MiB
+READ_BUFFER = 8 << 20                 # sequential read buffer per open shard
+SHUFFLE_BUFFER = 256                  # pairs held for shuffling per reader ...
+SHUFFLE_BUFFER_BYTES = 256 << 20      # ... and at most this many bytes of them
+MEMBERS = ("proc.dcm", "mask.dcm", "json")
+
+
+# ---------- Writing ----------
+
+class _HashingWriter:
+    """Write-only file wrapper that hashes and counts bytes as they pass through"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def tell(self) -> int:
+        return self.size
+
+
+def _read_pair(row: Dict[str, str], store) -> Tuple[Dict[str, str], bytes, bytes]:
+    import downloads
+
+    out = []
+    for col in ("proc_url", "mask_url"):
+        local = store.path_for(row[col].split("?id=", 1)[-1]) if store is not None else None
+        if local is not None:
+            out.append(local.read_bytes())
+        else:
+            with downloads.download(row[col]) as f:
+                out.append(f.read())
+    return row, out[0], out[1]
+
+
+def _prefetch(rows: List[Dict[str, str]], store, workers: int):
+    """Yield pairs in order, keeping at most 2 * workers downloads in flight"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        it = iter(rows)
+        for row in it:
+            pending.append(pool.submit(_read_pair, row, store))
+            if len(pending) >= 2 * max(1, workers):
+                break
+        while pending:
+            yield pending.popleft().result()
+            for row in it:
+                pending.append(pool.submit(_read_pair, row, store))
+                break
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes) -> Tuple[int, int]:
+    """Append one member; returns (data offset, size) within the shard"""
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = 0                    # reproducible shards
+    offset = tar.offset + len(info.tobuf(tar.format, tar.encoding, tar.errors))
+    tar.addfile(info, io.BytesIO(data))
+    return offset, len(data)
+
+
+def load_index(root: Path) -> Optional[Dict]:
+    path = Path(root) / INDEX_FILE
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+def _save_index(root: Path, index: Dict):
+    path = Path(root) / INDEX_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(index, indent=2))
+    os.replace(tmp, path)
+
+
+def export_shards(rows: List[Dict[str, str]], out_dir: Path, source: Dict,
+                  max_bytes: int = SHARD_MAX_BYTES, seed: int = DEFAULT_SEED,
+                  store=None, workers: int = 4) -> Dict:
+    """
+    Pack `rows` into tar shards under `out_dir` and return the index.
+    `source` (manifest name, sha256, split) identifies the input; shards
+    finished by an earlier run with the same source and settings are kept.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rows = list(rows)
+    random.Random(seed).shuffle(rows)
+
+    settings = {**source, "seed": seed, "shard_max_bytes": max_bytes}
+    index = load_index(out_dir)
+    previous = index["shards"] if index else []
+    if not index or index.get("settings") != settings:
+        index = {"settings": settings, "pairs": len(rows), "complete": False, "shards": []}
+    # Keep only leading shards that are still intact on disk; drop the rest of an earlier export
+    kept = []
+    for shard in index["shards"]:
+        path = out_dir / shard["name"]
+        if not path.exists() or path.stat().st_size != shard["bytes"]:
+            break
+        kept.append(shard)
+    index["shards"] = kept
+    for shard in previous:
+        if shard not in kept:
+            (out_dir / shard["name"]).unlink(missing_ok=True)
+    done = sum(len(s["samples"]) for s in kept)
+    if done:
+        print(f"⟳ Resuming after {len(kept)} finished shard(s) ({done}/{len(rows)} pairs)")
+
+    shard_no = len(kept)
+    tar = writer = f = None
+    samples: List[Dict] = []
+    start = time.perf_counter()
+
+    def close_shard():
+        tar.close()
+        f.close()
+        name = f"shard-{shard_no:06d}-{writer.sha.hexdigest()[:16]}.tar"
+        os.replace(out_dir / f"shard-{shard_no:06d}.tar.part", out_dir / name)
+        index["shards"].append({"name": name, "bytes": writer.size, "sha256": writer.sha.hexdigest(),
+                                "samples": samples})
+        _save_index(out_dir, index)
+        print(f"  └─ {name}: {len(samples)} pairs, {writer.size / 2**20:.1f} MiB")
+
+    for row, proc, mask in _prefetch(rows[done:], store, workers):
+        key = pair_key(row)
+        meta = json.dumps(row, sort_keys=True).encode()
+        size = len(proc) + len(mask) + len(meta) + 3 * 1024     # data + headers/padding (approx.)
+        if tar is not None and samples and writer.size + size > max_bytes:
+            close_shard()
+            shard_no += 1
+            tar = None
+        if tar is None:
+            f = open(out_dir / f"shard-{shard_no:06d}.tar.part", "wb")
+            writer = _HashingWriter(f)
+            tar = tarfile.open(fileobj=writer, mode="w", format=tarfile.USTAR_FORMAT)
+            samples = []
+        members = {}
+        for ext, data in zip(MEMBERS, (proc, mask, meta)):
+            members[ext] = _add_member(tar, f"{key}.{ext}", data)
+        samples.append({"key": key, "members": members})
+    if tar is not None:
+        close_shard()
+
+    index["complete"] = True
+    index["bytes"] = sum(s["bytes"] for s in index["shards"])
+    _save_index(out_dir, index)
+    elapsed = time.perf_counter() - start
+    print(f"✓ {len(rows)} pairs in {len(index['shards'])} shard(s), "
+          f"{index['bytes'] / 2**20:.1f} MiB ({elapsed:.1f}s)")
+    return index
+
+
+def write_croissant(out_dir: Path, index: Dict) -> Path:
+    """Croissant 1.0 description of the shards: one FileObject per tar, FileSets for the members"""
+    import mlcroissant as mlc
+
+    shard_ids = [s["name"] for s in index["shards"]]
+    distribution = [
+        mlc.FileObject(
+            id=s["name"],
+            name=s["name"],
+            description=f"Tar shard with {len(s['samples'])} PROC/MASK pairs.",
+            content_url=s["name"],
+            content_size=f"{s['bytes']} B",
+            encoding_formats=["application/x-tar"],
+            sha256=s["sha256"],
+        )
+        for s in index["shards"]
+    ]
+    for ext, fmt, desc in (("proc.dcm", "application/dicom", "Processed mammogram DICOMs"),
+                           ("mask.dcm", "application/dicom", "Segmentation mask DICOMs"),
+                           ("json", "application/json", "manifest.csv row of each pair")):
+        distribution.append(mlc.FileSet(
+            id=f"{ext.replace('.', '-')}-files",
+            name=f"{ext.replace('.', '-')}-files",
+            description=f"{desc}, one per pair, named <patient_id>_<view>.{ext}.",
+            contained_in=shard_ids,
+            encoding_formats=[fmt],
+            includes=[f"*.{ext}"],
+        ))
+
+    def member_field(name: str, ext: str, desc: str, prop: str, data_type, regex: Optional[str] = None):
+        return mlc.Field(
+            id=f"{ext.replace('.', '_')}/{name}",
+            name=f"{ext.replace('.', '_')}/{name}",
+            description=desc,
+            data_types=[data_type],
+            source=mlc.Source(
+                file_set=f"{ext.replace('.', '-')}-files",
+                extract=mlc.Extract(file_property=prop),
+                transforms=[mlc.Transform(regex=regex)] if regex else [],
+            ),
+        )
+
+    record_sets = [
+        mlc.RecordSet(
+            id=ext.replace(".", "_"),
+            name=ext.replace(".", "_"),
+            description=f"{desc} from the shards, keyed by <patient_id>_<view>.",
+            key=[f"{ext.replace('.', '_')}/key"],
+            fields=[
+                member_field("key", ext, "Sample key shared by the members of a pair.",
+                             "filename", mlc.DataType.TEXT, rf"^(.*)\.{re.escape(ext)}$"),
+                # sc:Text content is read as raw bytes; DICOM is not a PIL-decodable ImageObject
+                member_field("content", ext, f"Raw bytes of the {ext} member.", "content", mlc.DataType.TEXT),
+            ],
+        )
+        for ext, desc in (("proc.dcm", "Processed mammograms"), ("mask.dcm", "Segmentation masks"),
+                          ("json", "Manifest rows"))
+    ]
+
+    settings = index["settings"]
+    metadata = mlc.Metadata(
+        name="EDRN_Breast_Density_Collection_2_shards",
+        description=(
+            f"{index['pairs']} PROC/MASK mammogram pairs ({settings.get('split') or 'all splits'}) "
+            f"packed into {len(shard_ids)} WebDataset-style tar shards. Members of a pair share the "
+            f"key <patient_id>_<view>. Built from {settings['manifest']} "
+            f"(SHA-256 {settings['manifest_sha256']})."
+        ),
+        conforms_to="http://mlcommons.org/croissant/1.0",
+        cite_as="EDRN LabCAS Breast Density Collection",
+        date_published=time.strftime("%Y-%m-%d"),
+        license="https://creativecommons.org/licenses/by/4.0/",
+        url="https://edrn-labcas.jpl.nasa.gov/collections/Automated_Quantitative_Measures_of_Breast_Density_Data",
+        version="1.0.0",
+        distribution=distribution,
+        record_sets=record_sets,
+    )
+    path = out_dir / CROISSANT_FILE
+    path.write_text(json.dumps(metadata.to_json(), indent=2, ensure_ascii=False))
+    return path
+
+
+# ---------- Reading ----------
+
+def iter_shard(path: Path) -> Iterator[Dict]:
+    """
+    Stream one shard front to back, yielding {"key", "proc.dcm", "mask.dcm",
+    "json"} per pair (bytes values).
+    """
+    with open(path, "rb", buffering=READ_BUFFER) as f, tarfile.open(fileobj=f, mode="r|") as tar:
+        sample: Dict = {}
+        for info in tar:
+            if not info.isfile():
+                continue
+            key, ext = info.name.split(".", 1)
+            if sample and sample["key"] != key:
+                yield sample
+                sample = {}
+            sample["key"] = key
+            sample[ext] = tar.extractfile(info).read()
+        if sample:
+            yield sample
+
+
+def read_samples(path: Path, samples: List[Dict]) -> Iterator[Dict]:
+    """
+    Read the given index entries of one shard through their member offsets,
+    in the same form as iter_shard(). Consecutive entries are read front to
+    back through one buffered file.
+    """
+    with open(path, "rb", buffering=READ_BUFFER) as f:
+        for entry in samples:
+            sample = {"key": entry["key"]}
+            for ext, (offset, size) in entry["members"].items():
+                f.seek(offset)
+                sample[ext] = f.read(size)
+            yield sample
+
+
+def _sample_bytes(sample: Dict) -> int:
+    return sum(len(v) for v in sample.values() if isinstance(v, bytes))
+
+
+class ShardReader:
+    """
+    Sequential reader over the shards of one export, with a shuffle buffer.
+
+    Each epoch the shards are put in a seeded order (changed by set_epoch())
+    and their pairs, in stored order, form one sequence that is divided
+    into contiguous runs, one per consumer (ranks × DataLoader workers), so
+    every pair goes to exactly one consumer and each reads only the shards
+    its run spans. Without `num_samples` the runs split the sequence
+    evenly. With `num_samples`, consumer i reads the next num_samples[i]
+    pairs (an int: the same count for every consumer), wrapping around to
+    the start of the sequence once it is exhausted, like DistributedSampler's
+    padding: every pair is still read once per epoch if the counts add up to
+    at least the number of pairs.
+
+    Shuffling keeps up to `shuffle_buffer` pairs, and at most
+    `shuffle_buffer_bytes` of raw DICOM bytes (None: no byte cap), in memory
+    per reader; with DataLoader workers that is per worker. 0 yields pairs
+    in sequence order.
+    """
+
+    def __init__(self, root: Path, shuffle_buffer: int = SHUFFLE_BUFFER,
+                 shuffle_buffer_bytes: Optional[int] = SHUFFLE_BUFFER_BYTES, seed: int = DEFAULT_SEED,
+                 slot: int = 0, num_slots: int = 1, num_samples: Union[int, Sequence[int], None] = None):
+        self.root = Path(root)
+        self.index = load_index(self.root)
+        if not self.index or not self.index.get("complete"):
+            raise FileNotFoundError(f"No complete shard export in {self.root} (run shards.py)")
+        if num_samples is not None and not isinstance(num_samples, int) and len(num_samples) != num_slots:
+            raise ValueError(f"num_samples has {len(num_samples)} counts for {num_slots} slots")
+        self.shuffle_buffer = shuffle_buffer
+        self.shuffle_buffer_bytes = shuffle_buffer_bytes
+        self.seed = seed
+        self.slot = slot
+        self.num_slots = num_slots
+        self.num_samples = num_samples
+        self.epoch = 0
+
+    def __len__(self) -> int:
+        return self.index["pairs"]
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _run(self) -> Tuple[int, int]:
+        """(start, count) of this consumer's run in the epoch's pair sequence"""
+        total = self.index["pairs"]
+        if self.num_samples is None:
+            start = self.slot * total // self.num_slots
+            return start, (self.slot + 1) * total // self.num_slots - start
+        if isinstance(self.num_samples, int):
+            return self.slot * self.num_samples, self.num_samples
+        return sum(self.num_samples[:self.slot]), self.num_samples[self.slot]
+
+    def _pieces(self, shards: List[Dict], start: int, count: int) -> Iterator[Tuple[Dict, int, int]]:
+        """(shard, first, stop) sample ranges covering `count` pairs from `start`, cyclically"""
+        starts, total = [], 0
+        for shard in shards:
+            starts.append(total)
+            total += len(shard["samples"])
+        if not total:
+            return
+        pos = start % total
+        while count > 0:
+            i = bisect.bisect_right(starts, pos) - 1
+            first = pos - starts[i]
+            stop = min(len(shards[i]["samples"]), first + count)
+            yield shards[i], first, stop
+            count -= stop - first
+            pos = (starts[i] + stop) % total
+
+    def _stream(self) -> Iterator[Dict]:
+        # Same seed on every consumer so they agree on the sequence
+        shards = list(self.index["shards"])
+        random.Random(self.seed + self.epoch).shuffle(shards)
+        for shard, first, stop in self._pieces(shards, *self._run()):
+            yield from read_samples(self.root / shard["name"], shard["samples"][first:stop])
+
+    def __iter__(self) -> Iterator[Dict]:
+        stream = self._stream()
+        if self.shuffle_buffer <= 1:
+            yield from stream
+            return
+
+        local = random.Random((self.seed + self.epoch) * 1000003 + self.slot)
+        cap_bytes = self.shuffle_buffer_bytes
+        buffer: List[Dict] = []
+        held = 0
+        for sample in stream:
+            buffer.append(sample)
+            held += _sample_bytes(sample)
+            while buffer and (len(buffer) > self.shuffle_buffer or (cap_bytes is not None and held > cap_bytes)):
+                i = local.randrange(len(buffer))
+                buffer[i], buffer[-1] = buffer[-1], buffer[i]
+                out = buffer.pop()
+                held -= _sample_bytes(out)
+                yield out
+        local.shuffle(buffer)
+        yield from buffer
+
+
+# ---------- CLI ----------
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Pack manifest pairs into tar shards for sequential reads")
+    p.add_argument("--manifest", "-i", type=Path, default=Path("manifest.csv"), help="Input CSV manifest")
+    p.add_argument("--split", choices=("train", "val", "test"), default=None,
+                   help="Export only this split (split_manifest.py); default: all pairs")
+    p.add_argument("--split-dir", type=Path, default=DEFAULT_SPLIT_DIR, help="Cached split artifacts")
+    p.add_argument("--fractions", type=float, nargs=3, default=DEFAULT_FRACTIONS,
+                   metavar=("TRAIN", "VAL", "TEST"))
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Split and pair-order seed")
+    p.add_argument("--output-dir", "-o", type=Path, default=None,
+                   help=f"Shard directory (default: {SHARD_ROOT}/<split or 'all'>)")
+    p.add_argument("--shard-size", type=int, default=SHARD_MAX_BYTES >> 20, help="Maximum shard size in MiB")
+    p.add_argument("--store", type=Path, default=Path("dicom_store"),
+                   help="Integrity store to read verified local copies from (integrity.py)")
+    p.add_argument("--workers", type=int, default=4, help="Concurrent downloads")
+    p.add_argument("--no-croissant", action="store_true", help="Skip the Croissant description")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.manifest.exists():
+        raise SystemExit(f"Manifest not found: {args.manifest}")
+
+    rows = read_manifest(args.manifest)
+    if args.split:
+        artifact = load_or_create_split(args.manifest, args.fractions, args.seed, args.split_dir)
+        rows = rows_for_split(rows, artifact, args.split)
+    out_dir = args.output_dir or SHARD_ROOT / (args.split or "all")
+
+    store = None
+    if (args.store / "integrity.jsonl").exists():
+        from integrity import IntegrityStore
+        store = IntegrityStore(args.store)
+        print(f"Reading verified local copies from {args.store} where available")
+
+    source = {"manifest": args.manifest.name, "manifest_sha256": sha256_of_file(args.manifest),
+              "split": args.split}
+    print(f"Exporting {len(rows)} pairs to {out_dir} (≤ {args.shard_size} MiB per shard)")
+    index = export_shards(rows, out_dir, source, max_bytes=args.shard_size << 20, seed=args.seed,
+                          store=store, workers=args.workers)
+    if not args.no_croissant:
+        print(f"✓ Croissant description written to: {write_croissant(out_dir, index)}")
+
+
+if __name__ == "__main__":
+    main()
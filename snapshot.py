@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Pin a Croissant dataset to a reproducible local snapshot.
+
+Reads a Croissant file produced by generator.py, checks its manifest
+against the pinned SHA-256, resolves every proc_url/mask_url to a verified
+local copy in the integrity store (downloading only what is missing) and
+lays the files out under the LabCAS directory structure:
+
+    snapshots/<manifest sha256[:16]>/
+    ├── dicom/C0250/PROC/C0250_MG_PRO_LCC.dcm   ← hard links into dicom_store/
+    ├── manifest.csv                             ← local paths, sizes and checksums
+    ├── croissant.json                           ← companion Croissant with local FileObjects
+    └── snapshot.json                            ← provenance (source Croissant, counts)
+
+The snapshot manifest keeps the manifest.csv columns, with proc_url and
+mask_url as paths relative to the snapshot, so split_manifest.py,
+train_ddp.py, pair_stats.py and shards.py run on it unchanged and never
+touch the network. --verify re-hashes a snapshot against its checksums.
+
+Usage:
+    python snapshot.py --croissant outputs/croissant.json
+    python snapshot.py --verify snapshots/aa07582fdac1ba73
+    python train_ddp.py --manifest snapshots/aa07582fdac1ba73/manifest.csv
+"""
+
+import argparse
+import copy
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from split_manifest import sha256_of_file
+
+SNAPSHOT_ROOT = Path("snapshots")
+MANIFEST_ID = "manifest.csv"
+EXTRA_COLUMNS = ("proc_sha256", "proc_size", "proc_source_url", "mask_sha256", "mask_size", "mask_source_url")
+
+
+def _file_object(jsonld: Dict, file_id: str) -> Optional[Dict]:
+    for obj in jsonld.get("distribution", []):
+        if obj.get("@id") == file_id:
+            return obj
+    return None
+
+
+def resolve_manifest(croissant_path: Path, jsonld: Dict) -> Path:
+    """
+    Local manifest referenced by the Croissant file, checked against its
+    pinned sha256. The contentUrl is looked up next to the Croissant file
+    first, then in the working directory.
+    """
+    obj = _file_object(jsonld, MANIFEST_ID)
+    if obj is None:
+        raise SystemExit(f"{croissant_path} has no '{MANIFEST_ID}' FileObject")
+    for candidate in (croissant_path.parent / obj["contentUrl"], Path(obj["contentUrl"])):
+        if candidate.exists():
+            break
+    else:
+        raise SystemExit(f"Manifest {obj['contentUrl']} referenced by {croissant_path} not found")
+    sha = sha256_of_file(candidate)
+    if obj.get("sha256") and sha != obj["sha256"]:
+        raise SystemExit(f"{candidate} does not match the pinned checksum in {croissant_path}:\n"
+                         f"  expected {obj['sha256']}\n  found    {sha}")
+    return candidate
+
+
+def _file_id(url: str) -> str:
+    return url.split("?id=", 1)[-1]
+
+
+def _mirror_path(file_id: str) -> Path:
+    """dicom/<patient>/<kind>/<name>: the LabCAS layout below the collection"""
+    parts = file_id.split("/")
+    return Path("dicom", *parts[1:] if len(parts) > 1 else parts)
+
+
+def _link(src: Path, dest: Path):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists():
+        dest.unlink()
+    try:
+        os.link(src, dest)
+    except OSError:                    # other filesystem, or links unsupported
+        shutil.copy2(src, dest)
+
+
+def companion_croissant(jsonld: Dict, manifest_sha: str, files: Dict[str, Dict]) -> Dict:
+    """
+    Copy of the source Croissant pointing at the snapshot: the manifest
+    FileObject gets the local manifest's checksum, every DICOM becomes a
+    FileObject with its sha256 and size, and the checksum / source URL
+    columns are added as fields of the record sets reading the manifest.
+    """
+    out = copy.deepcopy(jsonld)
+    out["description"] = (f"{jsonld.get('description', '')} Local snapshot: files resolved to "
+                          f"checksummed copies on disk; proc_url/mask_url are paths relative to "
+                          f"this file.").strip()
+
+    manifest_obj = copy.deepcopy(_file_object(jsonld, MANIFEST_ID))
+    manifest_obj.update(
+        description="CSV manifest of matched PROC/MASK pairs with local paths and checksums.",
+        contentUrl=MANIFEST_ID,
+        sha256=manifest_sha,
+    )
+    out["distribution"] = [manifest_obj] + [
+        {
+            "@type": "cr:FileObject",
+            "@id": rel,
+            "name": rel,
+            "contentUrl": rel,
+            "contentSize": f"{f['size']} B",
+            "encodingFormat": "application/dicom",
+            "sha256": f["sha256"],
+        }
+        for rel, f in sorted(files.items())
+    ]
+
+    for record_set in out.get("recordSet", []):
+        fields = record_set.get("field", [])
+        if not any(f.get("source", {}).get("fileObject", {}).get("@id") == MANIFEST_ID for f in fields):
+            continue
+        rs = record_set.get("@id") or record_set["name"]
+        for f in fields:
+            col = f.get("source", {}).get("extract", {}).get("column")
+            if col in ("proc_url", "mask_url"):
+                side = "processed mammogram" if col == "proc_url" else "segmentation mask"
+                f["description"] = f"Local path (relative to this file) of the {side} DICOM."
+        for col in EXTRA_COLUMNS:
+            side = "processed mammogram" if col.startswith("proc") else "segmentation mask"
+            desc, dtype = {
+                "sha256": (f"SHA-256 of the {side} DICOM.", "sc:Text"),
+                "size": (f"Size in bytes of the {side} DICOM.", "sc:Integer"),
+                "source_url": (f"Original LabCAS download URL of the {side} DICOM.", "sc:URL"),
+            }[col.split("_", 1)[1]]
+            fields.append({
+                "@type": "cr:Field",
+                "@id": f"{rs}/{col}",
+                "name": f"{rs}/{col}",
+                "description": desc,
+                "dataType": dtype,
+                "source": {"fileObject": {"@id": MANIFEST_ID}, "extract": {"column": col}},
+            })
+    return out
+
+
+def create_snapshot(croissant_path: Path, root: Path = SNAPSHOT_ROOT, store_dir: Path = Path("dicom_store"),
+                    workers: int = 4, offline: bool = False) -> Path:
+    from integrity import IntegrityStore
+
+    jsonld = json.loads(croissant_path.read_text())
+    manifest_path = resolve_manifest(croissant_path, jsonld)
+    manifest_sha = sha256_of_file(manifest_path)
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        columns, rows = list(reader.fieldnames), list(reader)
+    if not rows:
+        raise SystemExit(f"{manifest_path} has no rows")
+
+    out_dir = root / manifest_sha[:16]
+    print(f"Snapshot of {croissant_path} ({len(rows)} pairs, manifest {manifest_sha[:16]}) → {out_dir}")
+
+    store = IntegrityStore(store_dir, rows[0]["proc_url"].split("/data-access-api/", 1)[0])
+    urls = {r[col] for r in rows for col in ("proc_url", "mask_url")}
+    missing = [(_file_id(u), None, u) for u in sorted(urls) if store.path_for(_file_id(u)) is None]
+    print(f"  {len(urls) - len(missing)}/{len(urls)} files already in {store_dir}")
+    if missing:
+        if offline:
+            raise SystemExit(f"{len(missing)} files are not in {store_dir} and --offline was given")
+        print(f"  Fetching {len(missing)} missing files...")
+        store.verify(missing, workers=workers)
+
+    files: Dict[str, Dict] = {}
+    failed = []
+    for url in sorted(urls):
+        file_id = _file_id(url)
+        rec, src = store.records.get(file_id), store.path_for(file_id)
+        if src is None or rec.get("status") != "ok":
+            failed.append(file_id)
+            continue
+        rel = _mirror_path(file_id).as_posix()
+        _link(src, out_dir / rel)
+        files[rel] = {"url": url, "sha256": rec["sha256"], "size": rec["size"]}
+    if failed:
+        for file_id in failed[:10]:
+            print(f"  ✗ {file_id}: {store.records.get(file_id, {}).get('status', 'missing')}")
+        raise SystemExit(f"{len(failed)} files could not be verified; snapshot not written")
+
+    by_url = {f["url"]: (rel, f) for rel, f in files.items()}
+    local_manifest = out_dir / MANIFEST_ID
+    with open(local_manifest, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns + list(EXTRA_COLUMNS))
+        writer.writeheader()
+        for r in rows:
+            r = dict(r)
+            for side in ("proc", "mask"):
+                rel, info = by_url[r[f"{side}_url"]]
+                r[f"{side}_source_url"] = r[f"{side}_url"]
+                r[f"{side}_url"] = rel
+                r[f"{side}_sha256"] = info["sha256"]
+                r[f"{side}_size"] = info["size"]
+            writer.writerow(r)
+
+    local_sha = sha256_of_file(local_manifest)
+    (out_dir / "croissant.json").write_text(
+        json.dumps(companion_croissant(jsonld, local_sha, files), indent=2, ensure_ascii=False))
+    info = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source_croissant": str(croissant_path),
+        "source_croissant_sha256": sha256_of_file(croissant_path),
+        "source_manifest_sha256": manifest_sha,
+        "manifest_sha256": local_sha,
+        "pairs": len(rows),
+        "files": len(files),
+        "bytes": sum(f["size"] for f in files.values()),
+    }
+    (out_dir / "snapshot.json").write_text(json.dumps(info, indent=2))
+    print(f"✓ {len(files)} files ({info['bytes'] / 2**20:.1f} MiB) pinned in {out_dir}")
+    print(f"  Croissant: {out_dir / 'croissant.json'}")
+    return out_dir
+
+
+def verify_snapshot(snapshot_dir: Path) -> List[str]:
+    """Re-hash the manifest and every file of a snapshot; returns the problems found"""
+    jsonld = json.loads((snapshot_dir / "croissant.json").read_text())
+    problems = []
+    for obj in jsonld.get("distribution", []):
+        path = snapshot_dir / obj["contentUrl"]
+        if not path.exists():
+            problems.append(f"{obj['contentUrl']}: missing")
+            continue
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        if h.hexdigest() != obj.get("sha256"):
+            problems.append(f"{obj['contentUrl']}: checksum mismatch")
+    return problems
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Pin a Croissant dataset to a local, checksummed snapshot")
+    p.add_argument("--croissant", "-i", type=Path, default=Path("outputs/croissant.json"),
+                   help="Source Croissant JSON-LD (generator.py output)")
+    p.add_argument("--output-root", "-o", type=Path, default=SNAPSHOT_ROOT, help="Where snapshots are created")
+    p.add_argument("--store", type=Path, default=Path("dicom_store"),
+                   help="Integrity store used as the local mirror (integrity.py)")
+    p.add_argument("--workers", type=int, default=4, help="Concurrent downloads for missing files")
+    p.add_argument("--offline", action="store_true", help="Fail instead of downloading files missing from the store")
+    p.add_argument("--verify", type=Path, default=None, metavar="SNAPSHOT_DIR",
+                   help="Check an existing snapshot against its checksums and exit")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.verify is not None:
+        problems = verify_snapshot(args.verify)
+        for problem in problems[:20]:
+            print(f"  ✗ {problem}")
+        if problems:
+            print(f"⚠ {len(problems)} problem(s) in {args.verify}")
+            sys.exit(1)
+        print(f"✓ {args.verify} matches its checksums")
+        return
+    if not args.croissant.exists():
+        raise SystemExit(f"Croissant file not found: {args.croissant}. Run generator.py first.")
+    create_snapshot(args.croissant, args.output_root, args.store, args.workers, args.offline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Patient-grouped, stratified train/val/test split for manifest.csv.
+
+Logic:
+  1. Every row of a patient goes to the same split (no patient leakage).
+  2. Patients are stratified by group (case/control) and assigned greedily
+     so that each split receives its share of every (group, view) cell.
+  3. The split is persisted as a small JSON artifact keyed by the manifest
+     SHA-256, seed and fractions. Later runs (and every rank of a distributed
+     job) load the artifact instead of recomputing it.
+
+Usage:
+    python split_manifest.py
+    python split_manifest.py -i manifest_mini.csv --fractions 0.6 0.2 0.2 --seed 0
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+DEFAULT_MANIFEST = Path("manifest.csv")
+DEFAULT_SPLIT_DIR = Path("splits")
+DEFAULT_FRACTIONS = (0.7, 0.15, 0.15)
+DEFAULT_SEED = 42
+
+SPLIT_NAMES = ("train", "val", "test")
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Patient-grouped, stratified manifest split")
+    p.add_argument("--input", "-i", type=Path, default=DEFAULT_MANIFEST, help="Input CSV manifest")
+    p.add_argument("--split-dir", type=Path, default=DEFAULT_SPLIT_DIR, help="Directory holding cached split artifacts")
+    p.add_argument("--fractions", type=float, nargs=3, default=DEFAULT_FRACTIONS,
+                   metavar=("TRAIN", "VAL", "TEST"), help="Split fractions (normalised to sum to 1)")
+    p.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Shuffle seed")
+    p.add_argument("--force", action="store_true", help="Recompute even if a cached artifact exists")
+    return p.parse_args(argv)
+
+
+def sha256_of_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8192), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_manifest(path: Path) -> List[Dict[str, str]]:
+    """
+    Manifest rows as dicts. Relative local paths in proc_url/mask_url (as
+    written by snapshot.py) are resolved against the manifest's directory.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    base = Path(path).resolve().parent
+    for r in rows:
+        for col in ("proc_url", "mask_url"):
+            url = r.get(col)
+            if url and "://" not in url and not os.path.isabs(url):
+                r[col] = str(base / url)
+    return rows
+
+
+def _normalise(fractions: Sequence[float]) -> List[float]:
+    if len(fractions) != len(SPLIT_NAMES) or any(x < 0 for x in fractions) or sum(fractions) <= 0:
+        raise ValueError(f"Expected {len(SPLIT_NAMES)} non-negative fractions, got {list(fractions)}")
+    total = float(sum(fractions))
+    return [x / total for x in fractions]
+
+
+def artifact_path(split_dir: Path, manifest_sha: str, fractions: Sequence[float], seed: int) -> Path:
+    """Cache location for a split of a given manifest content and parameters."""
+    fracs = _normalise(fractions)
+    # Rounded percentages for readability, plus a hash of the exact values so
+    # that e.g. 0.701/0.149/0.15 and 0.7/0.15/0.15 never share a file
+    frac_tag = "-".join(f"{round(x * 100):d}" for x in fracs)
+    frac_hash = hashlib.sha256(repr(fracs).encode()).hexdigest()[:8]
+    return Path(split_dir) / f"split_{manifest_sha[:16]}_s{seed}_{frac_tag}_{frac_hash}.json"
+
+
+def compute_split(rows: List[Dict[str, str]], fractions: Sequence[float] = DEFAULT_FRACTIONS,
+                  seed: int = DEFAULT_SEED) -> Dict[str, List[str]]:
+    """
+    Assign patients to splits.
+
+    Patients are processed per group in a seeded random order (largest first,
+    so big patients cannot overshoot a small split late in the pass). Each one
+    goes to the split with the largest unmet (group, view) quota.
+    """
+    fracs = _normalise(fractions)
+
+    patient_views = defaultdict(Counter)
+    patient_group = {}
+    for r in rows:
+        pid = r["patient_id"]
+        patient_views[pid][r["view"]] += 1
+        patient_group.setdefault(pid, r["group"])
+
+    # Per-group (group, view) totals → per-split targets
+    cell_totals = defaultdict(Counter)
+    for pid, views in patient_views.items():
+        cell_totals[patient_group[pid]].update(views)
+
+    rng = random.Random(seed)
+    splits = {name: [] for name in SPLIT_NAMES}
+
+    for group in sorted(cell_totals):
+        targets = [{v: f * n for v, n in cell_totals[group].items()} for f in fracs]
+        assigned = [Counter() for _ in SPLIT_NAMES]
+
+        patients = sorted(p for p, g in patient_group.items() if g == group)
+        rng.shuffle(patients)
+        patients.sort(key=lambda p: -sum(patient_views[p].values()))
+
+        for pid in patients:
+            views = patient_views[pid]
+            best_idx, best_score = 0, None
+            for idx in range(len(SPLIT_NAMES)):
+                if fracs[idx] == 0:
+                    continue
+                deficit = sum(
+                    min(n, targets[idx].get(v, 0) - assigned[idx][v]) for v, n in views.items()
+                )
+                remaining = sum(targets[idx].values()) - sum(assigned[idx].values())
+                score = (deficit, remaining / fracs[idx])
+                if best_score is None or score > best_score:
+                    best_idx, best_score = idx, score
+            assigned[best_idx].update(views)
+            splits[SPLIT_NAMES[best_idx]].append(pid)
+
+    return {name: sorted(pids) for name, pids in splits.items()}
+
+
+def _summarise(rows: List[Dict[str, str]], splits: Dict[str, List[str]]) -> Dict:
+    lookup = {pid: name for name, pids in splits.items() for pid in pids}
+    counts = {name: {"patients": len(pids), "rows": 0, "group": Counter(), "view": Counter()}
+              for name, pids in splits.items()}
+    for r in rows:
+        c = counts[lookup[r["patient_id"]]]
+        c["rows"] += 1
+        c["group"][r["group"]] += 1
+        c["view"][r["view"]] += 1
+    return {
+        name: {"patients": c["patients"], "rows": c["rows"],
+               "group": dict(sorted(c["group"].items())), "view": dict(sorted(c["view"].items()))}
+        for name, c in counts.items()
+    }
+
+
+def load_or_create_split(manifest_path: Path = DEFAULT_MANIFEST,
+                         fractions: Sequence[float] = DEFAULT_FRACTIONS,
+                         seed: int = DEFAULT_SEED,
+                         split_dir: Path = DEFAULT_SPLIT_DIR,
+                         force: bool = False) -> Dict:
+    """
+    Return the split artifact for `manifest_path`, computing and caching it if needed.
+
+    The artifact is written atomically; since the split is deterministic,
+    concurrent writers (e.g. several ranks) produce identical files.
+    """
+    manifest_path = Path(manifest_path)
+    sha = sha256_of_file(manifest_path)
+    path = artifact_path(split_dir, sha, fractions, seed)
+
+    if path.exists() and not force:
+        artifact = json.loads(path.read_text())
+        if (artifact.get("manifest_sha256") == sha and artifact.get("seed") == seed
+                and artifact.get("fractions") == dict(zip(SPLIT_NAMES, _normalise(fractions)))):
+            return artifact
+
+    rows = read_manifest(manifest_path)
+    splits = compute_split(rows, fractions, seed)
+    artifact = {
+        "manifest": manifest_path.name,
+        "manifest_sha256": sha,
+        "seed": seed,
+        "fractions": dict(zip(SPLIT_NAMES, _normalise(fractions))),
+        "splits": splits,
+        "counts": _summarise(rows, splits),
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(artifact, indent=2))
+    os.replace(tmp, path)
+    return artifact
+
+
+def rows_for_split(rows: List[Dict[str, str]], artifact: Dict, split: str) -> List[Dict[str, str]]:
+    """Filter manifest rows to the patients of one split, preserving manifest order."""
+    if split not in artifact["splits"]:
+        raise ValueError(f"Unknown split '{split}', expected one of {list(artifact['splits'])}")
+    members = set(artifact["splits"][split])
+    return [r for r in rows if r["patient_id"] in members]
+
+
+def split_indices(rows: List[Dict[str, str]], artifact: Dict) -> Dict[str, List[int]]:
+    """Row indices per split, e.g. for `df.iloc[...]` or a torch Subset."""
+    lookup = {pid: name for name, pids in artifact["splits"].items() for pid in pids}
+    out = {name: [] for name in artifact["splits"]}
+    for idx, r in enumerate(rows):
+        name: Optional[str] = lookup.get(r["patient_id"])
+        if name is not None:
+            out[name].append(idx)
+    return out
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.input.exists():
+        raise SystemExit(f"Manifest not found: {args.input}")
+
+    artifact = load_or_create_split(args.input, args.fractions, args.seed, args.split_dir, force=args.force)
+    path = artifact_path(args.split_dir, artifact["manifest_sha256"], args.fractions, args.seed)
+
+    print(f"{artifact['manifest']} SHA-256: {artifact['manifest_sha256']}")
+    for name, c in artifact["counts"].items():
+        print(f"  {name:<5}: {c['patients']:4d} patients  {c['rows']:5d} rows  "
+              f"group={c['group']}  view={c['view']}")
+    print(f"Split artifact: {path}")
+
+
+if __name__ == "__main__":
+    main()
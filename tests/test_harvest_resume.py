@@ -0,0 +1,41 @@
+"""Tests for resuming a harvest from the resources_by_dataset.jsonl checkpoint."""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from file_catalog import FileCatalog  # noqa: E402
+from harvester import LabCASHarvester  # noqa: E402
+from labcas_client import LabCASClient  # noqa: E402
+from mock_labcas import MockLabCAS  # noqa: E402
+from token_manager import get_jwt_token  # noqa: E402
+
+COLLECTION_ID = "Automated_Quantitative_Measures_of_Breast_Density_Data"
+
+
+def test_resume_after_torn_checkpoint_line(tmp_path, monkeypatch):
+    monkeypatch.setenv("LABCAS_USERNAME", "mock")
+    monkeypatch.setenv("LABCAS_PASSWORD", "mock")
+    with MockLabCAS(scale=0.02) as mock:
+        client = LabCASClient(get_jwt_token("mock", "mock", mock.base_url), base_url=mock.base_url)
+        first = LabCASHarvester(client, tmp_path).harvest_all(COLLECTION_ID)
+        datasets = len(first["resources_by_dataset"])
+        assert datasets > 5
+
+        # Crash mid-append: keep 3 datasets plus half of the 4th line
+        checkpoint = tmp_path / "resources_by_dataset.jsonl"
+        lines = checkpoint.read_bytes().splitlines(keepends=True)
+        checkpoint.write_bytes(b"".join(lines[:3]) + lines[3][:len(lines[3]) // 2])
+        os.remove(tmp_path / "resources_by_dataset.json")
+
+        LabCASHarvester(client, tmp_path).harvest_all(COLLECTION_ID)
+
+    text = checkpoint.read_bytes()
+    assert text.endswith(b"\n")
+    entries = [json.loads(line) for line in text.splitlines()]         # every line parses
+    assert len(entries) == datasets
+    assert len(FileCatalog.load(checkpoint)) == datasets
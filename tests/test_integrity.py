@@ -0,0 +1,25 @@
+"""Tests for integrity.py: only verified downloads are served from the store."""
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from integrity import IntegrityStore  # noqa: E402
+
+
+def test_size_mismatch_is_not_served(tmp_path):
+    src = tmp_path / "C0250_MG_PRO_LCC.dcm"
+    src.write_bytes(b"DICM" * 100)
+    store = IntegrityStore(tmp_path / "store", base_url="http://127.0.0.1:9")
+
+    rec = store.fetch("C0250/PROC/C0250_MG_PRO_LCC.dcm", expected_size=1000, url=str(src))
+    assert rec["status"] == "size_mismatch"
+    assert store.path_for(rec["file_id"]) is None
+    # Still not served after reloading the index
+    assert IntegrityStore(tmp_path / "store").path_for(rec["file_id"]) is None
+
+    rec = store.fetch("C0250/PROC/C0250_MG_PRO_LCC.dcm", expected_size=400, url=str(src))
+    assert rec["status"] == "ok"
+    assert store.path_for(rec["file_id"]).read_bytes() == src.read_bytes()
@@ -0,0 +1,120 @@
+"""Tests for shards.py: unique shard names across exports and per-epoch pair coverage."""
+
+import json
+import os
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from shards import ShardReader, export_shards, write_croissant  # noqa: E402
+
+VIEWS = ("LCC", "LMLO", "RCC", "RMLO")
+
+
+def make_rows(tmp_path: Path, n: int, tag: str):
+    """`n` manifest rows whose DICOMs are local files filled with `tag`"""
+    files = tmp_path / f"files-{tag}"
+    files.mkdir()
+    rows = []
+    for i in range(n):
+        patient, view = f"C{i // len(VIEWS):04d}", VIEWS[i % len(VIEWS)]
+        urls = {}
+        for side in ("proc", "mask"):
+            path = files / f"{patient}_{view}.{side}.dcm"
+            path.write_bytes(f"{tag}:{side}:{patient}_{view}".encode() * 20)
+            urls[side] = str(path)
+        rows.append({"group": "case", "patient_id": patient, "view": view,
+                     "proc_url": urls["proc"], "mask_url": urls["mask"],
+                     "proc_name": f"{tag}-{patient}_{view}", "mask_name": f"{patient}_{view}"})
+    return rows
+
+
+def export(tmp_path: Path, name: str, rows, max_bytes: int = 16 << 10) -> Path:
+    out_dir = tmp_path / name
+    source = {"manifest": f"{name}.csv", "manifest_sha256": name * 8, "split": None}
+    export_shards(rows, out_dir, source, max_bytes=max_bytes, workers=1)
+    return out_dir
+
+
+@pytest.fixture
+def shard_dir(tmp_path):
+    # 103 pairs in 15 shards of 7 (the last one 5): shares straddle shard boundaries
+    return export(tmp_path, "all", make_rows(tmp_path, 103, "a"), max_bytes=24 << 10)
+
+
+def test_two_exports_load_through_mlcroissant(tmp_path):
+    pytest.importorskip("mlcroissant")
+    # Same pair keys, different bytes: only the shard contents tell the exports apart
+    exports = [export(tmp_path, tag, make_rows(tmp_path, 12, tag)) for tag in ("first", "second")]
+    names = [{s["name"] for s in json.loads((d / "index.json").read_text())["shards"]} for d in exports]
+    assert not names[0] & names[1]
+
+    paths = [str(write_croissant(d, json.loads((d / "index.json").read_text()))) for d in exports]
+    script = (
+        "import json, sys\n"
+        "import mlcroissant as mlc\n"
+        "print(json.dumps([sorted(json.loads(r['json/content'])['proc_name']\n"
+        "                         for r in mlc.Dataset(jsonld=p).records(record_set='json'))\n"
+        "                  for p in sys.argv[1:]]))\n"
+    )
+    # Both loads share one (empty) Croissant cache, as back-to-back loads on one machine would
+    env = {**os.environ, "CROISSANT_CACHE": str(tmp_path / "croissant_cache")}
+    proc = subprocess.run([sys.executable, "-c", script, *paths], capture_output=True, text=True, env=env)
+    assert proc.returncode == 0, proc.stderr
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    for tag, names_loaded in zip(("first", "second"), loaded):
+        assert len(names_loaded) == 12
+        assert all(n.startswith(f"{tag}-") for n in names_loaded)
+
+
+@pytest.mark.parametrize("num_slots", [1, 2, 3, 7, 40, 150])
+def test_every_pair_read_once_per_epoch(shard_dir, num_slots):
+    for epoch in (0, 1):
+        seen = Counter()
+        for slot in range(num_slots):
+            reader = ShardReader(shard_dir, shuffle_buffer=8, slot=slot, num_slots=num_slots)
+            reader.set_epoch(epoch)
+            seen.update(s["key"] for s in reader)
+        assert len(seen) == 103 and set(seen.values()) == {1}
+
+
+@pytest.mark.parametrize("num_slots", [2, 4, 9])
+def test_padded_slots_cover_every_pair(shard_dir, num_slots):
+    per_slot = -(-103 // num_slots)
+    seen = Counter()
+    for slot in range(num_slots):
+        keys = [s["key"] for s in ShardReader(shard_dir, shuffle_buffer=0, slot=slot, num_slots=num_slots,
+                                              num_samples=per_slot)]
+        assert len(keys) == per_slot
+        seen.update(keys)
+    assert len(seen) == 103
+    assert sum(seen.values()) - 103 == per_slot * num_slots - 103       # only the padding repeats
+
+
+def test_uneven_counts_cover_every_pair(shard_dir):
+    # As ShardedMammogramDataset assigns them: 2 ranks × 3 workers, batch size 4 → 13 batches per rank
+    counts = [20, 16, 16, 20, 16, 16]
+    seen = Counter()
+    for slot in range(len(counts)):
+        reader = ShardReader(shard_dir, slot=slot, num_slots=len(counts), num_samples=counts)
+        got = [s["key"] for s in reader]
+        assert len(got) == counts[slot]
+        seen.update(got)
+    assert len(seen) == 103
+
+
+def test_shuffle_buffer_bytes_bounds_buffer(shard_dir):
+    first = json.loads((shard_dir / "index.json").read_text())["shards"][0]["samples"][0]
+    pair_bytes = sum(size for _, size in first["members"].values())
+    reader = ShardReader(shard_dir, shuffle_buffer=1000, shuffle_buffer_bytes=3 * pair_bytes)
+    stream, read = reader._stream, []
+    reader._stream = lambda: (read.append(s["key"]) or s for s in stream())
+    held = [len(read) - n for n, _ in enumerate(reader)]       # pairs buffered when each is yielded
+    assert len(held) == 103 and len(set(read)) == 103
+    assert max(held) <= 4
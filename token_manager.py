@@ -0,0 +1,208 @@
+"""
+Shared LabCAS JWT provider with proactive background refresh.
+
+A TokenProvider keeps the current token and refreshes it `refresh_margin`
+seconds before it expires (from the JWT `exp` claim, or `fallback_ttl`
+after issue when the token carries none) on a daemon thread. Readers just
+take the current token, so requests never wait on re-authentication while
+the refresher keeps up; only the very first fetch, an already-expired
+token, or an explicit refresh after a 401 are synchronous.
+
+Providers are shared per base URL through get_token_provider(), and are
+fork-safe: a DataLoader worker forked from the parent keeps the inherited
+token and starts its own refresher on first use.
+
+Usage:
+    from token_manager import get_token_provider
+
+    tokens = get_token_provider("https://edrn-labcas.jpl.nasa.gov")
+    requests.get(url, headers=tokens.headers())
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.auth import HTTPBasicAuth
+
+from instrumentation import incr, span
+
+DEFAULT_BASE_URL = "https://edrn-labcas.jpl.nasa.gov"
+
+
+def get_jwt_token(username: str, password: str, base_url: str = DEFAULT_BASE_URL) -> str:
+    """
+    Authenticate with LabCAS and return a JWT token using POST method.
+    """
+    url = f"{base_url}/data-access-api/auth"
+    with span("labcas_auth_seconds"):
+        resp = requests.post(url, auth=HTTPBasicAuth(username, password))
+    resp.raise_for_status()
+    return resp.text.strip()
+
+
+def jwt_expiry(token: str) -> Optional[float]:
+    """`exp` claim (epoch seconds) of a JWT, or None if it has none / is not a JWT"""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenProvider:
+    """
+    Thread-safe JWT holder that refreshes ahead of expiry in the background
+    """
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL, token: Optional[str] = None,
+                 username: Optional[str] = None, password: Optional[str] = None,
+                 refresh_margin: float = 300, fallback_ttl: float = 1800, retry_interval: float = 10):
+        self.base_url = base_url
+        self.username = username or os.getenv('LABCAS_USERNAME')
+        self.password = password or os.getenv('LABCAS_PASSWORD')
+        self.refresh_margin = refresh_margin
+        self.fallback_ttl = fallback_ttl
+        self.retry_interval = retry_interval
+
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._init_locks()
+        if token:
+            self._set(token)
+
+    def _init_locks(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def _after_fork(self):
+        # Locks may have been held by a parent thread at fork time, and the refresher did not survive
+        self._init_locks()
+
+    # ---------- State ----------
+
+    def _set(self, token: str):
+        issued = time.time()
+        lifetime = (jwt_expiry(token) or issued + self.fallback_ttl) - issued
+        self._token = token
+        self._expires_at = issued + lifetime
+        # Never schedule the refresh later than half the lifetime for short-lived tokens
+        self._refresh_at = self._expires_at - min(self.refresh_margin, lifetime / 2)
+
+    def seed(self, token: str) -> bool:
+        """
+        Adopt an externally obtained token if it outlives the current one
+        (a token without an `exp` claim always counts as newer). Returns
+        whether it was taken.
+        """
+        with self._lock:
+            if token == self._token:
+                return False
+            if self._token is not None and (jwt_expiry(token) or float("inf")) <= self._expires_at:
+                return False
+            self._set(token)
+        self._wakeup.set()
+        return True
+
+    @property
+    def can_refresh(self) -> bool:
+        return bool(self.username and self.password)
+
+    @property
+    def expires_in(self) -> float:
+        return self._expires_at - time.time()
+
+    # ---------- Access ----------
+
+    @property
+    def token(self) -> str:
+        """Current token; blocks only when there is none yet or it has already expired"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        if self._token is None or (self.expires_in <= 0 and self.can_refresh):
+            self.refresh(stale_token=self._token)
+        self._ensure_refresher()
+        return self._token
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def refresh(self, stale_token: Optional[str] = None) -> str:
+        """
+        Re-authenticate now. If `stale_token` is given and another thread has
+        already replaced it, the current token is returned without a new request.
+        """
+        with self._lock:
+            if self._token is not None and stale_token is not None and stale_token != self._token:
+                return self._token
+            if not self.can_refresh:
+                raise RuntimeError("Cannot obtain a LabCAS token: LABCAS_USERNAME / LABCAS_PASSWORD not set")
+            print("⟳ Refreshing JWT token...")
+            incr("labcas_token_refreshes_total")
+            self._set(get_jwt_token(self.username, self.password, self.base_url))
+            print("✓ Token refreshed")
+        self._wakeup.set()
+        return self._token
+
+    # ---------- Background refresh ----------
+
+    def _ensure_refresher(self):
+        if self._thread is not None or not self.can_refresh:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="labcas-token-refresh", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(max(0.0, self._refresh_at - time.time()))
+            self._wakeup.clear()
+            if time.time() < self._refresh_at:
+                continue
+            try:
+                incr("labcas_token_proactive_refreshes_total")
+                self.refresh(stale_token=self._token)
+            except Exception as e:
+                print(f"⚠ Background token refresh failed: {e}")
+                self._refresh_at = time.time() + self.retry_interval
+
+
+_PROVIDERS: Dict[str, TokenProvider] = {}
+_PROVIDERS_LOCK = threading.Lock()
+
+
+def get_token_provider(base_url: str = DEFAULT_BASE_URL, token: Optional[str] = None) -> TokenProvider:
+    """
+    Process-wide provider for `base_url`, created on first use. A `token`
+    seeds a new provider, and replaces the token of an existing one when it
+    expires later; an older token is ignored with a warning.
+    """
+    provider = _PROVIDERS.get(base_url)
+    if provider is None:
+        with _PROVIDERS_LOCK:
+            provider = _PROVIDERS.get(base_url)
+            if provider is None:
+                return _PROVIDERS.setdefault(base_url, TokenProvider(base_url, token=token))
+    if token and token != provider._token and not provider.seed(token):
+        print(f"⚠ Ignoring a token for {base_url} that expires before the shared provider's current one")
+    return provider
+
+
+def _reset_after_fork():
+    global _PROVIDERS_LOCK
+    _PROVIDERS_LOCK = threading.Lock()
+    for provider in _PROVIDERS.values():
+        provider._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
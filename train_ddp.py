@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Data-parallel CPU training of the U-Net (same model and Dice+BCE loss as
+train_unet.ipynb) using torch.distributed with the gloo backend.
+
+Patients are split with split_manifest.py; each rank reads its shard of the
+train/val split through a DistributedSampler, or streams its share of the
+tar shards written by shards.py (--shards). Gradients are accumulated over
+--accum-steps micro-batches before every optimizer step, and rank 0 writes a
+resumable checkpoint after each epoch.
+
+Usage:
+    # one box, 8 local processes
+    python train_ddp.py --nproc 8 --epochs 20 --batch-size 2 --accum-steps 4
+
+    # several boxes: same command on each node with its own --node-rank
+    python train_ddp.py --nproc 8 --nnodes 2 --node-rank 0 --init-method tcp://10.0.0.1:29500
+
+    # stream from tar shards (python shards.py --split train / --split val)
+    python train_ddp.py --nproc 8 --shards outputs/shards
+
+    # or let torchrun spawn the processes (RANK/WORLD_SIZE/MASTER_ADDR set by torchrun)
+    torchrun --nnodes 2 --nproc-per-node 8 --rdzv-endpoint 10.0.0.1:29500 train_ddp.py
+"""
+
+import argparse
+import contextlib
+import os
+import socket
+import time
+from pathlib import Path
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader, Sampler
+from torch.utils.data.distributed import DistributedSampler
+
+from mammogram_dataset import IMG_SIZE, MammogramDataset, ShardedMammogramDataset
+from pair_stats import STATS_DIR, foreground_weights, load_stats, stats_path
+from shards import SHUFFLE_BUFFER, SHUFFLE_BUFFER_BYTES
+from split_manifest import load_or_create_split, read_manifest, rows_for_split, sha256_of_file
+from unet import SimpleUNet, combined_loss, dice_score
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Distributed (gloo) CPU training of the U-Net")
+    p.add_argument("--manifest", type=Path, default=Path("manifest.csv"), help="Input CSV manifest")
+    p.add_argument("--split-dir", type=Path, default=Path("splits"), help="Cached split artifacts")
+    p.add_argument("--fractions", type=float, nargs=3, default=(0.7, 0.15, 0.15), metavar=("TRAIN", "VAL", "TEST"))
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--epochs", type=int, default=20)
+    p.add_argument("--batch-size", type=int, default=1, help="Micro-batch size per process")
+    p.add_argument("--accum-steps", type=int, default=1, help="Micro-batches per optimizer step")
+    p.add_argument("--lr", type=float, default=1e-3)
+    p.add_argument("--img-size", type=int, default=IMG_SIZE)
+    p.add_argument("--num-workers", type=int, default=2, help="DataLoader workers per process")
+    p.add_argument("--checkpoint-dir", type=Path, default=Path("outputs/ddp"))
+    p.add_argument("--no-resume", action="store_true", help="Ignore an existing last.pth")
+    p.add_argument("--log-every", type=int, default=10, help="Optimizer steps between throughput logs")
+    p.add_argument("--stats", type=Path, default=None,
+                   help="pair_stats.py sidecar (default: the one cached for --manifest, if present)")
+    p.add_argument("--balance-foreground", action="store_true",
+                   help="Sample training pairs evenly across mask foreground-fraction strata (needs stats)")
+    p.add_argument("--shards", type=Path, default=None,
+                   help="Read pairs from shards.py exports in <dir>/train and <dir>/val instead of LabCAS")
+    p.add_argument("--shuffle-buffer", type=int, default=SHUFFLE_BUFFER,
+                   help="Training pairs held for shuffling per DataLoader worker (--shards)")
+    p.add_argument("--shuffle-buffer-mb", type=int, default=SHUFFLE_BUFFER_BYTES >> 20,
+                   help="Cap on the shuffle buffer's raw DICOM bytes per worker, in MiB (--shards)")
+    # Process layout / rendezvous
+    p.add_argument("--nproc", type=int, default=1, help="Processes to spawn on this node")
+    p.add_argument("--nnodes", type=int, default=1)
+    p.add_argument("--node-rank", type=int, default=0)
+    p.add_argument("--init-method", default=None,
+                   help="Rendezvous URL, e.g. tcp://host:port (default: a free local port, single node only)")
+    p.add_argument("--threads", type=int, default=None,
+                   help="Intra-op threads per process (default: cores / local processes)")
+    return p.parse_args(argv)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _log(rank: int, msg: str):
+    print(f"[rank {rank}] {msg}", flush=True)
+
+
+def _all_reduce_sum(*values: float):
+    t = torch.tensor(values, dtype=torch.float64)
+    dist.all_reduce(t, op=dist.ReduceOp.SUM)
+    return t.tolist()
+
+
+def save_checkpoint(path: Path, state: dict):
+    """Write atomically so a crash mid-save never corrupts the resume point."""
+    tmp = path.with_suffix(".tmp")
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+
+
+class DistributedWeightedSampler(Sampler):
+    """
+    Weighted sampling with replacement, sharded across ranks: every rank
+    draws the same global sequence for the epoch and keeps every
+    world_size-th index.
+    """
+
+    def __init__(self, weights, num_replicas: int, rank: int, seed: int = 0):
+        self.weights = torch.as_tensor(weights, dtype=torch.double)
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.epoch = 0
+        self.num_samples = -(-len(self.weights) // num_replicas)
+
+    def __iter__(self):
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        total = self.num_samples * self.num_replicas
+        idx = torch.multinomial(self.weights, total, replacement=True, generator=g).tolist()
+        return iter(idx[self.rank:total:self.num_replicas])
+
+    def __len__(self):
+        return self.num_samples
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+
+def build_shard_loaders(args, rank: int, world_size: int, stats):
+    kw = dict(img_size=args.img_size, stats=stats, seed=args.seed, rank=rank, world_size=world_size,
+              batch_size=args.batch_size)
+    train_ds = ShardedMammogramDataset(args.shards / "train", augment=True,
+                                       shuffle_buffer=args.shuffle_buffer,
+                                       shuffle_buffer_bytes=args.shuffle_buffer_mb << 20, **kw)
+    val_ds   = ShardedMammogramDataset(args.shards / "val", shuffle_buffer=0, **kw)
+
+    loader_kw = dict(batch_size=args.batch_size, num_workers=args.num_workers,
+                     persistent_workers=args.num_workers > 0)
+    train_loader = DataLoader(train_ds, drop_last=True, **loader_kw)
+    val_loader   = DataLoader(val_ds, **loader_kw)
+    return train_loader, val_loader, train_ds
+
+
+def build_loaders(args, rank: int, world_size: int):
+    artifact = load_or_create_split(args.manifest, args.fractions, args.seed, args.split_dir)
+    rows = read_manifest(args.manifest)
+
+    stats_file = args.stats or stats_path(STATS_DIR, sha256_of_file(args.manifest))
+    stats = load_stats(stats_file)
+    if rank == 0 and stats:
+        _log(rank, f"using pair stats for {len(stats)} pairs from {stats_file}")
+    if args.shards is not None:
+        return build_shard_loaders(args, rank, world_size, stats)
+
+    train_rows = rows_for_split(rows, artifact, "train")
+    train_ds = MammogramDataset(train_rows, img_size=args.img_size, augment=True, stats=stats)
+    val_ds   = MammogramDataset(rows_for_split(rows, artifact, "val"), img_size=args.img_size, stats=stats)
+
+    if args.balance_foreground:
+        if not stats:
+            raise SystemExit(f"--balance-foreground needs pair stats; run pair_stats.py first ({stats_file})")
+        train_sampler = DistributedWeightedSampler(foreground_weights(train_rows, stats),
+                                                   num_replicas=world_size, rank=rank, seed=args.seed)
+    else:
+        train_sampler = DistributedSampler(train_ds, num_replicas=world_size, rank=rank, shuffle=True,
+                                           seed=args.seed)
+    val_sampler   = DistributedSampler(val_ds, num_replicas=world_size, rank=rank, shuffle=False)
+
+    loader_kw = dict(batch_size=args.batch_size, num_workers=args.num_workers,
+                     persistent_workers=args.num_workers > 0)
+    train_loader = DataLoader(train_ds, sampler=train_sampler, drop_last=True, **loader_kw)
+    val_loader   = DataLoader(val_ds, sampler=val_sampler, **loader_kw)
+    return train_loader, val_loader, train_sampler
+
+
+def train_epoch(model, loader, optimizer, args, rank: int, epoch: int):
+    model.train()
+    loss_sum, dice_sum, n_batches, n_samples = 0.0, 0.0, 0, 0
+    data_time = 0.0
+    t_start = t_window = time.perf_counter()
+    window_samples, opt_steps = 0, 0
+
+    optimizer.zero_grad()
+    t_fetch = time.perf_counter()
+    for step, (imgs, masks, _) in enumerate(loader, 1):
+        data_time += time.perf_counter() - t_fetch
+        boundary = step % args.accum_steps == 0 or step == len(loader)
+
+        # Skip the gradient all-reduce on non-boundary micro-batches
+        ctx = contextlib.nullcontext() if boundary else model.no_sync()
+        with ctx:
+            preds = model(imgs)
+            loss  = combined_loss(preds, masks)
+            (loss / args.accum_steps).backward()
+
+        if boundary:
+            optimizer.step()
+            optimizer.zero_grad()
+            opt_steps += 1
+
+        loss_sum += loss.item()
+        dice_sum += dice_score(preds.detach(), masks)
+        n_batches += 1
+        n_samples += imgs.size(0)
+        window_samples += imgs.size(0)
+
+        if boundary and args.log_every and opt_steps % args.log_every == 0:
+            now = time.perf_counter()
+            _log(rank, f"epoch {epoch:02d} step {opt_steps}: "
+                       f"{window_samples / (now - t_window):.2f} samples/s  loss {loss.item():.4f}")
+            t_window, window_samples = now, 0
+        t_fetch = time.perf_counter()
+
+    elapsed = time.perf_counter() - t_start
+    _log(rank, f"epoch {epoch:02d} train: {n_samples} samples in {elapsed:.1f}s "
+               f"({n_samples / max(elapsed, 1e-9):.2f} samples/s, data wait {100 * data_time / max(elapsed, 1e-9):.0f}%)")
+    return loss_sum, dice_sum, n_batches
+
+
+@torch.no_grad()
+def evaluate(model, loader):
+    model.eval()
+    loss_sum, dice_sum, n_batches = 0.0, 0.0, 0
+    for imgs, masks, _ in loader:
+        preds = model(imgs)
+        loss_sum += combined_loss(preds, masks).item()
+        dice_sum += dice_score(preds, masks)
+        n_batches += 1
+    return loss_sum, dice_sum, n_batches
+
+
+def run(rank: int, world_size: int, args):
+    dist.init_process_group("gloo", init_method=args.init_method, rank=rank, world_size=world_size)
+    try:
+        torch.manual_seed(args.seed)
+        torch.set_num_threads(args.threads)
+
+        train_loader, val_loader, train_sampler = build_loaders(args, rank, world_size)
+        if rank == 0:
+            _log(rank, f"world={world_size}  train={len(train_loader.dataset)}  val={len(val_loader.dataset)}  "
+                       f"effective batch={args.batch_size * args.accum_steps * world_size}")
+
+        model = DDP(SimpleUNet())
+        optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+        scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=5)
+
+        args.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        last_path = args.checkpoint_dir / "last.pth"
+        best_path = args.checkpoint_dir / "best_unet.pth"
+
+        start_epoch, best_val_loss = 1, float('inf')
+        if last_path.exists() and not args.no_resume:
+            ckpt = torch.load(last_path, map_location="cpu")
+            model.module.load_state_dict(ckpt["model"])
+            optimizer.load_state_dict(ckpt["optimizer"])
+            scheduler.load_state_dict(ckpt["scheduler"])
+            start_epoch, best_val_loss = ckpt["epoch"] + 1, ckpt["best_val_loss"]
+            _log(rank, f"resumed from {last_path} at epoch {start_epoch}")
+
+        for epoch in range(start_epoch, args.epochs + 1):
+            train_sampler.set_epoch(epoch)
+            t_loss, t_dice, t_n = _all_reduce_sum(*train_epoch(model, train_loader, optimizer, args, rank, epoch))
+            v_loss, v_dice, v_n = _all_reduce_sum(*evaluate(model, val_loader))
+
+            avg_tloss, avg_tdice = t_loss / max(t_n, 1), t_dice / max(t_n, 1)
+            avg_vloss, avg_vdice = v_loss / max(v_n, 1), v_dice / max(v_n, 1)
+            scheduler.step(avg_vloss)
+
+            improved = avg_vloss < best_val_loss
+            best_val_loss = min(best_val_loss, avg_vloss)
+
+            if rank == 0:
+                if improved:
+                    torch.save(model.module.state_dict(), best_path)
+                save_checkpoint(last_path, {
+                    "epoch": epoch,
+                    "model": model.module.state_dict(),
+                    "optimizer": optimizer.state_dict(),
+                    "scheduler": scheduler.state_dict(),
+                    "best_val_loss": best_val_loss,
+                })
+                print(f"Epoch {epoch:02d}/{args.epochs}  "
+                      f"| Train Loss: {avg_tloss:.4f}  Dice: {avg_tdice:.4f}  "
+                      f"| Val Loss: {avg_vloss:.4f}  Dice: {avg_vdice:.4f}{'  ✓ saved' if improved else ''}",
+                      flush=True)
+            dist.barrier()
+
+        if rank == 0:
+            print(f"\nTraining complete. Best val loss: {best_val_loss:.4f}")
+            print(f"Best model → {best_path}")
+    finally:
+        dist.destroy_process_group()
+
+
+def _spawned(local_rank: int, args):
+    run(args.node_rank * args.nproc + local_rank, args.nnodes * args.nproc, args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.manifest.exists():
+        raise SystemExit(f"Manifest not found: {args.manifest}. Run build_manifest.py first.")
+    if args.accum_steps < 1:
+        raise SystemExit("--accum-steps must be >= 1")
+    if args.shards is not None and args.balance_foreground:
+        raise SystemExit("--balance-foreground is not supported with --shards")
+
+    if "RANK" in os.environ and "WORLD_SIZE" in os.environ:
+        # Launched by torchrun: rendezvous comes from the environment
+        local_procs = int(os.environ.get("LOCAL_WORLD_SIZE", 1))
+        args.threads = args.threads or max(1, (os.cpu_count() or 1) // local_procs)
+        args.init_method = "env://"
+        run(int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"]), args)
+        return
+
+    if args.init_method is None:
+        if args.nnodes > 1:
+            raise SystemExit("--init-method is required when --nnodes > 1")
+        args.init_method = f"tcp://127.0.0.1:{_free_port()}"
+    args.threads = args.threads or max(1, (os.cpu_count() or 1) // args.nproc)
+
+    if args.nproc == 1 and args.nnodes == 1:
+        run(0, 1, args)
+    else:
+        mp.spawn(_spawned, args=(args,), nprocs=args.nproc, join=True)
+
+
+if __name__ == "__main__":
+    main()
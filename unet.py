@@ -0,0 +1,118 @@
+"""
+Lightweight U-Net and Dice+BCE loss used by train_ddp.py; the same
+architecture and loss as defined inline in train_unet.ipynb.
+"""
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+# ── building blocks ────────────────────────────────────────────────────────
+
+class ConvBlock(nn.Module):
+    """Two 3×3 convolutions + BatchNorm + ReLU."""
+    def __init__(self, in_ch: int, out_ch: int):
+        super().__init__()
+        self.net = nn.Sequential(
+            nn.Conv2d(in_ch,  out_ch, 3, padding=1, bias=False),
+            nn.BatchNorm2d(out_ch),
+            nn.ReLU(inplace=True),
+            nn.Conv2d(out_ch, out_ch, 3, padding=1, bias=False),
+            nn.BatchNorm2d(out_ch),
+            nn.ReLU(inplace=True),
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+
+class EncoderBlock(nn.Module):
+    """ConvBlock → MaxPool. Returns skip feature and pooled output."""
+    def __init__(self, in_ch: int, out_ch: int):
+        super().__init__()
+        self.conv = ConvBlock(in_ch, out_ch)
+        self.pool = nn.MaxPool2d(2)
+
+    def forward(self, x):
+        skip = self.conv(x)
+        return skip, self.pool(skip)
+
+
+class DecoderBlock(nn.Module):
+    """Upsample → concat skip → ConvBlock."""
+    def __init__(self, in_ch: int, out_ch: int):
+        super().__init__()
+        self.up   = nn.ConvTranspose2d(in_ch, out_ch, kernel_size=2, stride=2)
+        self.conv = ConvBlock(in_ch, out_ch)   # in_ch = out_ch(up) + out_ch(skip)
+
+    def forward(self, x, skip):
+        x = self.up(x)
+        if x.shape != skip.shape:
+            x = F.interpolate(x, size=skip.shape[2:], mode='bilinear', align_corners=False)
+        x = torch.cat([skip, x], dim=1)
+        return self.conv(x)
+
+
+# ── U-Net ──────────────────────────────────────────────────────────────────
+
+class SimpleUNet(nn.Module):
+    """
+    Lightweight U-Net for single-channel image segmentation.
+
+    Encoder  : 1 → 16 → 32 → 64
+    Bottleneck: 64 → 128
+    Decoder  : 128 → 64 → 32 → 16 → 1 (sigmoid)
+    """
+    def __init__(self):
+        super().__init__()
+        self.enc1       = EncoderBlock(1,   16)
+        self.enc2       = EncoderBlock(16,  32)
+        self.enc3       = EncoderBlock(32,  64)
+        self.bottleneck = ConvBlock(64, 128)
+        self.dec3       = DecoderBlock(128, 64)
+        self.dec2       = DecoderBlock(64,  32)
+        self.dec1       = DecoderBlock(32,  16)
+        self.out        = nn.Conv2d(16, 1, kernel_size=1)
+
+    def forward(self, x):
+        s1, x = self.enc1(x)
+        s2, x = self.enc2(x)
+        s3, x = self.enc3(x)
+        x     = self.bottleneck(x)
+        x     = self.dec3(x, s3)
+        x     = self.dec2(x, s2)
+        x     = self.dec1(x, s1)
+        return torch.sigmoid(self.out(x))
+
+
+# ── loss & metrics ─────────────────────────────────────────────────────────
+
+def dice_loss(pred: torch.Tensor, target: torch.Tensor, smooth: float = 1.0) -> torch.Tensor:
+    """
+    Soft Dice loss for binary segmentation.
+    pred   : (B, 1, H, W) sigmoid output in [0, 1]
+    target : (B, 1, H, W) binary ground truth
+    """
+    pred   = pred.view(-1)
+    target = target.view(-1)
+    intersection = (pred * target).sum()
+    return 1 - (2 * intersection + smooth) / (pred.sum() + target.sum() + smooth)
+
+
+def combined_loss(pred: torch.Tensor, target: torch.Tensor,
+                  dice_w: float = 0.5, bce_w: float = 0.5) -> torch.Tensor:
+    """Weighted Dice + BCE."""
+    bce  = F.binary_cross_entropy(pred, target)
+    dice = dice_loss(pred, target)
+    return dice_w * dice + bce_w * bce
+
+
+def dice_score(pred: torch.Tensor, target: torch.Tensor,
+               threshold: float = 0.5) -> float:
+    """Binary Dice coefficient."""
+    pred_bin = (pred > threshold).float()
+    p = pred_bin.view(-1)
+    t = target.view(-1)
+    intersection = (p * t).sum().item()
+    return (2 * intersection + 1) / (p.sum().item() + t.sum().item() + 1)